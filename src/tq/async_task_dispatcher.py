@@ -0,0 +1,215 @@
+import asyncio
+import collections
+import contextvars
+import functools
+import logging
+import queue
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Type
+from uuid import UUID, uuid4
+
+from tq import bind_function
+from tq.metrics import TaskMetrics
+from tq.redis_task_queue import AsyncRedisTaskQueue
+from tq.task_dispacher import (
+    _NON_BLOCKING_POLICIES,
+    BaseTaskResultStore,
+    OverflowPolicy,
+    Task,
+    TaskDispatcher,
+    TaskResult,
+    TerminateDispatcherLoop,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+# Set while a handler runs, its posts must not wait for room
+_IN_HANDLER = contextvars.ContextVar("in_handler", default=False)
+
+
+class AsyncTaskDispatcher:
+    """
+    Dispatch loop of an AsyncRedisTaskQueue, run by awaiting run() until terminate() is called.
+    Handlers are registered as with TaskDispatcher and called with the task and dispatcher=self,
+    coroutine handlers are awaited, the others run in the default executor.
+    Up to concurrency tasks are handled at a time.
+    Results returned by handlers are re-posted to the queue, or kept in result_store when given.
+    """
+
+    def __init__(
+        self,
+        task_queue: AsyncRedisTaskQueue,
+        result_store: Optional[BaseTaskResultStore] = None,
+        concurrency: int = 1,
+    ) -> None:
+        if concurrency <= 0:
+            raise ValueError(f"Concurrency must be positive, got {concurrency}")
+        self.task_handlers: Dict[Type, List[Callable]] = collections.defaultdict(list)
+        self.task_queue = task_queue
+        self.result_store = result_store
+        self.metrics = TaskMetrics()
+        self._concurrency = concurrency
+        self._is_exit = False
+        # Tasks posted by handlers or the dispatcher itself which did not fit into the queue,
+        # handled before fetching
+        self._own_tasks: Deque[Task] = collections.deque()
+
+    @property
+    def is_exit(self) -> bool:
+        return self._is_exit
+
+    async def stats(self) -> Dict[str, Any]:
+        """See TaskDispatcher.stats"""
+        return {
+            "queue": self.task_queue.name,
+            "depth": await self.task_queue.depth(),
+            "pressure": await self.task_queue.pressure(),
+            "dedup": self.task_queue.dedup_stats,
+            **self.metrics.snapshot(),
+        }
+
+    def register_task_handler_callback(self, task_type: Type, handler_func: Callable):
+        self.task_handlers[task_type].append(handler_func)
+
+    def register_task_handler(self, dispatcher: Any):
+        for handler_func, handling_type_list in TaskDispatcher._get_task_hanlders(
+            type(dispatcher)
+        ):
+            for task_type in handling_type_list:
+                self.task_handlers[task_type].append(
+                    bind_function(handler_func, dispatcher)
+                )
+
+    async def post_task(
+        self,
+        task: Task,
+        priority: Optional[int] = None,
+        queue_name: Optional[str] = None,
+        dedup_key: Optional[str] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> UUID:
+        """
+        See TaskDispatcher.post_task, waiting for room only suspends the calling task.
+        Posts of handlers do not wait for room, as with TaskDispatcher.
+        """
+        own_task_id = task.task_id
+        if not own_task_id:
+            own_task_id = uuid4()
+            setattr(task, "_task_id", own_task_id)
+        if priority is not None:
+            setattr(task, "_priority", priority)
+        if queue_name is not None:
+            setattr(task, "_queue_name", queue_name)
+        if dedup_key is not None:
+            setattr(task, "_dedup_key", dedup_key)
+        setattr(task, "_enqueued_at", time.time())
+        if _IN_HANDLER.get() and overflow not in _NON_BLOCKING_POLICIES:
+            pending_task_id = await self._put_or_keep(task)
+        else:
+            pending_task_id = await self.task_queue.put(
+                task, overflow=overflow, timeout=timeout
+            )
+        task_id = pending_task_id if pending_task_id else own_task_id
+        if task_id == own_task_id:
+            self.metrics.task_enqueued(task)
+        return task_id
+
+    def terminate(self):
+        """Stops run() once the tasks being handled are done"""
+        self._is_exit = True
+
+    async def run(self):
+        """Fetches and dispatches tasks until terminate() is called"""
+        slots = asyncio.Semaphore(self._concurrency)
+        dispatches = set()
+        try:
+            while not self._is_exit:
+                await slots.acquire()
+                if self._is_exit:
+                    break
+                dispatch = asyncio.ensure_future(self._dispatch_next(slots))
+                dispatches.add(dispatch)
+                dispatch.add_done_callback(dispatches.discard)
+        finally:
+            if dispatches:
+                await asyncio.gather(*dispatches, return_exceptions=True)
+        LOGGER.info("Dispatcher terminated")
+
+    async def _dispatch_next(self, slots: asyncio.Semaphore):
+        try:
+            async with self._fetch_task() as task:
+                if task is None:
+                    return
+                if isinstance(task, TerminateDispatcherLoop):
+                    self._is_exit = True
+                    return
+                self.metrics.task_dequeued(task)
+                LOGGER.info(f"Dispatch task: {task}")
+                await self._dispatch_task(task)
+        except Exception:
+            LOGGER.exception("Failed to dispatch task")
+        finally:
+            slots.release()
+
+    @asynccontextmanager
+    async def _fetch_task(self) -> AsyncIterator[Optional[Task]]:
+        try:
+            own_task = self._own_tasks.popleft()
+        except IndexError:
+            async with self.task_queue.fetch_task() as task:
+                yield task
+            return
+        yield own_task
+
+    async def _dispatch_task(self, task: Task):
+        handlers = self.task_handlers.get(type(task), [])
+        results = await asyncio.gather(
+            *[self._run_handler(handler, task) for handler in handlers]
+        )
+        for result in results:
+            if isinstance(result, TaskResult):
+                await self._return_result(result)
+
+    async def _run_handler(self, handler: Callable, task: Task) -> Any:
+        start = time.perf_counter()
+        is_failed = True
+        token = _IN_HANDLER.set(True)
+        try:
+            if asyncio.iscoroutinefunction(getattr(handler, "_binding_fn", handler)):
+                result = await handler(task, dispatcher=self)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    None, functools.partial(handler, task, dispatcher=self)
+                )
+            is_failed = isinstance(result, TaskResult) and result.is_failed
+            return result
+        except Exception:
+            LOGGER.exception(f"Handler {handler} failed on {task}")
+            return None
+        finally:
+            _IN_HANDLER.reset(token)
+            self.metrics.handler_finished(task, time.perf_counter() - start, is_failed)
+
+    async def _return_result(self, task_result: TaskResult):
+        if self.result_store is not None:
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.result_store.store, task_result
+            )
+            return
+
+        token = _IN_HANDLER.set(True)
+        try:
+            await self.post_task(task_result)
+        finally:
+            _IN_HANDLER.reset(token)
+
+    async def _put_or_keep(self, task: Task) -> Optional[UUID]:
+        """See TaskDispatcher._put_or_keep"""
+        try:
+            return await self.task_queue.put(task, overflow=OverflowPolicy.REJECT)
+        except queue.Full:
+            LOGGER.debug(f"Task queue {self.task_queue.name} is full, keeping {task}")
+            self._own_tasks.append(task)
+            return None
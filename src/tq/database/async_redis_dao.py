@@ -0,0 +1,940 @@
+import asyncio
+import math
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
+from uuid import UUID, uuid4
+
+import redis
+import redis.asyncio
+from marshmallow import Schema
+
+from tq.database import redis_scripts
+from tq.database.db import AbstractDao, BaseContext, BaseEntity, async_transactional
+from tq.database.entity_cache import EntityCache
+from tq.database.entity_codec import EntityCodec
+from tq.database.redis_cluster import KeyLayout
+from tq.database.redis_dao import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_LIST_WINDOW,
+    DEFAULT_PURGE_SCAN_COUNT,
+    DEFAULT_SCAN_COUNT,
+    Index,
+    QueuedReply,
+    StorageMode,
+    _blocking_timeouts,
+    _decode_hash,
+    _EntityMapping,
+    _key_id,
+    _rejects_fractional_timeout,
+    _TransactionalContext,
+    _TransactionState,
+    _ttl_millis,
+    _window_bounds,
+    _window_size,
+)
+from tq.database.utils import chunked, from_json, to_json
+
+# https://redis.readthedocs.io/en/stable/examples/asyncio_examples.html
+
+
+class _AsyncTransactionState(_TransactionState):
+    async def end(self):
+        if self.pipe is not None:
+            await self.pipe.reset()
+        self.begin(None)
+
+
+class AsyncRedisDaoContext(_TransactionalContext, BaseContext):
+    """
+    RedisDaoContext on redis.asyncio, its commands are coroutines and its iterations async generators.
+    Transactions behave the same, writes are queued and sent in a single MULTI/EXEC when the outermost
+    async_transactional call returns. Keys are named alike, clusters and key layouts are not supported.
+    """
+
+    shard_hint: Optional[str] = None
+    watches: Optional[Set[str]] = None
+    value_from_callable: bool = True
+    watch_delay: Optional[float] = None
+
+    def __init__(
+        self,
+        db: redis.asyncio.Redis,
+        name_prefix: str,
+        transaction: Optional[_AsyncTransactionState] = None,
+    ):
+        self._db = db
+        self._name_prefix = name_prefix
+        self._transaction = transaction if transaction else _AsyncTransactionState()
+
+    def create_sub_context(self, name_prefix):
+        return AsyncRedisDaoContext(self._db, name_prefix, self._transaction)
+
+    def table(self, name_prefix):
+        return AsyncRedisDaoContext(self._db, name_prefix, self._transaction)
+
+    @property
+    def db(self):
+        return self._db
+
+    async def watch(self, *ids: Optional[Union[UUID, str]]):
+        """See RedisDaoContext.watch"""
+        await self._watchable_pipe().watch(*[self._name(id) for id in ids])
+
+    @property
+    def _client(self) -> Union[redis.asyncio.Redis, redis.asyncio.client.Pipeline]:
+        """Runs commands right away"""
+        pipe = self._watching_pipe
+        return self._db if pipe is None else pipe
+
+    async def _write(self, command: str, *args, **kwargs) -> Any:
+        """Runs a write command, or queues it if in a transaction"""
+        if not self.in_transaction:
+            return await getattr(self._db, command)(*args, **kwargs)
+        pipe = self._queue()
+        getattr(pipe, command)(*args, **kwargs)
+        return self._queued(pipe)
+
+    async def _write_script(
+        self, script: redis_scripts.LuaScript, keys: List[str], args: List[Any]
+    ) -> Any:
+        """Runs a script which writes, or queues it if in a transaction"""
+        if not self.in_transaction:
+            return await script.run_async(self._db, keys, args)
+        pipe = self._queue()
+        await script.run_async(pipe, keys, args)
+        return self._queued(pipe)
+
+    @asynccontextmanager
+    async def _batch(
+        self, transaction: bool = True, bulk: bool = False
+    ) -> AsyncIterator[redis.asyncio.client.Pipeline]:
+        """See RedisDaoContext._batch"""
+        if self._queues_bulk if bulk else self.in_transaction:
+            yield self._queue()
+            return
+
+        async with self._db.pipeline(transaction=transaction) as pipe:
+            yield pipe
+            await pipe.execute()
+
+    async def is_exists(self, id: Optional[Union[UUID, str]]) -> bool:
+        name = self._name(id)
+        if name in self._transaction.writes:
+            return self._transaction.writes[name] is not None
+        return bool(await self._client.exists(name))
+
+    async def set(
+        self, id: Optional[Union[UUID, str]], data: bytes, ttl: Optional[int] = None
+    ) -> Union[UUID, str]:
+        """Sets the key of id, which expires after ttl seconds if given"""
+        id = id if id else uuid4()
+        name = self._name(id)
+        await self._write("set", name, data, ex=ttl)
+        self._written(name, data)
+        return id
+
+    async def create_or_update(
+        self,
+        obj: Dict,
+        id: Optional[Union[UUID, str]] = None,
+        dumps: Callable[[Dict], bytes] = to_json,
+        ttl: Optional[int] = None,
+    ) -> Union[UUID, str]:
+        return await self.set(id if id else uuid4(), dumps(obj), ttl)
+
+    async def bulk_create_or_update(
+        self,
+        items: Iterable[Tuple[Dict, Optional[UUID]]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        dumps: Callable[[Dict], bytes] = to_json,
+        ttl: Optional[int] = None,
+    ) -> List[UUID]:
+        """See RedisDaoContext.bulk_create_or_update"""
+        ids = []
+        for chunk in chunked(items, chunk_size):
+            async with self._batch(transaction=False, bulk=True) as pipe:
+                for obj, chunk_id in chunk:
+                    id = chunk_id if chunk_id else uuid4()
+                    name, data = self._name(id), dumps(obj)
+                    pipe.set(name, data, ex=ttl)
+                    self._written(name, data)
+                    ids.append(id)
+        return ids
+
+    async def get(self, id: Optional[Union[UUID, str]]) -> Optional[bytes]:
+        name = self._name(id)
+        if name in self._transaction.writes:
+            return self._transaction.writes[name]
+        return await self._client.get(name)
+
+    async def get_entity(
+        self,
+        id: Optional[Union[UUID, str]],
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> Optional[Dict]:
+        return loads(await self.get(id))
+
+    async def get_many(
+        self, ids: Iterable[Union[UUID, str]], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> List[Optional[bytes]]:
+        """Fetches the values in order with a single MGET per chunk, None for missing keys"""
+        items: List[Optional[bytes]] = []
+        for chunk in chunked(ids, chunk_size):
+            names = [self._name(id) for id in chunk]
+            unwritten = self._unwritten(names)
+            fetched = (
+                dict(zip(unwritten, await self._client.mget(unwritten)))
+                if unwritten
+                else {}
+            )
+            items.extend(self._with_writes(names, fetched))
+        return items
+
+    async def get_entities(
+        self,
+        ids: Iterable[Union[UUID, str]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> List[Optional[Dict]]:
+        return [loads(item) for item in await self.get_many(ids, chunk_size)]
+
+    async def iterate_key_pages(
+        self, count: int = DEFAULT_SCAN_COUNT
+    ) -> AsyncIterator[List[bytes]]:
+        """Yields the keys under the prefix one SCAN page at a time, count is a hint for the page size"""
+        cursor = None
+        while cursor != 0:
+            cursor, keys = await self._client.scan(
+                cursor or 0, match=self.wildcard, count=count
+            )
+            if keys:
+                yield keys
+
+    async def iterate_all_keys(
+        self, count: int = DEFAULT_SCAN_COUNT
+    ) -> AsyncIterator[UUID]:
+        async for keys in self.iterate_key_pages(count):
+            for key in keys:
+                yield _key_id(key)
+
+    async def iterate_entity_pages(
+        self,
+        count: int = DEFAULT_SCAN_COUNT,
+        hashes: bool = False,
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> AsyncIterator[List[Dict]]:
+        """
+        Yields the entities under the prefix page by page, each page is loaded with a single MGET,
+        or in a single pipeline of HGETALLs if the entities are stored as hashes.
+        """
+        async for keys in self.iterate_key_pages(count):
+            if hashes:
+                fetched = await self._fetch_hashes(keys)
+                yield [data for data in map(_decode_hash, fetched) if data]
+            else:
+                # Keys deleted since the scan, or holding other types, come back as None
+                items = await self._client.mget(keys)
+                yield [data for data in map(loads, items) if data]
+
+    async def iterate_all_entities(
+        self, count: int = DEFAULT_SCAN_COUNT
+    ) -> AsyncIterator[Dict]:
+        async for page in self.iterate_entity_pages(count):
+            for item in page:
+                yield item
+
+    async def _fetch_hashes(
+        self, keys: Sequence[Union[bytes, str]]
+    ) -> List[Dict[bytes, bytes]]:
+        """HGETALL of each key in a single pipeline, missing keys come back empty"""
+        client = self._client
+        if isinstance(client, redis.asyncio.client.Pipeline):
+            # Watched reads go through the watching connection
+            return [await client.hgetall(key) for key in keys]
+        async with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            return await pipe.execute()
+
+    async def delete(self, id: Optional[Union[UUID, str]]):
+        name = self._name(id)
+        await self._write("delete", name)
+        self._written(name, None)
+
+    async def unlink(self, id: Optional[Union[UUID, str]]):
+        """Deletes the key like delete, its memory is freed in the background"""
+        name = self._name(id)
+        await self._write("unlink", name)
+        self._written(name, None)
+
+    async def bulk_delete(
+        self, ids: Iterable[Union[UUID, str]], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Union[int, QueuedReply]:
+        """Deletes the keys with a single command per chunk, returns the number of keys deleted"""
+        queued = self._queues_bulk
+        replies = []
+        for chunk in chunked(ids, chunk_size):
+            names = [self._name(id) for id in chunk]
+            replies.append(
+                await self._write("delete", *names)
+                if queued
+                else await self._db.delete(*names)
+            )
+            for name in names:
+                self._written(name, None)
+        if queued:
+            return QueuedReply.combine(replies, sum)
+        return sum(replies)
+
+    async def list_has(
+        self, id: Optional[Union[UUID, str]], data: Union[str, bytes]
+    ) -> bool:
+        # Stops at the first match
+        return await self._client.lpos(self._name(id), data) is not None
+
+    async def list_find_all(
+        self, id: Optional[Union[UUID, str]], data: Union[str, bytes]
+    ) -> List[int]:
+        return await self._client.lpos(self._name(id), data, count=0)
+
+    async def list_set(
+        self, id: Optional[Union[UUID, str]], index: int, data: Union[str, bytes]
+    ) -> bool:
+        return await self._write("lset", self._name(id), index, data)
+
+    async def list_push(
+        self, id: Optional[Union[UUID, str]], data: Union[str, bytes]
+    ) -> int:
+        return await self._write("lpush", self._name(id), data)
+
+    async def list_push_entity(self, id: Optional[Union[UUID, str]], obj: Dict) -> int:
+        return await self.list_push(id, to_json(obj))
+
+    async def list_pop(self, id: Optional[Union[UUID, str]]) -> Optional[bytes]:
+        return await self._client.lpop(self._name(id))
+
+    async def list_pop_entity(self, id: Optional[Union[UUID, str]]) -> Optional[Dict]:
+        return from_json(await self.list_pop(id))
+
+    async def list_push_unless_claimed(
+        self,
+        id: Optional[Union[UUID, str]],
+        data: Union[str, bytes],
+        claim_id: Optional[Union[UUID, str]],
+        claim: str,
+        ttl: float,
+    ) -> Optional[bytes]:
+        """See RedisDaoContext.list_push_unless_claimed"""
+        return await redis_scripts.PUSH_UNLESS_CLAIMED.run_async(
+            self._db,
+            [self._name(id), self._name(claim_id)],
+            [data, claim, _ttl_millis(ttl)],
+        )
+
+    async def delete_if_equals(
+        self, id: Optional[Union[UUID, str]], value: str
+    ) -> bool:
+        return bool(
+            await redis_scripts.DELETE_IF_EQUALS.run_async(
+                self._db, [self._name(id)], [value]
+            )
+        )
+
+    async def list_move_many(
+        self,
+        id: Optional[Union[UUID, str]],
+        destination_id: Optional[Union[UUID, str]],
+        count: int,
+    ) -> List[bytes]:
+        """See RedisDaoContext.list_move_many"""
+        return await redis_scripts.MOVE_LIST_ITEMS.run_async(
+            self._db, [self._name(id), self._name(destination_id)], [count]
+        )
+
+    async def list_pop_last(self, id: Optional[Union[UUID, str]]) -> Optional[bytes]:
+        return await self._client.rpop(self._name(id))
+
+    async def list_blocking_pop_last(
+        self, ids: List[Optional[Union[UUID, str]]], timeout: float
+    ) -> Optional[Tuple[int, bytes]]:
+        """See RedisDaoContext.list_blocking_pop_last, only the calling task waits"""
+        names = [self._name(id) for id in ids]
+        result = await self._blocking("brpop", names, timeout=timeout)
+        if result is None:
+            return None
+        name, item = result
+        return names.index(name.decode()), item
+
+    async def get_list_length(self, id: Optional[Union[UUID, str]]) -> int:
+        return await self._client.llen(self._name(id))
+
+    async def list_replace(
+        self, id: Optional[Union[UUID, str]], data: Union[str, bytes], seconds: int
+    ):
+        """Replaces the list with a single item that expires after the given seconds"""
+        name = self._name(id)
+        async with self._batch() as pipe:
+            pipe.delete(name)
+            pipe.rpush(name, data)
+            pipe.expire(name, seconds)
+
+    async def list_get(
+        self, id: Optional[Union[UUID, str]], index: int
+    ) -> Optional[bytes]:
+        return await self._client.lindex(self._name(id), index)
+
+    async def list_blocking_peek_last(
+        self, id: Optional[Union[UUID, str]], timeout: float
+    ) -> Optional[bytes]:
+        """Waits for the list to have an item and returns the last one, without removing it"""
+        name = self._name(id)
+        return await self._blocking("brpoplpush", name, name, timeout=timeout)
+
+    async def _blocking(self, command: str, *args, timeout: float) -> Any:
+        """See RedisDaoContext._blocking"""
+        *fractional, whole = _blocking_timeouts(self._db, timeout)
+        if fractional:
+            try:
+                return await getattr(self._client, command)(
+                    *args, timeout=fractional[0]
+                )
+            except redis.ResponseError as e:
+                if not _rejects_fractional_timeout(self._db, e):
+                    raise
+        return await getattr(self._client, command)(*args, timeout=whole)
+
+    async def get_list_lengths(
+        self, ids: List[Optional[Union[UUID, str]]]
+    ) -> List[int]:
+        async with self._db.pipeline(transaction=False) as pipe:
+            for id in ids:
+                pipe.llen(self._name(id))
+            return await pipe.execute()
+
+    async def iter_all_from_list(
+        self,
+        id: Optional[Union[UUID, str]],
+        fetch_bucket_size: Optional[int] = None,
+        reverse: bool = False,
+        prefetch: bool = True,
+    ) -> AsyncIterator[bytes]:
+        """
+        See RedisDaoContext.iter_all_from_list, with prefetch the next window is fetched
+        by another task while the current one is consumed.
+        """
+        name = self._name(id)
+        client = self._client
+        size = fetch_bucket_size if fetch_bucket_size else DEFAULT_LIST_WINDOW
+        window = await self._list_window(client, name, 0, size, reverse)
+        # Watched reads go through the watching connection, which runs a command at a time
+        prefetch = prefetch and not isinstance(client, redis.asyncio.client.Pipeline)
+        offset, item_bytes = 0, 0
+        pending: Optional[asyncio.Future] = None
+        try:
+            while window:
+                offset += len(window)
+                if len(window) < size:
+                    args = None
+                else:
+                    if not fetch_bucket_size:
+                        item_bytes += sum(map(len, window))
+                        size = _window_size(item_bytes / offset)
+                    args = (client, name, offset, size, reverse)
+                    if prefetch:
+                        pending = asyncio.ensure_future(self._list_window(*args))
+
+                for item in window:
+                    yield item
+
+                if args is None:
+                    return
+                if pending is None:
+                    window = await self._list_window(*args)
+                else:
+                    window = await pending
+                pending = None
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    @staticmethod
+    async def _list_window(
+        client: Union[redis.asyncio.Redis, redis.asyncio.client.Pipeline],
+        name: str,
+        offset: int,
+        size: int,
+        reverse: bool,
+    ) -> List[bytes]:
+        items = await client.lrange(name, *_window_bounds(offset, size, reverse))
+        if not reverse:
+            items.reverse()
+        return items
+
+    async def iter_all_entities_from_list(
+        self,
+        id: Optional[Union[UUID, str]],
+        fetch_bucket_size: Optional[int] = None,
+        reverse: bool = False,
+        prefetch: bool = True,
+    ) -> AsyncIterator[Any]:
+        """Like iter_all_from_list, each item is only decoded once it is reached"""
+        async for item in self.iter_all_from_list(
+            id, fetch_bucket_size, reverse, prefetch
+        ):
+            yield from_json(item)
+
+    async def remove_from_list(self, id: Optional[Union[UUID, str]], obj: Any):
+        return await self._write("lrem", self._name(id), 1, to_json(obj))
+
+    async def remove_from_list_by_id(
+        self, id: Optional[Union[UUID, str]], index: int
+    ) -> Union[int, QueuedReply]:
+        return await self.bulk_remove_from_list_by_id(id, [index])
+
+    async def bulk_remove_from_list_by_id(
+        self, id: Optional[Union[UUID, str]], indices: List[int]
+    ) -> Union[int, QueuedReply]:
+        """Removes the items at the indices in a single script, returns the number of items removed"""
+        placeholder = str(uuid4())
+        return await self._write_script(
+            redis_scripts.REMOVE_LIST_INDICES, [self._name(id)], [placeholder, *indices]
+        )
+
+    async def get_hash(
+        self, id: Optional[Union[UUID, str]], key: str
+    ) -> Optional[bytes]:
+        return await self._client.hget(self._name(id), key)
+
+    async def set_hash(
+        self, id: Optional[Union[UUID, str]], key: str, value: bytes
+    ) -> int:
+        return await self._write("hset", self._name(id), key, value)
+
+    async def delete_hash(self, id: Optional[Union[UUID, str]], key: str) -> int:
+        return await self._write("hdel", self._name(id), key)
+
+    async def has_hash_key(self, id: Optional[Union[UUID, str]], key: str) -> bool:
+        return await self._client.hexists(self._name(id), key)
+
+    async def get_hash_entity(
+        self, id: Optional[Union[UUID, str]], key: str
+    ) -> Optional[Any]:
+        return from_json(await self.get_hash(id, key))
+
+    async def set_hash_entity(
+        self, id: Optional[Union[UUID, str]], key: str, value: Any
+    ) -> int:
+        return await self.set_hash(id, key, to_json(value))
+
+    async def iterate_hash_keys(
+        self, id: Optional[Union[UUID, str]]
+    ) -> AsyncIterator[str]:
+        for key in await self._client.hkeys(self._name(id)):
+            yield key.decode()
+
+    async def set_hash_fields(
+        self, id: Optional[Union[UUID, str]], fields: Dict[str, Any]
+    ) -> Union[int, QueuedReply]:
+        """Sets the fields with a single HSET, each value encoded as JSON"""
+        return await self._write(
+            "hset",
+            self._name(id),
+            mapping={key: to_json(value) for key, value in fields.items()},
+        )
+
+    async def get_hash_fields(
+        self, id: Optional[Union[UUID, str]], fields: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """Decodes the given fields of a hash, or all of them, None if none of them is set"""
+        name = self._name(id)
+        if fields is None:
+            return _decode_hash(await self._client.hgetall(name))
+        values = await self._client.hmget(name, fields)
+        return _decode_hash(
+            {field: value for field, value in zip(fields, values) if value is not None}
+        )
+
+    async def increment_hash_field(
+        self, id: Optional[Union[UUID, str]], field: str, amount: Union[int, float] = 1
+    ) -> Union[int, float, QueuedReply]:
+        """Adds amount to a numeric field atomically, returns the new value"""
+        name = self._name(id)
+        if isinstance(amount, float):
+            return await self._write("hincrbyfloat", name, field, amount)
+        return await self._write("hincrby", name, field, amount)
+
+    async def replace_hash_entity(
+        self,
+        obj: Dict,
+        id: Optional[Union[UUID, str]] = None,
+        ttl: Optional[int] = None,
+    ) -> Union[UUID, str]:
+        """See RedisDaoContext.replace_hash_entity"""
+        id = id if id else uuid4()
+        async with self._batch() as pipe:
+            self._replace_hash(pipe, self._name(id), obj, ttl)
+        return id
+
+    async def bulk_replace_hash_entities(
+        self,
+        items: Iterable[Tuple[Dict, Optional[UUID]]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        ttl: Optional[int] = None,
+    ) -> List[UUID]:
+        """See RedisDaoContext.bulk_replace_hash_entities"""
+        ids = []
+        for chunk in chunked(items, chunk_size):
+            async with self._batch(bulk=True) as pipe:
+                for obj, chunk_id in chunk:
+                    id = chunk_id if chunk_id else uuid4()
+                    self._replace_hash(pipe, self._name(id), obj, ttl)
+                    ids.append(id)
+        return ids
+
+    async def get_hash_entities(
+        self, ids: Iterable[Union[UUID, str]], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> List[Optional[Dict]]:
+        """Decodes the hashes in order with a pipeline per chunk, None for missing keys"""
+        items: List[Optional[Dict]] = []
+        for chunk in chunked(ids, chunk_size):
+            names = [self._name(id) for id in chunk]
+            items.extend(map(_decode_hash, await self._fetch_hashes(names)))
+        return items
+
+    async def iterate_purge_pages(
+        self,
+        count: int = DEFAULT_PURGE_SCAN_COUNT,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> AsyncIterator[Tuple[List[bytes], int]]:
+        """See RedisDaoContext.iterate_purge_pages"""
+        async for keys in self.iterate_key_pages(count):
+            async with self._db.pipeline(transaction=False) as pipe:
+                for chunk in chunked(keys, chunk_size):
+                    pipe.unlink(*chunk)
+                removed = sum(await pipe.execute())
+            yield keys, removed
+
+    async def purge(
+        self,
+        count: int = DEFAULT_PURGE_SCAN_COUNT,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Unlinks all keys under the prefix, returns the number removed"""
+        purged = 0
+        async for _, removed in self.iterate_purge_pages(count, chunk_size):
+            purged += removed
+        return purged
+
+    async def add_to_set(self, id: Optional[Union[UUID, str]], obj: Any):
+        await self._write("sadd", self._name(id), to_json(obj))
+
+    async def iterate_all_entities_from_set(
+        self, id: Optional[Union[UUID, str]]
+    ) -> AsyncIterator[Any]:
+        for item in await self._client.smembers(self._name(id)):
+            yield from_json(item)
+
+    async def get_set_length(self, id: Optional[Union[UUID, str]]):
+        return await self._client.scard(self._name(id))
+
+    async def add_members_to_set(
+        self, id: Optional[Union[UUID, str]], members: List[str]
+    ) -> Union[int, QueuedReply]:
+        return await self._write("sadd", self._name(id), *members)
+
+    async def remove_members_from_set(
+        self, id: Optional[Union[UUID, str]], members: List[str]
+    ) -> Union[int, QueuedReply]:
+        return await self._write("srem", self._name(id), *members)
+
+    async def iterate_set_member_pages(
+        self, id: Optional[Union[UUID, str]], count: int = DEFAULT_SCAN_COUNT
+    ) -> AsyncIterator[List[str]]:
+        """Yields the members one SSCAN page at a time, a member may be yielded more than once"""
+        name = self._name(id)
+        cursor = None
+        while cursor != 0:
+            cursor, members = await self._client.sscan(name, cursor or 0, count=count)
+            if members:
+                yield [member.decode() for member in members]
+
+    async def add_to_sorted_set(
+        self, id: Optional[Union[UUID, str]], scores: Dict[str, float]
+    ) -> Union[int, QueuedReply]:
+        return await self._write("zadd", self._name(id), scores)
+
+    async def remove_from_sorted_set(
+        self, id: Optional[Union[UUID, str]], members: List[str]
+    ) -> Union[int, QueuedReply]:
+        return await self._write("zrem", self._name(id), *members)
+
+    async def iterate_sorted_set_pages(
+        self,
+        id: Optional[Union[UUID, str]],
+        min_score: float = -math.inf,
+        max_score: float = math.inf,
+        count: int = DEFAULT_SCAN_COUNT,
+    ) -> AsyncIterator[List[str]]:
+        """Yields the members scored within the bounds in ascending order, count at a time"""
+        name = self._name(id)
+        offset = 0
+        while True:
+            members = await self._client.zrangebyscore(
+                name, min_score, max_score, start=offset, num=count
+            )
+            if members:
+                yield [member.decode() for member in members]
+            if len(members) < count:
+                return
+            offset += count
+
+    async def set_expiration_time(self, id: Optional[Union[UUID, str]], seconds: int):
+        await self._write("expire", self._name(id), seconds)
+
+    async def _run_transaction(
+        self, fn: Callable[[], Awaitable[Any]], is_subcontext: bool = False
+    ) -> Any:
+        if is_subcontext or self.in_transaction:
+            self._transaction.depth += 1
+            try:
+                return await fn()
+            finally:
+                self._transaction.depth -= 1
+
+        async with self._db.pipeline(shard_hint=self.shard_hint) as pipe:
+            while True:
+                self._transaction.begin(pipe)
+                try:
+                    if self.watches:
+                        await self.watch(*self.watches)
+                    result = await fn()
+                    replies = await pipe.execute()
+                    for callback in self._transaction.commit_callbacks:
+                        callback()
+                    return self._result(result, replies)
+                except redis.WatchError:
+                    if self.watch_delay is not None and self.watch_delay > 0:
+                        await asyncio.sleep(self.watch_delay)
+                finally:
+                    await self._transaction.end()
+
+
+class AsyncBaseRedisDao(_EntityMapping, AbstractDao):
+    """
+    BaseRedisDao for asyncio, its methods are coroutines and use async_transactional.
+    Storage modes, codecs and default_ttl work the same and entities are stored alike,
+    so both DAOs can share a key prefix.
+
+    Caches, indexes, max_entries, key layouts and clusters are not supported. The options of BaseRedisDao
+    for them raise a ValueError when given, as does max_entries when set by a subclass,
+    instead of the DAO running without them.
+    """
+
+    # Seconds an entity is kept after its last write
+    default_ttl: Optional[int] = None
+    # Not supported, see the class docstring
+    max_entries: Optional[int] = None
+
+    def __init__(
+        self,
+        db_pool: redis.asyncio.ConnectionPool,
+        schema: Schema,
+        key_prefix: str = "",
+        storage: StorageMode = StorageMode.JSON,
+        codec: Optional[EntityCodec] = None,
+        cache: Optional[EntityCache] = None,
+        indexes: Sequence[Index] = (),
+        key_layout: Optional[KeyLayout] = None,
+    ):
+        unsupported = [
+            option
+            for option, value in (
+                ("cache", cache is not None),
+                ("indexes", bool(indexes)),
+                ("key_layout", key_layout not in (None, KeyLayout.PLAIN)),
+                ("max_entries", self.max_entries is not None),
+                ("clusters", isinstance(db_pool, redis.asyncio.RedisCluster)),
+            )
+            if value
+        ]
+        if unsupported:
+            raise ValueError(
+                f"{type(self).__name__} does not support {', '.join(unsupported)}"
+            )
+        super().__init__(schema, key_prefix)
+        self._db = redis.asyncio.Redis(connection_pool=db_pool)
+        self._storage = storage
+        self._codec = codec
+        self._dumps = codec.dumps if codec else to_json
+        self._loads = codec.loads if codec else from_json
+
+    @async_transactional
+    async def create_or_update(
+        self, obj: BaseEntity, ctx: AsyncRedisDaoContext
+    ) -> UUID:
+        data = self._to_dict(obj)
+        id = obj.id if obj.id else uuid4()
+        if self._storage == StorageMode.HASH:
+            await ctx.replace_hash_entity(data, id, self.default_ttl)
+        else:
+            await ctx.create_or_update(data, id, self._dumps, self.default_ttl)
+        return id
+
+    @async_transactional
+    async def bulk_create_or_update(
+        self,
+        objs: Iterable[BaseEntity],
+        ctx: AsyncRedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> List[UUID]:
+        items = ((self._to_dict(obj), obj.id) for obj in objs)
+        with ctx.chunks_apart():
+            if self._storage == StorageMode.HASH:
+                return await ctx.bulk_replace_hash_entities(
+                    items, chunk_size, self.default_ttl
+                )
+            return await ctx.bulk_create_or_update(
+                items, chunk_size, self._dumps, self.default_ttl
+            )
+
+    @async_transactional
+    async def get_entity(
+        self, id: Optional[Union[UUID, str]], ctx: AsyncRedisDaoContext
+    ) -> Optional[BaseEntity]:
+        if self._storage == StorageMode.HASH:
+            data = await ctx.get_hash_fields(id)
+        else:
+            data = await ctx.get_entity(id, self._loads)
+        return self._from_dict(data) if data else None
+
+    @async_transactional
+    async def get_fields(
+        self, id: Optional[Union[UUID, str]], *fields: str, ctx: AsyncRedisDaoContext
+    ) -> Optional[Dict[str, Any]]:
+        """Decodes only the given fields of an entity, None if it does not exist"""
+        if self._storage == StorageMode.HASH:
+            data = await ctx.get_hash_fields(id, list(fields))
+        else:
+            data = await ctx.get_entity(id, self._loads)
+        if data is None:
+            return None
+        return {
+            field: None if data.get(field) is None else self._decode_field(field, data)
+            for field in fields
+        }
+
+    @async_transactional
+    async def update_fields(
+        self, id: Optional[Union[UUID, str]], ctx: AsyncRedisDaoContext, **changes: Any
+    ):
+        """Sets some fields of an entity stored as a hash, the others are left as they are"""
+        self._check_fields(changes)
+        await ctx.set_hash_fields(id, changes)
+        await self._expire(id, ctx)
+
+    @async_transactional
+    async def increment_field(
+        self,
+        id: Optional[Union[UUID, str]],
+        field: str,
+        ctx: AsyncRedisDaoContext,
+        amount: Union[int, float] = 1,
+    ) -> Union[int, float]:
+        """Adds amount to a numeric field of an entity stored as a hash, returns the new value"""
+        self._check_fields([field])
+        # Replies queued in an outer transaction are resolved by it
+        value = await ctx.increment_hash_field(id, field, amount)
+        await self._expire(id, ctx)
+        return cast(Union[int, float], value)
+
+    @async_transactional
+    async def get_many(
+        self,
+        ids: Iterable[Union[UUID, str]],
+        ctx: AsyncRedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> List[Optional[BaseEntity]]:
+        """Loads the entities in the order of ids, None for missing ones"""
+        if self._storage == StorageMode.HASH:
+            items = await ctx.get_hash_entities(ids, chunk_size)
+        else:
+            items = await ctx.get_entities(ids, chunk_size, self._loads)
+        return self._load_many(items)
+
+    @async_transactional
+    async def get_all(
+        self, ctx: AsyncRedisDaoContext, count: int = DEFAULT_SCAN_COUNT
+    ) -> List[BaseEntity]:
+        return [entity async for entity in self.iterate_all(ctx=ctx, count=count)]
+
+    @async_transactional
+    async def iterate_all(
+        self, ctx: AsyncRedisDaoContext, count: int = DEFAULT_SCAN_COUNT
+    ) -> AsyncIterator[BaseEntity]:
+        """Streams the entities, decoding them a SCAN page at a time"""
+        async for page in ctx.iterate_entity_pages(
+            count, hashes=self._storage == StorageMode.HASH, loads=self._loads
+        ):
+            for entity in self._load_all(page):
+                yield entity
+
+    @async_transactional
+    async def iterate_all_keys(self, ctx: AsyncRedisDaoContext) -> AsyncIterator[UUID]:
+        async for key in ctx.iterate_all_keys():
+            yield key
+
+    @async_transactional
+    async def delete(self, id: Optional[Union[UUID, str]], ctx: AsyncRedisDaoContext):
+        await ctx.delete(id)
+
+    @async_transactional
+    async def bulk_delete(
+        self,
+        ids: Iterable[Union[UUID, str]],
+        ctx: AsyncRedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        # Replies queued in an outer transaction are resolved by it
+        with ctx.chunks_apart():
+            return cast(int, await ctx.bulk_delete(ids, chunk_size))
+
+    @async_transactional
+    async def purge(
+        self,
+        ctx: AsyncRedisDaoContext,
+        count: int = DEFAULT_PURGE_SCAN_COUNT,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Removes all entities, returns the number removed"""
+        return await ctx.purge(count, chunk_size)
+
+    async def close(self):
+        """Closes the connections of the client, the pool is left to its owner"""
+        await self._db.close()
+
+    async def _expire(self, id: Optional[Union[UUID, str]], ctx: AsyncRedisDaoContext):
+        """Restarts the default_ttl of an entity written field by field"""
+        if self.default_ttl:
+            await ctx.set_expiration_time(id, self.default_ttl)
+
+    def _tagged(self, value: Any) -> str:
+        return str(value)
+
+    def _create_context(self, ctx: Optional[BaseContext] = None) -> BaseContext:
+        if ctx is not None:
+            return ctx.create_sub_context(self._key_prefix)
+        return AsyncRedisDaoContext(self._db, self._key_prefix)
@@ -0,0 +1,127 @@
+import hashlib
+import math
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+import redis
+
+DEFAULT_BLOOM_CAPACITY = 1000000
+DEFAULT_BLOOM_ERROR_RATE = 0.01
+
+
+class BloomFilter:
+    """
+    Set membership with false positives but no false negatives, held in process.
+    Sized for capacity values at error_rate false positives, more values raise the rate.
+    Values cannot be removed, removed ones only show up as false positives.
+
+    With a key the bits are shared through a Redis bitmap, a plain string set with SETBIT,
+    so RedisBloom is not needed. might_contain reads the bits of values not set in process with GETBIT,
+    so values added by other processes are seen as soon as they are published.
+    Without a key only the values added in process are known.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_BLOOM_CAPACITY,
+        error_rate: float = DEFAULT_BLOOM_ERROR_RATE,
+        key: Optional[str] = None,
+    ) -> None:
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("Capacity has to be positive and error_rate within (0, 1)")
+        self._size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self._hash_count = max(1, round(self._size / capacity * math.log(2)))
+        self._bits = bytearray(math.ceil(self._size / 8))
+        self._key = key
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        """Number of bits"""
+        return self._size
+
+    @property
+    def hash_count(self) -> int:
+        return self._hash_count
+
+    @property
+    def key(self) -> Optional[str]:
+        return self._key
+
+    def __contains__(self, value: Hashable) -> bool:
+        bits = self._bits
+        return all(
+            bits[offset >> 3] & (0x80 >> (offset & 7)) for offset in self.offsets(value)
+        )
+
+    def offsets(self, value: Hashable) -> List[int]:
+        """Bits of value, numbered as SETBIT does"""
+        digest = hashlib.blake2b(str(value).encode(), digest_size=16).digest()
+        # Double hashing, https://www.eecs.harvard.edu/~michaelm/postscripts/rsa2008.pdf
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self._size for i in range(self._hash_count)]
+
+    def add(self, value: Hashable) -> List[int]:
+        """Adds value, returns its bits for them to be set in the bitmap"""
+        offsets = self.offsets(value)
+        self._set(offsets)
+        return offsets
+
+    def might_contain(self, client: redis.Redis, value: Hashable) -> bool:
+        """
+        Whether value may have been added, in process or to the bitmap by any process.
+        The bits of a value not set in process are read with a GETBIT each in a single round trip,
+        and kept once they are all set.
+        """
+        if value in self:
+            return True
+        if self._key is None:
+            return False
+        offsets = self.offsets(value)
+        with client.pipeline(transaction=False) as pipe:
+            for offset in offsets:
+                pipe.getbit(self._key, offset)
+            if not all(pipe.execute()):
+                return False
+        self._set(offsets)
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._bits = bytearray(len(self._bits))
+
+    def _set(self, offsets: List[int]):
+        with self._lock:
+            for offset in offsets:
+                self._bits[offset >> 3] |= 0x80 >> (offset & 7)
+
+    def publish(self, client: redis.Redis, offsets: List[int]):
+        """Sets the bits in the bitmap of the key, if there is one, in a single round trip"""
+        if self._key is None or not offsets:
+            return
+        with client.pipeline(transaction=False) as pipe:
+            for offset in offsets:
+                pipe.setbit(self._key, offset, 1)
+            pipe.execute()
+
+    def refresh(self, client: redis.Redis):
+        """Merges all the bits of the bitmap, to have them in process, it is read as a whole"""
+        if self._key is None:
+            return
+        bitmap = client.get(self._key) or b""
+        with self._lock:
+            merged = int.from_bytes(self._bits, "big") | int.from_bytes(
+                bitmap[: len(self._bits)].ljust(len(self._bits), b"\0"), "big"
+            )
+            self._bits = bytearray(merged.to_bytes(len(self._bits), "big"))
+
+    def stats(self) -> Dict[str, Any]:
+        set_bits = bin(int.from_bytes(self._bits, "big")).count("1")
+        return {
+            "size": self._size,
+            "hash_count": self._hash_count,
+            "set_bits": set_bits,
+            # Chance of a false positive at the current fill
+            "error_rate": (set_bits / self._size) ** self._hash_count,
+        }
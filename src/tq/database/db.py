@@ -1,9 +1,18 @@
 import abc
-import tempfile
+import inspect
 from dataclasses import dataclass
 from functools import wraps
-from io import IOBase
-from typing import Any, Callable, Iterable, Iterator, List, Optional, Type, Union
+from typing import (
+    IO,
+    Any,
+    Callable,
+    ContextManager,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 from uuid import UUID
 
 from dataclasses_json import DataClassJsonMixin
@@ -28,23 +37,52 @@ def transactional(fn: Callable) -> Callable:
     @wraps(fn)
     def tansaction_wrapper(*args, **kwargs):
         obj_self = args[0]
-        ctx: BaseContext = obj_self._create_context(kwargs.get("ctx"))
-
-        if "ctx" in kwargs:
-            del kwargs["ctx"]
+        parent_ctx: Optional[BaseContext] = kwargs.pop("ctx", None)
+        ctx: BaseContext = obj_self._create_context(parent_ctx)
 
+        # Calls made with a context join its transaction
         return ctx._run_transaction(
             lambda: fn(obj_self, *args[1:], ctx=ctx, **kwargs),
-            is_subcontext=kwargs.get("ctx", None) is None,
+            is_subcontext=parent_ctx is not None,
         )
 
     return tansaction_wrapper
 
 
+def async_transactional(fn: Callable) -> Callable:
+    """
+    transactional for coroutine methods of async DAOs, the transaction is awaited.
+    Async generator methods get a context without a transaction of their own, they join the given one.
+    """
+    if inspect.isasyncgenfunction(fn):
+
+        @wraps(fn)
+        async def generator_wrapper(*args, **kwargs):
+            obj_self = args[0]
+            ctx = obj_self._create_context(kwargs.pop("ctx", None))
+            async for item in fn(obj_self, *args[1:], ctx=ctx, **kwargs):
+                yield item
+
+        return generator_wrapper
+
+    @wraps(fn)
+    async def transaction_wrapper(*args, **kwargs):
+        obj_self = args[0]
+        parent_ctx: Optional[BaseContext] = kwargs.pop("ctx", None)
+        ctx: BaseContext = obj_self._create_context(parent_ctx)
+
+        return await ctx._run_transaction(
+            lambda: fn(obj_self, *args[1:], ctx=ctx, **kwargs),
+            is_subcontext=parent_ctx is not None,
+        )
+
+    return transaction_wrapper
+
+
 class AbstractDao(abc.ABC):
-    def __init__(self, schema: Type[Schema], key_prefix: str = ""):
+    def __init__(self, schema: Schema, key_prefix: str = ""):
         self._key_prefix: str = key_prefix
-        self._schema: Type[Schema] = schema
+        self._schema: Schema = schema
 
     @abc.abstractmethod
     def create_or_update(self, obj: BaseEntity, *args, **kwargs) -> UUID:
@@ -57,7 +95,20 @@ class AbstractDao(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def get_entity(self, id: Optional[Union[UUID, str]], *args, **kwargs) -> BaseEntity:
+    def bulk_delete(self, ids: Iterable[Union[UUID, str]], *args, **kwargs) -> int:
+        pass
+
+    @abc.abstractmethod
+    def get_entity(
+        self, id: Optional[Union[UUID, str]], *args, **kwargs
+    ) -> Optional[BaseEntity]:
+        pass
+
+    @abc.abstractmethod
+    def get_many(
+        self, ids: Iterable[Union[UUID, str]], *args, **kwargs
+    ) -> List[Optional[BaseEntity]]:
+        """Returns the entities in the order of ids, None where an entity does not exist"""
         pass
 
     @abc.abstractmethod
@@ -95,7 +146,7 @@ class AbstractFsDao(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def load(self, filename: str) -> bytes:
+    def load(self, filename: str) -> Optional[bytes]:
         pass
 
     @abc.abstractmethod
@@ -119,11 +170,9 @@ class AbstractFsDao(abc.ABC):
         pass
 
     @abc.abstractmethod
-    def open(self, filename: str, mode: str = "rb") -> IOBase:
+    def open(self, filename: str, mode: str = "rb") -> ContextManager[IO]:
         pass
 
     @abc.abstractmethod
-    def as_tempfile(
-        self, file_id: str
-    ) -> Union[tempfile._TemporaryFileWrapper, tempfile.SpooledTemporaryFile]:
+    def as_tempfile(self, file_id: str, **kwargs: Any) -> ContextManager[IO[bytes]]:
         pass
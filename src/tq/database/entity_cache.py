@@ -0,0 +1,100 @@
+import collections
+import copy
+import threading
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+DEFAULT_CACHE_CAPACITY = 10000
+DEFAULT_CACHE_TTL = 60.0
+
+
+class EntityCache:
+    """
+    LRU of decoded entities, entries expire after ttl seconds.
+    Entities are copied shallowly in and out, so callers may set their fields,
+    nested values are shared though and should not be changed in place.
+
+    Readers take a generation before loading an entity and pass it to put, an entity
+    invalidated since then is not cached, it may be older than the write which invalidated it.
+    """
+
+    def __init__(
+        self, capacity: int = DEFAULT_CACHE_CAPACITY, ttl: float = DEFAULT_CACHE_TTL
+    ) -> None:
+        self._capacity = capacity
+        self._ttl = ttl
+        self._entries: "collections.OrderedDict[str, Tuple[Any, float]]" = (
+            collections.OrderedDict()
+        )
+        self._counter = collections.Counter(hits=0, misses=0, evictions=0)
+        self._lock = threading.Lock()
+        # Generation of the last invalidation of each key, the oldest are forgotten beyond capacity
+        self._generation = 0
+        self._invalidations: "collections.OrderedDict[str, int]" = (
+            collections.OrderedDict()
+        )
+        # Generation up to which the invalidations of every key count as seen
+        self._forgotten_generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Returns whether the key was cached, along with the entity"""
+        key = str(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self._counter["misses"] += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self._counter["hits"] += 1
+            return True, copy.copy(entry[0])
+
+    def generation(self) -> int:
+        """Generation to pass to put for an entity about to be loaded"""
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Hashable, entity: Any, generation: Optional[int] = None):
+        """Caches the entity, unless its key was invalidated after generation"""
+        key = str(key)
+        with self._lock:
+            if generation is not None and (
+                generation < self._forgotten_generation
+                or generation < self._invalidations.get(key, 0)
+            ):
+                return
+            self._entries[key] = (copy.copy(entity), time.monotonic() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+                self._counter["evictions"] += 1
+
+    def invalidate(self, key: Hashable):
+        key = str(key)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._generation += 1
+            self._invalidations[key] = self._generation
+            self._invalidations.move_to_end(key)
+            while len(self._invalidations) > self._capacity:
+                _, forgotten = self._invalidations.popitem(last=False)
+                self._forgotten_generation = forgotten
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+            self._invalidations.clear()
+            self._forgotten_generation = self._generation
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counter["hits"] + self._counter["misses"]
+            return {
+                **self._counter,
+                "size": len(self._entries),
+                "hit_ratio": self._counter["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,273 @@
+import dataclasses
+import datetime
+import enum
+import functools
+import json
+import typing
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    cast,
+)
+from uuid import UUID
+
+from tq.database.utils import CustomJSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None  # type: ignore[assignment]
+
+E = TypeVar("E")
+_NONE_TYPE = type(None)
+
+# Conversion of a non-None value, None where values are taken as they are
+_Convert = Optional[Callable[[Any], Any]]
+
+JSON = "json"
+ORJSON = "orjson"
+MSGPACK = "msgpack"
+DEFAULT_BACKEND = ORJSON if orjson is not None else JSON
+
+
+def _default(obj: Any) -> Any:
+    """Values the compiled conversions do not know about, like fields typed as Any"""
+    return CustomJSONEncoder().default(obj)
+
+
+def _backend(name: str) -> Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]:
+    if name == JSON:
+        return (
+            lambda data: json.dumps(data, cls=CustomJSONEncoder).encode(),
+            json.loads,
+        )
+    if name == ORJSON:
+        if orjson is None:
+            raise ImportError("orjson is not installed, see the orjson extra")
+        options = (
+            orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS
+            | orjson.OPT_NON_STR_KEYS
+        )
+        return lambda data: orjson.dumps(data, default=_default, option=options), (
+            orjson.loads
+        )
+    if name == MSGPACK:
+        if msgpack is None:
+            raise ImportError("msgpack is not installed, see the msgpack extra")
+        return (
+            lambda data: msgpack.packb(data, default=_default, use_bin_type=True),
+            lambda data: msgpack.unpackb(data, raw=False),
+        )
+    raise ValueError(f"Unknown codec backend {name}")
+
+
+class EntityCodec(Generic[E]):
+    """
+    Converts the entities of a dataclass to and from dicts and bytes without marshmallow and dataclasses_json.
+    The conversion of each field is compiled once from its type hint, UUIDs, datetimes and Enums are
+    encoded as CustomJSONEncoder does and nested dataclasses, lists, dicts and Optionals are followed.
+    Bytes are JSON by default, written with orjson if it is installed. Entities stored with the msgpack
+    backend can only be read with it.
+    """
+
+    def __init__(self, cls: Type[E], backend: str = DEFAULT_BACKEND) -> None:
+        self._cls = cls
+        self._backend = backend
+        self._dumps, self._loads = _backend(backend)
+        hints = typing.get_type_hints(cls)
+        fields = [
+            field.name for field in dataclasses.fields(cast(Any, cls)) if field.init
+        ]
+        self._json_encoders = [(name, _encoder(hints[name], True)) for name in fields]
+        self._native_encoders = [
+            (name, _encoder(hints[name], False)) for name in fields
+        ]
+        self._decoders = [(name, _decoder(hints[name])) for name in fields]
+        self._field_decoders = dict(self._decoders)
+
+    @property
+    def entity_class(self) -> Type[E]:
+        return self._cls
+
+    @property
+    def backend(self) -> str:
+        return self._backend
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._field_decoders)
+
+    def to_dict(self, obj: E, encode_json: bool = True) -> Dict[str, Any]:
+        """
+        Fields of obj as JSON compatible values, or without encode_json UUIDs and datetimes are kept,
+        as a database driver like pymongo takes them.
+        """
+        data = {}
+        for name, encode in (
+            self._json_encoders if encode_json else self._native_encoders
+        ):
+            value = getattr(obj, name)
+            data[name] = value if encode is None or value is None else encode(value)
+        return data
+
+    def from_dict(self, data: Dict[str, Any]) -> E:
+        """Builds an entity of the fields in data, the missing ones get their defaults"""
+        kwargs = {}
+        for name, decode in self._decoders:
+            if name in data:
+                value = data[name]
+                kwargs[name] = (
+                    value if decode is None or value is None else decode(value)
+                )
+        return self._cls(**kwargs)
+
+    def decode_field(self, name: str, value: Any) -> Any:
+        """Value of a single field, like from_dict does"""
+        decode = self._field_decoders[name]
+        return value if decode is None or value is None else decode(value)
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        return self._dumps(data)
+
+    def loads(self, data: Optional[bytes]) -> Optional[Dict[str, Any]]:
+        return self._loads(data) if data else None
+
+    def encode(self, obj: E) -> bytes:
+        return self._dumps(self.to_dict(obj))
+
+    def decode(self, data: bytes) -> Optional[E]:
+        return self.from_dict(self._loads(data)) if data else None
+
+
+@functools.lru_cache(maxsize=None)
+def codec_for(cls: type, backend: str = DEFAULT_BACKEND) -> EntityCodec:
+    """Codec of cls, compiled on first use"""
+    return EntityCodec(cls, backend)
+
+
+def _local_timezone() -> Optional[datetime.tzinfo]:
+    return datetime.datetime.now(datetime.timezone.utc).astimezone().tzinfo
+
+
+def _optional_arg(tp: Any) -> Optional[Any]:
+    """X of Optional[X], None for other types"""
+    if typing.get_origin(tp) is not typing.Union:
+        return None
+    args = [arg for arg in typing.get_args(tp) if arg is not _NONE_TYPE]
+    return args[0] if len(args) == 1 else None
+
+
+def _is_class(tp: Any, base: type) -> bool:
+    return isinstance(tp, type) and issubclass(tp, base)
+
+
+def _item_type(origin: Any, args: Tuple[Any, ...]) -> Any:
+    """Type of the items of a collection, Any if they differ like in Tuple[int, str]"""
+    if not args or (origin is tuple and len(args) > 1 and args[1] is not Ellipsis):
+        return Any
+    return args[0]
+
+
+def _or_none(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda value: None if value is None else convert(value)
+
+
+def _each(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda values: [None if v is None else convert(v) for v in values]
+
+
+def _each_value(convert: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    return lambda values: {
+        k: None if v is None else convert(v) for k, v in values.items()
+    }
+
+
+def _encoder(tp: Any, encode_json: bool) -> _Convert:
+    inner = _optional_arg(tp)
+    if inner is not None:
+        encode = _encoder(inner, encode_json)
+        if encode is None:
+            return None
+        return _or_none(encode)
+
+    origin, args = typing.get_origin(tp), typing.get_args(tp)
+    if origin in (list, tuple, set, frozenset):
+        encode = _encoder(_item_type(origin, args), encode_json)
+        if encode is None:
+            return None if origin is list else list
+        return _each(encode)
+    if origin is dict:
+        encode = _encoder(args[1], encode_json) if args else None
+        if encode is None:
+            return None
+        return _each_value(encode)
+
+    if dataclasses.is_dataclass(tp):
+        return lambda value: codec_for(tp).to_dict(value, encode_json)
+    if _is_class(tp, enum.Enum):
+        # As stored by CustomJSONEncoder
+        return (lambda value: str(value.value)) if encode_json else (lambda v: v.value)
+    if not encode_json:
+        return None
+    if _is_class(tp, UUID):
+        return str
+    if _is_class(tp, datetime.datetime):
+        return lambda value: value.timestamp()
+    return None
+
+
+def _decoder(tp: Any) -> _Convert:
+    inner = _optional_arg(tp)
+    if inner is not None:
+        decode = _decoder(inner)
+        if decode is None:
+            return None
+        return _or_none(decode)
+
+    origin, args = typing.get_origin(tp), typing.get_args(tp)
+    if origin in (list, tuple, set, frozenset):
+        decode = _decoder(_item_type(origin, args))
+        if decode is None:
+            return None if origin is list else origin
+        if origin is list:
+            return _each(decode)
+        convert, collection = _or_none(decode), cast(type, origin)
+        return lambda values: collection(map(convert, values))
+    if origin is dict:
+        decode = _decoder(args[1]) if args else None
+        if decode is None:
+            return None
+        return _each_value(decode)
+
+    if dataclasses.is_dataclass(tp):
+        return lambda value: (
+            value if isinstance(value, tp) else codec_for(tp).from_dict(value)
+        )
+    if _is_class(tp, enum.Enum):
+        members: Dict[Any, Any] = {}
+        for member in tp:
+            members[member.value] = member
+            members.setdefault(str(member.value), member)
+        return lambda value: value if isinstance(value, tp) else members[value]
+    if _is_class(tp, UUID):
+        return lambda value: value if isinstance(value, UUID) else UUID(value)
+    if _is_class(tp, datetime.datetime):
+        return lambda value: (
+            value
+            if isinstance(value, datetime.datetime)
+            else datetime.datetime.fromtimestamp(value, tz=_local_timezone())
+        )
+    return None
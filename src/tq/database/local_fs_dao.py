@@ -0,0 +1,90 @@
+import io
+import pathlib
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Any, Iterable, Iterator, Optional, Union
+from uuid import uuid4
+
+from tq.database.db import AbstractFsDao
+
+
+class LocalFsDao(AbstractFsDao):
+    """Stores files on the local file system, each file goes into its own directory named by its id"""
+
+    def __init__(self, root: Union[str, pathlib.Path]):
+        self._root = pathlib.Path(root)
+        self._root.mkdir(parents=True, exist_ok=True)
+
+    def store(self, filename: str, data: Any) -> str:
+        file_id = uuid4().hex
+        path = self._create_file_path(file_id, filename)
+        if isinstance(data, io.IOBase):
+            with path.open("wb") as file_obj:
+                shutil.copyfileobj(data, file_obj)
+        elif isinstance(data, str):
+            path.write_text(data)
+        else:
+            path.write_bytes(data)
+        return file_id
+
+    def load_by_id(self, file_id: str) -> bytes:
+        return self._file_of(file_id).read_bytes()
+
+    def delete_by_id(self, file_id: str) -> bool:
+        directory = self._root / file_id
+        if not directory.is_dir():
+            return False
+        shutil.rmtree(directory)
+        return True
+
+    def load(self, filename: str) -> Optional[bytes]:
+        file_id = self.find_file_id(filename)
+        return self.load_by_id(file_id) if file_id else None
+
+    def delete(self, filename: str) -> bool:
+        file_id = self.find_file_id(filename)
+        return self.delete_by_id(file_id) if file_id else False
+
+    def iterate_filenames(self) -> Iterable[str]:
+        return (path.read_text() for path in self._root.glob("*/.filename"))
+
+    def find_file_id(self, filename: str) -> Optional[str]:
+        for path in self._root.glob("*/.filename"):
+            if path.read_text() == filename:
+                return path.parent.name
+        return None
+
+    @contextmanager
+    def open(self, filename: str, mode: str = "rb") -> Iterator[IO]:
+        if "r" in mode:
+            file_id = self.find_file_id(filename)
+            if file_id is None:
+                raise FileNotFoundError(filename)
+            with self._file_of(file_id).open(mode) as file_obj:
+                yield file_obj
+
+        elif "w" in mode:
+            file_id = self.store(filename, b"")
+            with self._file_of(file_id).open(mode) as file_obj:
+                yield file_obj
+
+        else:
+            raise ValueError(f"Mode {mode} not supported")
+
+    @contextmanager
+    def as_tempfile(self, file_id: str, **kwargs: Any) -> Iterator[IO[bytes]]:
+        with tempfile.NamedTemporaryFile(**kwargs) as tmp:
+            tmp.write(self.load_by_id(file_id))
+            tmp.seek(0)
+            yield tmp
+
+    def _create_file_path(self, file_id: str, filename: str) -> pathlib.Path:
+        # The original name is kept aside, it may not be a valid path
+        directory = self._root / file_id
+        directory.mkdir(parents=True)
+        (directory / ".filename").write_text(filename)
+        return directory / "data"
+
+    def _file_of(self, file_id: str) -> pathlib.Path:
+        return self._root / file_id / "data"
@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Type, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 from uuid import UUID, uuid4
 
 import bson
@@ -7,6 +7,7 @@ from marshmallow import Schema
 from pymongo import MongoClient, UpdateOne, client_session, collection, errors
 
 from tq.database.db import AbstractDao, BaseContext, BaseEntity, transactional
+from tq.database.entity_codec import EntityCodec
 
 LOGGER = logging.getLogger(__name__)
 
@@ -85,8 +86,10 @@ class MongoDaoContext(BaseContext):
 
         return data
 
-    def create_or_update(self, obj: Any) -> UUID:
-        data = self.sanitize(obj.to_dict())
+    def create_or_update(
+        self, obj: Any, to_dict: Optional[Callable[[Any], Dict]] = None
+    ) -> UUID:
+        data = self.sanitize(to_dict(obj) if to_dict else obj.to_dict())
         del data["_id"]
         obj.id = obj.id or uuid4()
         result = self.collection.update_one(
@@ -100,11 +103,13 @@ class MongoDaoContext(BaseContext):
 
         return obj.id
 
-    def create_or_update_many(self, objs: Iterable[Any]) -> List[UUID]:
+    def create_or_update_many(
+        self, objs: Iterable[Any], to_dict: Optional[Callable[[Any], Dict]] = None
+    ) -> List[UUID]:
         # TODO: This does not work
         updates = []
         for obj in objs:
-            data = self.sanitize(obj.to_dict())
+            data = self.sanitize(to_dict(obj) if to_dict else obj.to_dict())
             obj.id = obj.id or uuid4()
             del data["_id"]
             updates.append(
@@ -130,6 +135,15 @@ class MongoDaoContext(BaseContext):
         result = self.collection.find_one({"_id": bson.Binary.from_uuid(obj_id)})
         return self.desanitize(result)
 
+    def get_entities(self, ids: Iterable[Union[UUID, str]]) -> List[Optional[Dict]]:
+        obj_ids = [UUID(id) if isinstance(id, str) else id for id in ids]
+        query = {"_id": {"$in": [bson.Binary.from_uuid(id) for id in obj_ids]}}
+        found = {}
+        for item in self.collection.find(query):
+            key = bson.Binary.as_uuid(item["_id"])
+            found[key] = self.desanitize(item)
+        return [found.get(id) for id in obj_ids]
+
     def find_one_entity(self, query: dict) -> Dict:
         result = self.collection.find_one(query)
         return self.desanitize(result)
@@ -152,6 +166,14 @@ class MongoDaoContext(BaseContext):
     def delete_entity(self, id: Optional[Union[UUID, str]]):
         self.collection.delete_one({"_id": bson.Binary.from_uuid(id)})
 
+    def delete_many(self, ids: Iterable[Union[UUID, str]]) -> int:
+        obj_ids = [
+            bson.Binary.from_uuid(UUID(id) if isinstance(id, str) else id) for id in ids
+        ]
+        if not obj_ids:
+            return 0
+        return self.collection.delete_many({"_id": {"$in": obj_ids}}).deleted_count
+
     def _run_transaction(
         self, fn: Callable, is_subcontext: bool = False
     ) -> Optional[Any]:
@@ -171,37 +193,48 @@ class BaseMongoDao(AbstractDao):
     def __init__(
         self,
         client: MongoClient,
-        schema: Type[Schema],
+        schema: Schema,
         key_prefix: str,
+        codec: Optional[EntityCodec] = None,
     ):
+        """With a codec entities are converted by it instead of dataclasses_json"""
         super().__init__(schema, key_prefix)
         self._client = client
+        self._codec = codec
 
     @transactional
     def create_or_update(self, obj: BaseEntity, ctx: MongoDaoContext) -> UUID:
-        return ctx.create_or_update(obj)
+        return ctx.create_or_update(obj, self._to_dict)
 
     @transactional
     def bulk_create_or_update(
         self, objs: Iterable[BaseEntity], ctx: MongoDaoContext
     ) -> List[UUID]:
-        return ctx.create_or_update_many(objs)
+        return ctx.create_or_update_many(objs, self._to_dict)
 
     @transactional
     def get_entity(
         self, id: Optional[Union[UUID, str]], ctx: MongoDaoContext
-    ) -> BaseEntity:
+    ) -> Optional[BaseEntity]:
         result = ctx.get_entity(id)
-        return self.schema.from_dict(result) if result else None
+        return self._from_dict(result) if result else None
+
+    @transactional
+    def get_many(
+        self, ids: Iterable[Union[UUID, str]], ctx: MongoDaoContext
+    ) -> List[Optional[BaseEntity]]:
+        return [
+            self._from_dict(item) if item else None for item in ctx.get_entities(ids)
+        ]
 
     @transactional
     def get_all(self, ctx: MongoDaoContext) -> List[BaseEntity]:
-        return [self.schema.from_dict(item) for item in ctx.iterate_entities()]
+        return [self._from_dict(item) for item in ctx.iterate_entities()]
 
     @transactional
     def iterate_all(self, ctx: MongoDaoContext) -> Iterator[BaseEntity]:
         for item in ctx.iterate_entities():
-            yield self.schema.from_dict(item)
+            yield self._from_dict(item)
 
     @transactional
     def iterate_all_keys(self, ctx: MongoDaoContext) -> Iterator[BaseEntity]:
@@ -212,6 +245,23 @@ class BaseMongoDao(AbstractDao):
     def delete(self, id: Optional[Union[UUID, str]], ctx: MongoDaoContext):
         ctx.delete_entity(id)
 
+    @transactional
+    def bulk_delete(self, ids: Iterable[Union[UUID, str]], ctx: MongoDaoContext) -> int:
+        return ctx.delete_many(ids)
+
+    def _to_dict(self, obj: BaseEntity) -> Dict:
+        # pymongo takes UUIDs and datetimes as they are
+        return (
+            self._codec.to_dict(obj, encode_json=False)
+            if self._codec
+            else obj.to_dict()
+        )
+
+    def _from_dict(self, data: Dict) -> BaseEntity:
+        return (
+            self._codec.from_dict(data) if self._codec else self.schema.from_dict(data)
+        )
+
     def _create_context(self, ctx: Optional[BaseContext] = None) -> BaseContext:
         if ctx:
             return ctx.create_sub_context(self.key_prefix)
@@ -0,0 +1,118 @@
+import collections
+import enum
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import redis
+from redis.commands import CoreCommands
+from redis.exceptions import RedisClusterException
+
+# https://redis.io/docs/reference/cluster-spec/#hash-tags
+
+
+class KeyLayout(enum.Enum):
+    """How the keys of a DAO are hash tagged, the keys used together have to share a cluster slot"""
+
+    # prefix:id, without hash tags as on a single Redis
+    PLAIN = "plain"
+    # {prefix}:id, all keys of a DAO and of its indexes in a single slot
+    PREFIX = "prefix"
+    # prefix:{id}, the keys of an id in a slot of their own, shared with the keys of other DAOs for the id.
+    # Ids holding a hash tag already are kept as they are.
+    ID = "id"
+
+
+def hash_tag(value: Any) -> str:
+    return f"{{{value}}}"
+
+
+def group_by_slot(
+    cluster: redis.RedisCluster, names: Iterable[Union[bytes, str]]
+) -> Dict[int, List[Union[bytes, str]]]:
+    slots: Dict[int, List[Union[bytes, str]]] = collections.defaultdict(list)
+    for name in names:
+        slots[cluster.keyslot(name)].append(name)
+    return slots
+
+
+class ClusterTransaction(CoreCommands):
+    """
+    MULTI/EXEC and WATCH for a RedisCluster, whose pipelines support neither.
+    Commands go to the primary of the slot of the first key watched or written, the keys of other slots
+    raise a RedisClusterException as Redis only runs transactions within a slot.
+    While watching, reads of other slots run right away on the cluster.
+    """
+
+    def __init__(self, cluster: redis.RedisCluster) -> None:
+        self._cluster = cluster
+        self._slot: Optional[int] = None
+        self._pipe: Optional[redis.client.Pipeline] = None
+        self._is_multi = False
+
+    def __enter__(self) -> "ClusterTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.reset()
+
+    @property
+    def watching(self) -> bool:
+        return self._pipe is not None and self._pipe.watching
+
+    @property
+    def command_stack(self) -> List[Any]:
+        return self._pipe.command_stack if self._pipe is not None else []
+
+    def pipeline_of(self, key: Union[bytes, str]) -> redis.client.Pipeline:
+        """Pipeline of the node the transaction runs on, it is bound to the slot of key if it is not yet"""
+        return self._bind(self._cluster.keyslot(key))
+
+    def watch(self, *names: Union[bytes, str]):
+        for name in names:
+            pipe = self.pipeline_of(name)
+        pipe.watch(*names)
+
+    def multi(self):
+        self._is_multi = True
+        if self._pipe is not None:
+            self._pipe.multi()
+
+    def execute(self) -> List[Any]:
+        return self._pipe.execute() if self._pipe is not None else []
+
+    def reset(self):
+        if self._pipe is not None:
+            self._pipe.reset()
+        self._pipe = None
+        self._slot = None
+        self._is_multi = False
+
+    def execute_command(self, *args, **options) -> Any:
+        slot = self._cluster.determine_slot(*args)
+        if self.watching and not self._is_multi and slot != self._slot:
+            return self._cluster.execute_command(*args, **options)
+        return self._bind(slot).execute_command(*args, **options)
+
+    def mget_nonatomic(self, keys: List[Union[bytes, str]]) -> List[Optional[bytes]]:
+        """Values of keys of any slots, the ones of the watched slot are read through the watching connection"""
+        values: Dict[Union[bytes, str], Optional[bytes]] = {}
+        if self._pipe is not None and self._pipe.watching:
+            watched = [key for key in keys if self._cluster.keyslot(key) == self._slot]
+            if watched:
+                values.update(zip(watched, self._pipe.mget(watched)))
+        others = [key for key in keys if key not in values]
+        if others:
+            values.update(zip(others, self._cluster.mget_nonatomic(others)))
+        return [values[key] for key in keys]
+
+    def _bind(self, slot: int) -> redis.client.Pipeline:
+        if self._pipe is None:
+            node = self._cluster.nodes_manager.get_node_from_slot(slot)
+            self._pipe = node.redis_connection.pipeline()
+            self._slot = slot
+            if self._is_multi:
+                self._pipe.multi()
+        elif slot != self._slot:
+            raise RedisClusterException(
+                f"Keys of a transaction have to share a slot, got {slot} and {self._slot}"
+            )
+        return self._pipe
@@ -1,209 +1,1055 @@
-from contextlib import contextmanager
+import collections
+import enum
+import functools
+import math
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass
 from functools import wraps
 from typing import (
     Any,
     Callable,
+    ContextManager,
+    Deque,
     Dict,
     Iterable,
     Iterator,
     List,
+    Mapping,
     Optional,
+    Sequence,
     Set,
-    Type,
+    Tuple,
     Union,
+    cast,
 )
 from uuid import UUID, uuid4
 
 import redis
 from marshmallow import Schema
 
+from tq.database import redis_scripts
+from tq.database.bloom_filter import BloomFilter
 from tq.database.db import AbstractDao, BaseContext, BaseEntity, transactional
-from tq.database.utils import from_json, to_json
+from tq.database.entity_cache import EntityCache
+from tq.database.entity_codec import EntityCodec
+from tq.database.redis_cluster import (
+    ClusterTransaction,
+    KeyLayout,
+    group_by_slot,
+    hash_tag,
+)
+from tq.database.utils import chunked, from_json, to_json
 
 # https://github.com/redis/redis-py
 # https://redis.io/commands
 
-DEFAULT_BUCKET_SIZE = 10
+# Items of the first window of a list stream, the following ones are sized by the items seen
+DEFAULT_LIST_WINDOW = 100
+DEFAULT_LIST_WINDOW_BYTES = 1 << 20
+MAX_LIST_WINDOW = 10000
+# Number of commands sent in a single round trip by bulk operations
+DEFAULT_CHUNK_SIZE = 1000
+# Keys per SCAN page
+DEFAULT_SCAN_COUNT = 1000
+# Keys per SCAN page of a purge, unlinked with a pipeline per page
+DEFAULT_PURGE_SCAN_COUNT = 10000
+# Seconds the invalidation thread of a cached DAO waits for a message at a time
+INVALIDATION_POLL_INTERVAL = 1.0
+# Shortest wait of blocking commands, a timeout of 0 would block forever
+MIN_BLOCKING_TIMEOUT = 0.01
+
+# Connection pools of servers older than Redis 6, which only take whole seconds as blocking timeouts
+_WHOLE_SECOND_TIMEOUTS: "weakref.WeakSet" = weakref.WeakSet()
+
+# Clients of each thread by connection pool, shared by the DAOs of the pool
+_THREAD_CLIENTS = threading.local()
 
 
 # TODO: Unfuck names [type] _ [what_operation] like hash_get_keys() or the other way aorund, make it uniform at least
 
 
+class QueuedReply:
+    """Reply of writes queued in a transaction, it is resolved when returned by the outermost transactional call"""
+
+    def __init__(
+        self, indices: List[int], reduce: Callable[[List[Any]], Any] = lambda r: r[0]
+    ) -> None:
+        self._indices = indices
+        self._reduce = reduce
+
+    @staticmethod
+    def combine(
+        replies: List["QueuedReply"], reduce: Callable[[List[Any]], Any]
+    ) -> "QueuedReply":
+        return QueuedReply([i for reply in replies for i in reply._indices], reduce)
+
+    def resolve(self, replies: List[Any]) -> Any:
+        return self._reduce([replies[i] for i in self._indices])
+
+
+class _TransactionState:
+    """Transaction of a context, shared with its sub-contexts"""
+
+    def __init__(self) -> None:
+        self.pipe: Optional[redis.client.Pipeline] = None
+        self.is_queueing = False
+        # Values written by the transaction so far, None for deleted keys
+        self.writes: Dict[str, Optional[bytes]] = {}
+        self.commit_callbacks: List[Callable[[], None]] = []
+        # Transactional calls joining the transaction of an outer one
+        self.depth = 0
+        # Whether bulk writes go out per chunk instead of being queued, see RedisDaoContext.chunks_apart
+        self.chunks_apart = False
+
+    def begin(self, pipe: redis.client.Pipeline):
+        self.pipe = pipe
+        self.is_queueing = False
+        self.chunks_apart = False
+        self.writes = {}
+        self.commit_callbacks = []
+
+    def end(self):
+        if self.pipe is not None:
+            self.pipe.reset()
+        self.begin(None)
+
+
+def _window_size(item_bytes: float) -> int:
+    """Items per list window for items of item_bytes on average"""
+    return max(
+        1, min(MAX_LIST_WINDOW, int(DEFAULT_LIST_WINDOW_BYTES / max(item_bytes, 1)))
+    )
+
+
+def _blocking_timeouts(
+    db: Union[redis.Redis, redis.RedisCluster, "redis.asyncio.Redis"], timeout: float
+) -> List[Union[int, float]]:
+    """Timeouts to try for a blocking command, fractional ones are rejected by Redis < 6"""
+    pool = getattr(db, "connection_pool", db)
+    whole = max(1, math.ceil(timeout))
+    if pool in _WHOLE_SECOND_TIMEOUTS:
+        return [whole]
+    return [max(timeout, MIN_BLOCKING_TIMEOUT), whole]
+
+
+def _rejects_fractional_timeout(
+    db: Union[redis.Redis, redis.RedisCluster, "redis.asyncio.Redis"],
+    error: redis.ResponseError,
+) -> bool:
+    """Whether error is the one of a server only taking whole seconds, which is then remembered"""
+    if "timeout" not in str(error):
+        return False
+    _WHOLE_SECOND_TIMEOUTS.add(getattr(db, "connection_pool", db))
+    return True
+
+
+def _ttl_millis(ttl: float) -> int:
+    """ttl in whole milliseconds, at least one as SET rejects PX 0"""
+    return max(1, int(ttl * 1000))
+
+
+def _mget(
+    client: Union[redis.Redis, redis.RedisCluster, redis.client.Pipeline],
+    names: Sequence[Union[bytes, str]],
+) -> List[Optional[bytes]]:
+    """MGET, split by slot in a cluster"""
+    if isinstance(client, (redis.RedisCluster, ClusterTransaction)):
+        return client.mget_nonatomic(names)
+    return client.mget(names)
+
+
+def _decode_hash(item: Optional[Mapping[Any, bytes]]) -> Optional[Dict]:
+    """Hash of JSON encoded fields as a dict, None for an empty one"""
+    if not item:
+        return None
+    return {
+        field.decode() if isinstance(field, bytes) else field: from_json(value)
+        for field, value in item.items()
+    }
+
+
+def _window_bounds(offset: int, size: int, reverse: bool) -> Tuple[int, int]:
+    """LRANGE bounds of a list window, its items are reversed unless reverse"""
+    if reverse:
+        return offset, offset + size - 1
+    # Counted from the tail, so items pushed meanwhile do not shift the window
+    return -(offset + size), -(offset + 1)
+
+
+def _key_id(key: bytes) -> UUID:
+    """Id of an entity from its key"""
+    return UUID(key.decode("utf-8").split(":")[-1])
+
+
+class _TransactionalContext:
+    """
+    Key naming and transaction bookkeeping of RedisDaoContext, shared with AsyncRedisDaoContext.
+    Nothing here talks to Redis besides queueing on the pipeline of the transaction,
+    the subclasses run the commands.
+    """
+
+    _name_prefix: str
+    _transaction: _TransactionState
+    _layout: KeyLayout = KeyLayout.PLAIN
+    value_from_callable: bool
+
+    @property
+    def in_transaction(self) -> bool:
+        return self._transaction.pipe is not None
+
+    @property
+    def can_watch(self) -> bool:
+        """Whether keys can still be watched, which is until the transaction queues a write"""
+        return self.in_transaction and not self._transaction.is_queueing
+
+    @property
+    def is_watching(self) -> bool:
+        state = self._transaction
+        return state.pipe is not None and state.pipe.watching
+
+    @property
+    def wildcard(self) -> str:
+        return f"{self._name_prefix}:*"
+
+    def has_written(self, id: Optional[Union[UUID, str]]) -> bool:
+        """Whether the transaction has set or deleted the key of id"""
+        return self._name(id) in self._transaction.writes
+
+    def on_commit(self, callback: Callable[[], None]):
+        """Runs callback once the transaction commits, right away if not in one"""
+        if self.in_transaction:
+            self._transaction.commit_callbacks.append(callback)
+        else:
+            callback()
+
+    @contextmanager
+    def chunks_apart(self) -> Iterator[None]:
+        """
+        Bulk writes within the block go out per chunk on pipelines of their own rather than being queued,
+        unless an outer call opened the transaction or keys are watched. A bulk call of a DAO thereby
+        does not send all of its chunks in one EXEC, its other writes still commit together.
+        """
+        state = self._transaction
+        if (
+            state.pipe is None
+            or state.depth
+            or state.chunks_apart
+            or state.pipe.watching
+        ):
+            yield
+            return
+        state.chunks_apart = True
+        try:
+            yield
+        finally:
+            state.chunks_apart = False
+
+    def _name(self, id: Optional[Union[UUID, str]]) -> str:
+        if not id:
+            return self._name_prefix
+        id = str(id)
+        if self._layout == KeyLayout.ID and "{" not in id:
+            id = hash_tag(id)
+        return f"{self._name_prefix}:{id}"
+
+    def _watchable_pipe(self) -> redis.client.Pipeline:
+        """Pipeline of the transaction to watch keys on, raises if it cannot watch them anymore"""
+        state = self._transaction
+        if state.pipe is None:
+            raise RuntimeError("Keys can only be watched within a transaction")
+        if state.is_queueing:
+            raise RuntimeError("Keys have to be watched before the first write")
+        return state.pipe
+
+    @property
+    def _queues_bulk(self) -> bool:
+        """Whether bulk writes are queued with the transaction"""
+        return self.in_transaction and not self._transaction.chunks_apart
+
+    @property
+    def _watching_pipe(self) -> Optional[redis.client.Pipeline]:
+        """Pipeline of the transaction while it watches keys, reads go through it until the first write"""
+        state = self._transaction
+        if state.pipe is not None and state.pipe.watching and not state.is_queueing:
+            return state.pipe
+        return None
+
+    def _queue(self) -> redis.client.Pipeline:
+        state = self._transaction
+        if state.pipe is None:
+            raise RuntimeError("Commands are only queued in a transaction")
+        if not state.is_queueing:
+            state.pipe.multi()
+            state.is_queueing = True
+        return state.pipe
+
+    @staticmethod
+    def _queued(pipe: redis.client.Pipeline) -> QueuedReply:
+        """Reply of the command queued last on pipe"""
+        return QueuedReply([len(pipe.command_stack) - 1])
+
+    def _written(self, name: str, data: Optional[bytes]):
+        if self.in_transaction:
+            self._transaction.writes[name] = data
+
+    def _unwritten(self, names: Iterable[str]) -> List[str]:
+        """Names whose values have to be fetched, those of the transaction are known"""
+        writes = self._transaction.writes
+        return [name for name in names if name not in writes]
+
+    def _with_writes(
+        self, names: Iterable[str], fetched: Mapping[str, Optional[bytes]]
+    ) -> List[Optional[bytes]]:
+        """Values of names, as written by the transaction or else as fetched"""
+        writes = self._transaction.writes
+        return [writes[name] if name in writes else fetched.get(name) for name in names]
+
+    def _result(self, result: Any, replies: List[Any]) -> Any:
+        """Value of a committed transaction, queued replies resolved"""
+        if not self.value_from_callable:
+            return replies
+        if isinstance(result, QueuedReply):
+            return result.resolve(replies)
+        return result
+
+    @staticmethod
+    def _replace_hash(
+        pipe: redis.client.Pipeline, name: str, obj: Dict, ttl: Optional[int] = None
+    ):
+        pipe.delete(name)
+        if obj:
+            pipe.hset(name, mapping={key: to_json(value) for key, value in obj.items()})
+            if ttl:
+                pipe.expire(name, ttl)
+
+
 # TODO: Add db maintainer - aka save after X amount of db commits
 @dataclass
-class RedisDaoContext(BaseContext):
+class RedisDaoContext(_TransactionalContext, BaseContext):
+    """
+    Within a transaction write commands are queued and sent in a single MULTI/EXEC when the outermost
+    transactional call returns, methods of queued writes return a QueuedReply instead of the reply.
+    Reads run right away and see the values set or deleted by the transaction itself,
+    keys of other types are read as they were before the transaction.
+    Commands which are needed for their reply, like pops, are not part of the transaction.
+
+    On a RedisCluster a transaction runs within the slot of its first key, see ClusterTransaction,
+    and keys are hash tagged according to the layout. Unless the layout is KeyLayout.PREFIX,
+    bulk operations span slots, they are pipelined per node right away instead of being part of the transaction.
+
+    With indexed_lists each list is accompanied by a membership index under "<list key>.members",
+    a sorted set counting the occurrences of each item, so list_has is a single ZSCORE instead of a scan.
+    It is kept by the list methods, lists have to be deleted with delete or unlink rather than bulk_delete.
+
+    With a bloom_filter the keys written by the context are added to it, only might_exist consults it.
+    The bits of a shared filter are published before the write, a transaction which does not commit
+    leaves false positives only.
+    """
+
     # TODO: Properties + use proper setters
     shard_hint: Optional[str] = None
     watches: Optional[Set[str]] = None
     value_from_callable: bool = True
     watch_delay: Optional[float] = None
 
-    def __init__(self, db: redis.Redis, name_prefix: str):
+    def __init__(
+        self,
+        db: Union[redis.Redis, redis.RedisCluster],
+        name_prefix: str,
+        transaction: Optional[_TransactionState] = None,
+        layout: KeyLayout = KeyLayout.PLAIN,
+        indexed_lists: bool = False,
+        bloom_filter: Optional[BloomFilter] = None,
+    ):
         self._db = db
-        self._name_prefix: redis.ConnectionPool = name_prefix
+        self._name_prefix = name_prefix
+        self._transaction = transaction if transaction else _TransactionState()
+        self._layout = layout
+        self._indexed_lists = indexed_lists
+        self._bloom_filter = bloom_filter
 
-    @contextmanager
-    def create_sub_context(self, name_prefix):
+    def create_sub_context(
+        self,
+        name_prefix,
+        layout: Optional[KeyLayout] = None,
+        indexed_lists: bool = False,
+        bloom_filter: Optional[BloomFilter] = None,
+    ):
         # TODO: When creating a new sub-ctx make it able to set certain flags for the transaction in the root context itself
-        yield RedisDaoContext(self._db, name_prefix)
+        return RedisDaoContext(
+            self._db,
+            name_prefix,
+            self._transaction,
+            layout if layout else self._layout,
+            indexed_lists,
+            bloom_filter,
+        )
 
     def table(self, name_prefix):
-        return RedisDaoContext(self._db, name_prefix)
+        # The keys of another prefix are not in the Bloom filter
+        return RedisDaoContext(
+            self._db,
+            name_prefix,
+            self._transaction,
+            self._layout,
+            self._indexed_lists,
+        )
 
     @property
     def db(self):
         return self._db
 
     @property
-    def wildcard(self) -> str:
-        return f"{self._name_prefix}:*"
+    def is_cluster(self) -> bool:
+        return isinstance(self._db, redis.RedisCluster)
 
-    def _name(self, id: Optional[Union[UUID, str]]) -> str:
-        return f"{self._name_prefix}:{str(id)}" if id else self._name_prefix
+    @property
+    def layout(self) -> KeyLayout:
+        return self._layout
+
+    @property
+    def indexed_lists(self) -> bool:
+        return self._indexed_lists
+
+    @property
+    def bloom_filter(self) -> Optional[BloomFilter]:
+        return self._bloom_filter
+
+    def watch(self, *ids: Optional[Union[UUID, str]]):
+        """
+        Watches the keys of ids, the transaction is run again if any of them changes before it commits.
+        Keys have to be watched before the first write, reads until then go through the watching connection.
+        """
+        self._watchable_pipe().watch(*[self._name(id) for id in ids])
+
+    @staticmethod
+    def _members_name(name: str) -> str:
+        """Key of the membership index of the list under name"""
+        return f"{name}.members"
+
+    def might_exist(self, id: Optional[Union[UUID, str]]) -> bool:
+        """
+        False if the key of id was never written, as far as the Bloom filter knows, True if it may exist.
+        Keys not known in process are looked up in the bitmap of a shared filter, see BloomFilter.might_contain.
+        A filter without a key only knows the writes of this process, it is sound with a single writer only.
+        Keys written before the filter existed are only known once rebuild_bloom_filter has run.
+        """
+        bloom_filter = self._bloom_filter
+        return bloom_filter is None or bloom_filter.might_contain(
+            self._db, self._name(id)
+        )
+
+    def rebuild_bloom_filter(self, count: int = DEFAULT_SCAN_COUNT) -> int:
+        """Adds the keys under the prefix to the Bloom filter with a full scan, returns their number"""
+        bloom_filter = self._bloom_filter
+        if bloom_filter is None:
+            return 0
+        added = 0
+        for keys in self.iterate_key_pages(count):
+            offsets = [
+                offset for key in keys for offset in bloom_filter.add(key.decode())
+            ]
+            bloom_filter.publish(self._db, offsets)
+            added += len(keys)
+        return added
+
+    def _created(self, *names: str):
+        """
+        Adds keys about to be written to the Bloom filter. Their bits are published right away,
+        before the transaction commits, so they are never ruled out while they exist.
+        """
+        bloom_filter = self._bloom_filter
+        if bloom_filter is None:
+            return
+        offsets = [offset for name in names for offset in bloom_filter.add(name)]
+        bloom_filter.publish(self._db, offsets)
+
+    @property
+    def _spans_slots(self) -> bool:
+        """Whether the keys of a bulk operation may be in different cluster slots"""
+        return self.is_cluster and self._layout != KeyLayout.PREFIX
+
+    @property
+    def _client(self) -> Union[redis.Redis, redis.client.Pipeline]:
+        """Runs commands right away"""
+        pipe = self._watching_pipe
+        return self._db if pipe is None else pipe
+
+    def _write(self, command: str, *args, **kwargs) -> Any:
+        """Runs a write command, or queues it if in a transaction"""
+        if not self.in_transaction:
+            return getattr(self._db, command)(*args, **kwargs)
+        pipe = self._queue()
+        getattr(pipe, command)(*args, **kwargs)
+        return self._queued(pipe)
+
+    def _write_script(
+        self, script: redis_scripts.LuaScript, keys: List[str], args: List[Any]
+    ) -> Any:
+        """Runs a script which writes, or queues it if in a transaction"""
+        if not self.in_transaction:
+            return script(self._db, keys, args)
+        pipe = self._queue()
+        script(pipe, keys, args)
+        return self._queued(pipe)
+
+    @contextmanager
+    def _batch(
+        self, transaction: bool = True, bulk: bool = False
+    ) -> Iterator[redis.client.Pipeline]:
+        """
+        Pipeline for a batch of writes, the one of the transaction if there is one.
+        Bulk batches are not queued when the transaction writes chunks apart, see chunks_apart,
+        those of a cluster are pipelined per node, without MULTI as their keys span slots.
+        """
+        if self._queues_bulk and not self._spans_slots if bulk else self.in_transaction:
+            yield self._queue()
+            return
+
+        with self._db.pipeline(transaction=transaction and not self.is_cluster) as pipe:
+            yield pipe
+            pipe.execute()
+
+    def _per_slot(
+        self, command: str, names: Sequence[Union[bytes, str]], chunk_size: int
+    ) -> List[Any]:
+        """Runs a multi-key command right away, one per chunk of names of a slot, pipelined per node"""
+        with self._db.pipeline(transaction=False) as pipe:
+            for slot_names in group_by_slot(self._db, names).values():
+                for chunk in chunked(slot_names, chunk_size):
+                    pipe.execute_command(command, *chunk)
+            return pipe.execute()
+
+    @property
+    def _pooled_client(self) -> Union[redis.Redis, redis.RedisCluster]:
+        """Client for other threads, the client of the context may be bound to the calling thread"""
+        if self.is_cluster:
+            return self._db
+        return redis.Redis(connection_pool=self._db.connection_pool)
 
     def is_exists(self, id: Optional[Union[UUID, str]]) -> bool:
-        return self._db.exists(self._name(id))
+        name = self._name(id)
+        if name in self._transaction.writes:
+            return self._transaction.writes[name] is not None
+        return bool(self._client.exists(name))
 
-    def set(self, id: Optional[Union[UUID, str]], data: bytes) -> UUID:
+    def set(
+        self, id: Optional[Union[UUID, str]], data: bytes, ttl: Optional[int] = None
+    ) -> Union[UUID, str]:
+        """Sets the key of id, which expires after ttl seconds if given"""
         id = id if id else uuid4()
         name = self._name(id)
-        self._db.set(name, data)
+        self._created(name)
+        self._write("set", name, data, ex=ttl)
+        self._written(name, data)
         return id
 
     def create_or_update(
-        self, obj: Dict, id: Optional[Union[UUID, str]] = None
-    ) -> UUID:
-        return self.set(
-            id if id else uuid4(),
-            to_json(obj),
-        )
+        self,
+        obj: Dict,
+        id: Optional[Union[UUID, str]] = None,
+        dumps: Callable[[Dict], bytes] = to_json,
+        ttl: Optional[int] = None,
+    ) -> Union[UUID, str]:
+        return self.set(id if id else uuid4(), dumps(obj), ttl)
+
+    def bulk_create_or_update(
+        self,
+        items: Iterable[Tuple[Dict, Optional[UUID]]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        dumps: Callable[[Dict], bytes] = to_json,
+        ttl: Optional[int] = None,
+    ) -> List[UUID]:
+        """
+        Writes (obj, id) pairs, each chunk in a single round trip.
+        In a transaction the chunks are queued with it, unless it writes chunks apart.
+        """
+        ids = []
+        for chunk in chunked(items, chunk_size):
+            pairs = [(obj, id if id else uuid4()) for obj, id in chunk]
+            self._created(*[self._name(id) for _, id in pairs])
+            with self._batch(transaction=False, bulk=True) as pipe:
+                for obj, id in pairs:
+                    name, data = self._name(id), dumps(obj)
+                    pipe.set(name, data, ex=ttl)
+                    self._written(name, data)
+                    ids.append(id)
+        return ids
 
     def get(self, id: Optional[Union[UUID, str]]) -> Optional[bytes]:
         name = self._name(id)
-        if not self._db.exists(name):
-            return None
-        return self._db.get(name)
+        if name in self._transaction.writes:
+            return self._transaction.writes[name]
+        return self._client.get(name)
 
-    def get_entity(self, id: Optional[Union[UUID, str]]) -> Optional[Dict]:
+    def get_entity(
+        self,
+        id: Optional[Union[UUID, str]],
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> Optional[Dict]:
         item = self.get(id)
-        return from_json(item)
+        return loads(item)
 
-    def iterate_all_keys(self) -> Iterator[UUID]:
-        for db_key in self._db.scan_iter(self.wildcard):
-            name = db_key.decode("utf-8").split(":")[-1]
-            yield UUID(name)
+    def get_many(
+        self, ids: Iterable[Union[UUID, str]], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> List[Optional[bytes]]:
+        """Fetches the values in order with a single MGET per chunk, None for missing keys"""
+        items: List[Optional[bytes]] = []
+        for chunk in chunked(ids, chunk_size):
+            names = [self._name(id) for id in chunk]
+            unwritten = self._unwritten(names)
+            fetched = (
+                dict(zip(unwritten, _mget(self._client, unwritten)))
+                if unwritten
+                else {}
+            )
+            items.extend(self._with_writes(names, fetched))
+        return items
 
-    def iterate_all_entities(self) -> Iterator[Dict]:
-        for db_key in self._db.scan_iter(self.wildcard):
-            item = self._db.get(db_key)
-            yield from_json(item)
+    def get_entities(
+        self,
+        ids: Iterable[Union[UUID, str]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> List[Optional[Dict]]:
+        return [loads(item) for item in self.get_many(ids, chunk_size)]
+
+    def iterate_key_pages(
+        self, count: int = DEFAULT_SCAN_COUNT
+    ) -> Iterator[List[bytes]]:
+        """
+        Yields the keys under the prefix one SCAN page at a time, count is a hint for the page size.
+        The primaries of a cluster are scanned one after the other.
+        """
+        if self.is_cluster:
+            for node in self._db.get_primaries():
+                cursor = None
+                while cursor != 0:
+                    cursors, keys = self._db.scan(
+                        cursor or 0, match=self.wildcard, count=count, target_nodes=node
+                    )
+                    cursor = cursors[node.name]
+                    if keys:
+                        yield keys
+            return
+
+        cursor = None
+        while cursor != 0:
+            cursor, keys = self._client.scan(
+                cursor or 0, match=self.wildcard, count=count
+            )
+            if keys:
+                yield keys
+
+    def iterate_all_keys(self, count: int = DEFAULT_SCAN_COUNT) -> Iterator[UUID]:
+        for keys in self.iterate_key_pages(count):
+            yield from map(_key_id, keys)
+
+    def iterate_entity_pages(
+        self,
+        count: int = DEFAULT_SCAN_COUNT,
+        workers: int = 0,
+        hashes: bool = False,
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> Iterator[List[Dict]]:
+        """
+        Yields the entities under the prefix page by page, each page is loaded with a single MGET,
+        or in a single pipeline of HGETALLs if the entities are stored as hashes.
+        With workers the following pages are loaded on that many connections while the current one is consumed.
+        """
+        load_page: Callable[..., List[Dict]] = self._load_hash_page
+        if not hashes:
+            load_page = functools.partial(self._load_page, loads=loads)
+        pages = self.iterate_key_pages(count)
+        if workers <= 1:
+            for keys in pages:
+                yield load_page(keys, self._client)
+            return
+
+        pooled_client = self._pooled_client
+        with ThreadPoolExecutor(workers) as executor:
+            pending: Deque[Future] = collections.deque()
+            for keys in pages:
+                pending.append(executor.submit(load_page, keys, pooled_client))
+                if len(pending) >= workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def iterate_all_entities(
+        self, count: int = DEFAULT_SCAN_COUNT, workers: int = 0
+    ) -> Iterator[Dict]:
+        for page in self.iterate_entity_pages(count, workers):
+            yield from page
+
+    @staticmethod
+    def _load_page(
+        keys: List[bytes],
+        client: redis.Redis,
+        loads: Callable[[Optional[bytes]], Optional[Dict]] = from_json,
+    ) -> List[Dict]:
+        # Keys deleted since the scan, or holding other types, come back as None
+        return [data for data in map(loads, _mget(client, keys)) if data]
+
+    @classmethod
+    def _load_hash_page(
+        cls, keys: List[bytes], client: Union[redis.Redis, redis.client.Pipeline]
+    ) -> List[Dict]:
+        hashes = cls._fetch_hashes(keys, client)
+        return [data for data in map(_decode_hash, hashes) if data]
+
+    @staticmethod
+    def _fetch_hashes(
+        keys: Sequence[Union[bytes, str]],
+        client: Union[redis.Redis, redis.client.Pipeline],
+    ) -> List[Dict[bytes, bytes]]:
+        """HGETALL of each key in a single pipeline, missing keys come back empty"""
+        if isinstance(client, (redis.client.Pipeline, ClusterTransaction)):
+            # Watched reads go through the watching connection
+            return [client.hgetall(key) for key in keys]
+        with client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            return pipe.execute()
 
     def delete(self, id: Optional[Union[UUID, str]]):
-        self._db.delete(self._name(id))
+        name = self._name(id)
+        self._write("delete", *self._with_members(name))
+        self._written(name, None)
+
+    def unlink(self, id: Optional[Union[UUID, str]]):
+        """Deletes the key like delete, its memory is freed in the background"""
+        name = self._name(id)
+        self._write("unlink", *self._with_members(name))
+        self._written(name, None)
+
+    def _with_members(self, name: str) -> List[str]:
+        """name along with its membership index if lists are indexed"""
+        if self._indexed_lists:
+            return [name, self._members_name(name)]
+        return [name]
+
+    def bulk_delete(
+        self, ids: Iterable[Union[UUID, str]], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> Union[int, QueuedReply]:
+        """Deletes the keys with a single command per chunk, returns the number of keys deleted"""
+        if self._spans_slots:
+            names = [self._name(id) for id in ids]
+            for name in names:
+                self._written(name, None)
+            return sum(self._per_slot("DEL", names, chunk_size))
+
+        queued = self._queues_bulk
+        replies = []
+        for chunk in chunked(ids, chunk_size):
+            names = [self._name(id) for id in chunk]
+            replies.append(
+                self._write("delete", *names) if queued else self._db.delete(*names)
+            )
+            for name in names:
+                self._written(name, None)
+        if queued:
+            return QueuedReply.combine(replies, sum)
+        return sum(replies)
 
     def list_has(self, id: Optional[Union[UUID, str]], data: Union[str, bytes]) -> bool:
-        return len(self.list_find_all(id, data)) != 0
+        name = self._name(id)
+        if self._indexed_lists:
+            return self._client.zscore(self._members_name(name), data) is not None
+        # Stops at the first match
+        return self._client.lpos(name, data) is not None
 
     def list_find_all(
         self, id: Optional[Union[UUID, str]], data: Union[str, bytes]
     ) -> List[int]:
+        """Indices of data in the list, with indexed lists the list is only scanned if it is there"""
+        if self._indexed_lists and not self.list_has(id, data):
+            return []
         name = self._name(id)
-        return self._db.lpos(name, data, count=0)
+        return self._client.lpos(name, data, count=0)
 
     def list_set(
         self, id: Optional[Union[UUID, str]], index: int, data: Union[str, bytes]
     ) -> bool:
         name = self._name(id)
-        return self._db.lset(name, index, data)
+        if self._indexed_lists:
+            return self._write_script(
+                redis_scripts.INDEXED_SET,
+                [name, self._members_name(name)],
+                [index, data],
+            )
+        return self._write("lset", name, index, data)
 
     def list_push(self, id: Optional[Union[UUID, str]], data: Union[str, bytes]) -> int:
         name = self._name(id)
-        return self._db.lpush(name, data)
+        self._created(name)
+        if self._indexed_lists:
+            return self._write_script(
+                redis_scripts.INDEXED_PUSH, [name, self._members_name(name)], [data]
+            )
+        return self._write("lpush", name, data)
 
     def list_push_entity(self, id: Optional[Union[UUID, str]], obj: Dict) -> int:
         return self.list_push(id, to_json(obj))
 
     def list_pop(self, id: Optional[Union[UUID, str]]) -> Optional[bytes]:
         name = self._name(id)
-        return self._db.lpop(name)
+        if self._indexed_lists:
+            return self._indexed_pop(name, "LPOP")
+        return self._client.lpop(name)
 
     def list_pop_entity(self, id: Optional[Union[UUID, str]]) -> Optional[Dict]:
         return from_json(self.list_pop(id))
 
+    def list_push_unless_claimed(
+        self,
+        id: Optional[Union[UUID, str]],
+        data: Union[str, bytes],
+        claim_id: Optional[Union[UUID, str]],
+        claim: str,
+        ttl: float,
+    ) -> Optional[bytes]:
+        """
+        Pushes data unless the key of claim_id holds a claim already, in which case that claim is returned.
+        The claim expires after ttl seconds and it is set atomically with the push.
+        """
+        name = self._name(id)
+        claim_name = self._name(claim_id)
+        self._created(name, claim_name)
+        keys = [name, claim_name]
+        if self._indexed_lists:
+            keys.append(self._members_name(name))
+        return redis_scripts.PUSH_UNLESS_CLAIMED(
+            self._db, keys, [data, claim, _ttl_millis(ttl)]
+        )
+
+    def delete_if_equals(self, id: Optional[Union[UUID, str]], value: str) -> bool:
+        return bool(redis_scripts.DELETE_IF_EQUALS(self._db, [self._name(id)], [value]))
+
+    def list_move_many(
+        self,
+        id: Optional[Union[UUID, str]],
+        destination_id: Optional[Union[UUID, str]],
+        count: int,
+    ) -> List[bytes]:
+        """
+        Pops up to count of the oldest items and pushes them onto the list of destination_id in one step,
+        returns the items moved, oldest first.
+        """
+        names = [self._name(id), self._name(destination_id)]
+        self._created(names[1])
+        if self._indexed_lists:
+            names.extend([self._members_name(name) for name in names])
+        return redis_scripts.MOVE_LIST_ITEMS(self._db, names, [count])
+
+    def list_pop_last(self, id: Optional[Union[UUID, str]]) -> Optional[bytes]:
+        name = self._name(id)
+        if self._indexed_lists:
+            return self._indexed_pop(name, "RPOP")
+        return self._client.rpop(name)
+
+    def _indexed_pop(self, name: str, command: str) -> Optional[bytes]:
+        return redis_scripts.INDEXED_POP(
+            self._db, [name, self._members_name(name)], [command]
+        )
+
+    def list_blocking_pop_last(
+        self, ids: List[Optional[Union[UUID, str]]], timeout: float
+    ) -> Optional[Tuple[int, bytes]]:
+        """
+        Pops the oldest item of the first non-empty list, in the given order of ids.
+        Returns the index of the list it was popped from along with the item.
+        """
+        names = [self._name(id) for id in ids]
+        result = self._blocking("brpop", names, timeout=timeout)
+        if result is None:
+            return None
+        name, item = result
+        if self._indexed_lists:
+            # Not atomic with the pop, list_has may see the item a little longer
+            redis_scripts.COUNT_MEMBERS(
+                self._db, [self._members_name(name.decode())], [-1, item]
+            )
+        return names.index(name.decode()), item
+
     def get_list_length(self, id: Optional[Union[UUID, str]]) -> int:
         name = self._name(id)
-        if not self._db.exists(name):
-            return 0
+        return self._client.llen(name)
+
+    def list_replace(
+        self, id: Optional[Union[UUID, str]], data: Union[str, bytes], seconds: int
+    ):
+        """Replaces the list with a single item that expires after the given seconds"""
+        name = self._name(id)
+        self._created(name)
+        with self._batch() as pipe:
+            pipe.delete(*self._with_members(name))
+            pipe.rpush(name, data)
+            pipe.expire(name, seconds)
+            if self._indexed_lists:
+                pipe.zadd(self._members_name(name), {data: 1})
+                pipe.expire(self._members_name(name), seconds)
+
+    def list_get(self, id: Optional[Union[UUID, str]], index: int) -> Optional[bytes]:
+        name = self._name(id)
+        return self._client.lindex(name, index)
+
+    def list_blocking_peek_last(
+        self, id: Optional[Union[UUID, str]], timeout: float
+    ) -> Optional[bytes]:
+        """Waits for the list to have an item and returns the last one, without removing it"""
+        name = self._name(id)
+        # Rotating the list onto itself leaves it intact
+        return self._blocking("brpoplpush", name, name, timeout=timeout)
+
+    def _blocking(self, command: str, *args, timeout: float) -> Any:
+        """Runs a blocking command, rounding timeout up to whole seconds only for servers older than Redis 6"""
+        *fractional, whole = _blocking_timeouts(self._db, timeout)
+        if fractional:
+            try:
+                return getattr(self._client, command)(*args, timeout=fractional[0])
+            except redis.ResponseError as e:
+                if not _rejects_fractional_timeout(self._db, e):
+                    raise
+        return getattr(self._client, command)(*args, timeout=whole)
 
-        return self._db.llen(name)
+    def get_list_lengths(self, ids: List[Optional[Union[UUID, str]]]) -> List[int]:
+        with self._db.pipeline(transaction=False) as pipe:
+            for id in ids:
+                pipe.llen(self._name(id))
+            return pipe.execute()
+
+    def get_list_items(
+        self, ids: Sequence[Optional[Union[UUID, str]]], index: int
+    ) -> List[Optional[bytes]]:
+        """Item at index of each of the lists, in a single round trip"""
+        with self._db.pipeline(transaction=False) as pipe:
+            for id in ids:
+                pipe.lindex(self._name(id), index)
+            return pipe.execute()
 
     def iter_all_from_list(
         self,
         id: Optional[Union[UUID, str]],
-        fetch_bucket_size: int = DEFAULT_BUCKET_SIZE,
-    ) -> Iterator[Any]:
-        # TODO: The list has to be inverted
-        fetch_bucket_size = (
-            fetch_bucket_size if fetch_bucket_size > 0 else DEFAULT_BUCKET_SIZE
-        )
+        fetch_bucket_size: Optional[int] = None,
+        reverse: bool = False,
+        prefetch: bool = True,
+    ) -> Iterator[bytes]:
+        """
+        Streams the items of a list one LRANGE window at a time, oldest first as items are pushed to the head,
+        or newest first if reverse. Without a fetch_bucket_size windows are sized to about
+        DEFAULT_LIST_WINDOW_BYTES from the items seen so far. With prefetch the next window is fetched
+        on another connection while the current one is consumed.
+        Items pushed while streaming oldest first, or popped from the tail while streaming newest first,
+        do not shift the windows.
+        """
         name = self._name(id)
-        count = self.get_list_length(id)
-        if count > 0:
-            cursor = 0
-            while cursor < count:
-                delta = min(fetch_bucket_size, count - cursor)
-                items = self._db.lrange(name, -cursor, -(cursor + delta))
-                for item in items:
-                    yield item
-                cursor += delta
+        size = fetch_bucket_size if fetch_bucket_size else DEFAULT_LIST_WINDOW
+        window = self._list_window(self._client, name, 0, size, reverse)
+        if len(window) < size:
+            yield from window
+            return
+
+        # Watched reads go through the watching connection
+        prefetch = prefetch and not isinstance(
+            self._client, (redis.client.Pipeline, ClusterTransaction)
+        )
+        client = self._pooled_client if prefetch else self._client
+        pool: ContextManager[Any] = nullcontext()
+        if prefetch:
+            pool = ThreadPoolExecutor(1)
+        with pool as executor:
+            offset, item_bytes = 0, 0
+            while window:
+                offset += len(window)
+                if len(window) < size:
+                    next_window = None
+                else:
+                    if not fetch_bucket_size:
+                        item_bytes += sum(map(len, window))
+                        size = _window_size(item_bytes / offset)
+                    args = (client, name, offset, size, reverse)
+                    next_window = (
+                        executor.submit(self._list_window, *args)
+                        if prefetch
+                        else self._list_window(*args)
+                    )
+
+                yield from window
+
+                if next_window is None:
+                    return
+                window = next_window.result() if prefetch else next_window
+
+    @staticmethod
+    def _list_window(
+        client: Union[redis.Redis, redis.client.Pipeline],
+        name: str,
+        offset: int,
+        size: int,
+        reverse: bool,
+    ) -> List[bytes]:
+        items = client.lrange(name, *_window_bounds(offset, size, reverse))
+        if not reverse:
+            items.reverse()
+        return items
 
     def iter_all_entities_from_list(
         self,
         id: Optional[Union[UUID, str]],
-        fetch_bucket_size: int = DEFAULT_BUCKET_SIZE,
+        fetch_bucket_size: Optional[int] = None,
+        reverse: bool = False,
+        prefetch: bool = True,
     ) -> Iterator[Any]:
-        for item in self.iter_all_from_list(id, fetch_bucket_size=fetch_bucket_size):
+        """Like iter_all_from_list, each item is only decoded once it is reached"""
+        for item in self.iter_all_from_list(id, fetch_bucket_size, reverse, prefetch):
             yield from_json(item)
 
     def remove_from_list(self, id: Optional[Union[UUID, str]], obj: Any):
         name = self._name(id)
-        return self._db.lrem(name, 1, to_json(obj))
+        if self._indexed_lists:
+            return self._write_script(
+                redis_scripts.INDEXED_REMOVE,
+                [name, self._members_name(name)],
+                [1, to_json(obj)],
+            )
+        return self._write("lrem", name, 1, to_json(obj))
 
-    def remove_from_list_by_id(self, id: Optional[Union[UUID, str]], index: int):
-        placeholder = str(uuid4())
-        name = self._name(id)
-        self._db.lset(name, index, placeholder)
-        return self._remove_from_list(name, placeholder)
+    def remove_from_list_by_id(
+        self, id: Optional[Union[UUID, str]], index: int
+    ) -> Union[int, QueuedReply]:
+        return self.bulk_remove_from_list_by_id(id, [index])
 
     def bulk_remove_from_list_by_id(
         self, id: Optional[Union[UUID, str]], indices: List[int]
-    ):
-        placeholders: List[str] = []
+    ) -> Union[int, QueuedReply]:
+        """Removes the items at the indices in a single script, returns the number of items removed"""
+        placeholder = str(uuid4())
         name = self._name(id)
-        for index in indices:
-            random_uuid = str(uuid4())
-            self._db.lset(name, index, random_uuid)
-            placeholders.append(random_uuid)
-        count = 0
-        for placeholder in placeholders:
-            count += self._remove_from_list(name, placeholder)
-        return count
+        return self._write_script(
+            redis_scripts.REMOVE_LIST_INDICES,
+            self._with_members(name),
+            [placeholder, *indices],
+        )
 
     def get_hash(self, id: Optional[Union[UUID, str]], key: str) -> Optional[bytes]:
-        name = self._name(id)
-        return self._db.hget(name, key)
+        return self._client.hget(self._name(id), key)
 
     def set_hash(self, id: Optional[Union[UUID, str]], key: str, value: bytes) -> int:
         name = self._name(id)
-        return self._db.hset(name, key, value)
+        self._created(name)
+        return self._write("hset", name, key, value)
 
     def delete_hash(self, id: Optional[Union[UUID, str]], key: str) -> int:
         name = self._name(id)
-        return self._db.hdel(name, key)
+        return self._write("hdel", name, key)
 
     def has_hash_key(self, id: Optional[Union[UUID, str]], key: str) -> bool:
-        return self._db.hexists(self._name(id), key)
+        return self._client.hexists(self._name(id), key)
 
     def get_hash_entity(
         self, id: Optional[Union[UUID, str]], key: str
@@ -216,33 +1062,201 @@ class RedisDaoContext(BaseContext):
         return self.set_hash(id, key, to_json(value))
 
     def iterate_hash_keys(self, id: Optional[Union[UUID, str]]) -> Iterator[str]:
-        for key in self._db.hkeys(self._name(id)):
+        for key in self._client.hkeys(self._name(id)):
             yield key.decode()
 
+    def set_hash_fields(
+        self, id: Optional[Union[UUID, str]], fields: Dict[str, Any]
+    ) -> Union[int, QueuedReply]:
+        """Sets the fields with a single HSET, each value encoded as JSON"""
+        name = self._name(id)
+        self._created(name)
+        return self._write(
+            "hset", name, mapping={key: to_json(value) for key, value in fields.items()}
+        )
+
+    def get_hash_fields(
+        self, id: Optional[Union[UUID, str]], fields: Optional[List[str]] = None
+    ) -> Optional[Dict]:
+        """Decodes the given fields of a hash, or all of them, None if none of them is set"""
+        name = self._name(id)
+        if fields is None:
+            return _decode_hash(self._client.hgetall(name))
+        values = self._client.hmget(name, fields)
+        return _decode_hash(
+            {field: value for field, value in zip(fields, values) if value is not None}
+        )
+
+    def increment_hash_field(
+        self, id: Optional[Union[UUID, str]], field: str, amount: Union[int, float] = 1
+    ) -> Union[int, float, QueuedReply]:
+        """Adds amount to a numeric field atomically, returns the new value"""
+        name = self._name(id)
+        self._created(name)
+        if isinstance(amount, float):
+            return self._write("hincrbyfloat", name, field, amount)
+        return self._write("hincrby", name, field, amount)
+
+    def replace_hash_entity(
+        self,
+        obj: Dict,
+        id: Optional[Union[UUID, str]] = None,
+        ttl: Optional[int] = None,
+    ) -> Union[UUID, str]:
+        """
+        Stores obj as a hash with a field per key, the fields of the former version are dropped.
+        The hash expires after ttl seconds if given.
+        """
+        id = id if id else uuid4()
+        name = self._name(id)
+        self._created(name)
+        with self._batch() as pipe:
+            self._replace_hash(pipe, name, obj, ttl)
+        return id
+
+    def bulk_replace_hash_entities(
+        self,
+        items: Iterable[Tuple[Dict, Optional[UUID]]],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        ttl: Optional[int] = None,
+    ) -> List[UUID]:
+        """
+        Stores (obj, id) pairs as hashes, each chunk in a single MULTI/EXEC.
+        In a transaction the chunks are queued with it, unless it writes chunks apart.
+        """
+        ids = []
+        for chunk in chunked(items, chunk_size):
+            pairs = [(obj, id if id else uuid4()) for obj, id in chunk]
+            self._created(*[self._name(id) for _, id in pairs])
+            with self._batch(bulk=True) as pipe:
+                for obj, id in pairs:
+                    self._replace_hash(pipe, self._name(id), obj, ttl)
+                    ids.append(id)
+        return ids
+
+    def get_hash_entities(
+        self, ids: Iterable[Union[UUID, str]], chunk_size: int = DEFAULT_CHUNK_SIZE
+    ) -> List[Optional[Dict]]:
+        """Decodes the hashes in order with a pipeline per chunk, None for missing keys"""
+        items: List[Optional[Dict]] = []
+        for chunk in chunked(ids, chunk_size):
+            names = [self._name(id) for id in chunk]
+            fetched = dict(zip(names, self._fetch_hashes(names, self._client)))
+            items.extend(_decode_hash(fetched.get(name)) for name in names)
+        return items
+
+    def iterate_purge_pages(
+        self,
+        count: int = DEFAULT_PURGE_SCAN_COUNT,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Iterator[Tuple[List[bytes], int]]:
+        """
+        Unlinks the keys under the prefix one SCAN page at a time, with a pipeline of UNLINKs per page,
+        so Redis frees them in the background. Yields each page along with the number of keys removed.
+        Not part of a transaction, keys written during the purge may be kept.
+        """
+        for keys in self.iterate_key_pages(count):
+            if self.is_cluster:
+                removed = sum(self._per_slot("UNLINK", keys, chunk_size))
+            else:
+                with self._db.pipeline(transaction=False) as pipe:
+                    for chunk in chunked(keys, chunk_size):
+                        pipe.unlink(*chunk)
+                    removed = sum(pipe.execute())
+            yield keys, removed
+
+    def purge(
+        self,
+        count: int = DEFAULT_PURGE_SCAN_COUNT,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """Unlinks all keys under the prefix, see iterate_purge_pages, returns the number removed"""
+        return sum(
+            removed for _, removed in self.iterate_purge_pages(count, chunk_size)
+        )
+
     def cleanup(self) -> int:
-        counter = 0
-        for name in self._db.scan_iter(self._wildcard):
-            counter += self._db.delete(name)
-        return counter
+        return self.purge()
 
     def add_to_set(self, id: Optional[Union[UUID, str]], obj: Any):
         name = self._name(id)
-        self._db.sadd(name, to_json(obj))
+        self._created(name)
+        self._write("sadd", name, to_json(obj))
 
     def iterate_all_entities_from_set(
         self, id: Optional[Union[UUID, str]]
     ) -> Iterator[Any]:
         name = self._name(id)
-        for item in self._db.smembers(name):
+        for item in self._client.smembers(name):
             yield from_json(item)
 
     def get_set_length(self, id: Optional[Union[UUID, str]]):
         name = self._name(id)
-        return self._db.scard(name) if self._db.exists(name) else 0
+        return self._client.scard(name)
+
+    def add_members_to_set(
+        self, id: Optional[Union[UUID, str]], members: List[str]
+    ) -> Union[int, QueuedReply]:
+        name = self._name(id)
+        self._created(name)
+        return self._write("sadd", name, *members)
+
+    def remove_members_from_set(
+        self, id: Optional[Union[UUID, str]], members: List[str]
+    ) -> Union[int, QueuedReply]:
+        return self._write("srem", self._name(id), *members)
+
+    def iterate_set_member_pages(
+        self, id: Optional[Union[UUID, str]], count: int = DEFAULT_SCAN_COUNT
+    ) -> Iterator[List[str]]:
+        """Yields the members one SSCAN page at a time, a member may be yielded more than once"""
+        name = self._name(id)
+        cursor = None
+        while cursor != 0:
+            cursor, members = self._client.sscan(name, cursor or 0, count=count)
+            if members:
+                yield [member.decode() for member in members]
+
+    def add_to_sorted_set(
+        self, id: Optional[Union[UUID, str]], scores: Dict[str, float]
+    ) -> Union[int, QueuedReply]:
+        name = self._name(id)
+        self._created(name)
+        return self._write("zadd", name, scores)
+
+    def remove_from_sorted_set(
+        self, id: Optional[Union[UUID, str]], members: List[str]
+    ) -> Union[int, QueuedReply]:
+        return self._write("zrem", self._name(id), *members)
+
+    def iterate_sorted_set_pages(
+        self,
+        id: Optional[Union[UUID, str]],
+        min_score: float = -math.inf,
+        max_score: float = math.inf,
+        count: int = DEFAULT_SCAN_COUNT,
+    ) -> Iterator[List[str]]:
+        """Yields the members scored within the bounds in ascending order, count at a time"""
+        name = self._name(id)
+        offset = 0
+        while True:
+            members = self._client.zrangebyscore(
+                name, min_score, max_score, start=offset, num=count
+            )
+            if members:
+                yield [member.decode() for member in members]
+            if len(members) < count:
+                return
+            offset += count
 
     def set_expiration_time(self, id: Optional[Union[UUID, str]], seconds: int):
         name = self._name(id)
-        self._db.expire(name, seconds)
+        if not self._indexed_lists:
+            self._write("expire", name, seconds)
+            return
+        with self._batch() as pipe:
+            for key in self._with_members(name):
+                pipe.expire(key, seconds)
 
     def trigger_db_cleanup(self):
         try:
@@ -253,53 +1267,443 @@ class RedisDaoContext(BaseContext):
             pass
 
     def _run_transaction(self, fn: Callable, is_subcontext: bool = False) -> Any:
-        if is_subcontext:
-            return fn()
-        else:
-            return self._db.transaction(
-                lambda *args, **kwargs: fn(),  # TODO: What to do with the pipe? [or the rest of the args?]
-                value_from_callable=self.value_from_callable,
-                shard_hint=self.shard_hint,
-                watches=self.watches,
-                watch_delay=self.watch_delay,
-            )
+        if is_subcontext or self.in_transaction:
+            self._transaction.depth += 1
+            try:
+                return fn()
+            finally:
+                self._transaction.depth -= 1
 
+        pipe = (
+            ClusterTransaction(self._db)
+            if self.is_cluster
+            else self._db.pipeline(shard_hint=self.shard_hint)
+        )
+        with pipe:
+            while True:
+                self._transaction.begin(pipe)
+                try:
+                    if self.watches:
+                        self.watch(*self.watches)
+                    result = fn()
+                    replies = pipe.execute()
+                    for callback in self._transaction.commit_callbacks:
+                        callback()
+                    return self._result(result, replies)
+                except redis.WatchError:
+                    if self.watch_delay is not None and self.watch_delay > 0:
+                        time.sleep(self.watch_delay)
+                finally:
+                    self._transaction.end()
+
+
+class StorageMode(enum.Enum):
+    # A single string holding the entity as JSON
+    JSON = "json"
+    # A hash with a JSON encoded value per field, so fields can be read and updated on their own
+    HASH = "hash"
+
+
+@dataclass(frozen=True)
+class Index:
+    """
+    Secondary index of an entity field, kept under "<key_prefix>.idx".
+    A set of ids per value, or if ordered a sorted set of ids scored by the numeric value.
+    """
+
+    field: str
+    ordered: bool = False
+
+
+class _EntityMapping:
+    """Conversion of entities to and from what is stored, shared by the sync and async DAOs"""
+
+    _schema: Schema
+    _storage: StorageMode
+    _codec: Optional[EntityCodec]
+
+    @property
+    def storage(self) -> StorageMode:
+        return self._storage
+
+    @property
+    def codec(self) -> Optional[EntityCodec]:
+        return self._codec
+
+    def _load_all(self, items: Sequence[Dict]) -> List[BaseEntity]:
+        """Decodes the items with a single schema pass"""
+        if self._codec is not None:
+            return [self._codec.from_dict(item) for item in items]
+        return self._schema.load(items, many=True)
+
+    def _load_many(self, items: Sequence[Optional[Dict]]) -> List[Optional[BaseEntity]]:
+        """Like _load_all, keeping the gaps"""
+        entities = iter(self._load_all([item for item in items if item]))
+        return [next(entities) if item else None for item in items]
+
+    def _to_dict(self, obj: BaseEntity) -> Dict:
+        return self._codec.to_dict(obj) if self._codec else obj.to_dict()
+
+    def _from_dict(self, data: Dict) -> BaseEntity:
+        return self._codec.from_dict(data) if self._codec else self._schema.load(data)
+
+    def _decode_field(self, field: str, data: Dict) -> Any:
+        if self._codec is not None:
+            return self._codec.decode_field(field, data[field])
+        return self._schema.fields[field].deserialize(data[field])
+
+    def _field_names(self) -> List[str]:
+        return self._codec.fields if self._codec else list(self._schema.fields)
+
+    def _check_fields(self, fields: Iterable[str]):
+        if self._storage != StorageMode.HASH:
+            raise ValueError(f"Fields can only be updated in {StorageMode.HASH}")
+        unknown = set(fields) - set(self._field_names())
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)}")
+
+
+class BaseRedisDao(_EntityMapping, AbstractDao):
+    # Policies of subclasses, applied on write.
+    # Seconds an entity is kept after its last write, cached entities may outlive it by the cache ttl.
+    default_ttl: Optional[int] = None
+    # Entities kept at most, the least recently written ones beyond it are deleted after each write.
+    # Their write times are kept in a sorted set under "<key_prefix>.entries".
+    max_entries: Optional[int] = None
 
-class BaseRedisDao(AbstractDao):
     def __init__(
         self,
-        db_pool: redis.ConnectionPool,
-        schema: Type[Schema],
+        db_pool: Union[redis.ConnectionPool, redis.RedisCluster],
+        schema: Schema,
         key_prefix: str = "",
+        cache: Optional[EntityCache] = None,
+        sync_cache: bool = True,
+        storage: StorageMode = StorageMode.JSON,
+        indexes: Sequence[Index] = (),
+        codec: Optional[EntityCodec] = None,
+        key_layout: Optional[KeyLayout] = None,
+        indexed_lists: bool = False,
+        bloom_filter: Optional[BloomFilter] = None,
     ):
+        """
+        With a cache, decoded entities are kept in process and writes through the DAO evict them.
+        If sync_cache is set, evictions are also published on the invalidation channel,
+        and a thread evicts the ones published by other processes, it keeps a connection of the pool.
+        Indexes are updated in the transaction of the writes, see find_by and range_by.
+        With a codec entities are converted by it instead of dataclasses_json and the schema.
+        Instead of a pool a RedisCluster may be given, its keys are laid out by id unless key_layout says otherwise.
+        Indexes and max_entries need KeyLayout.PREFIX in a cluster, as they are written along with any entity.
+        indexed_lists and bloom_filter are passed on to the contexts, see RedisDaoContext.
+        Entities stored before the bloom_filter existed are only added by rebuild_bloom_filter,
+        which scans all keys, so it is left to the caller to run it once.
+        """
         super().__init__(schema, key_prefix)
-        self._db_pool: redis.ConnectionPool = db_pool
+        self._db_pool = db_pool
+        self._is_cluster = isinstance(db_pool, redis.RedisCluster)
+        if key_layout is None:
+            key_layout = KeyLayout.ID if self._is_cluster else KeyLayout.PLAIN
+        self._key_layout = key_layout
+        if key_layout == KeyLayout.PREFIX:
+            self._key_prefix = hash_tag(key_prefix)
+        self._cache = cache
+        self._storage = storage
+        self._codec = codec
+        self._dumps = codec.dumps if codec else to_json
+        self._loads = codec.loads if codec else from_json
+        self._indexes = tuple(indexes)
+        self._indexed_lists = indexed_lists
+        self._bloom_filter = bloom_filter
+        unknown = {index.field for index in self._indexes} - set(self._field_names())
+        if unknown:
+            raise ValueError(f"Indexes of unknown fields {sorted(unknown)}")
+        if (
+            self._is_cluster
+            and key_layout != KeyLayout.PREFIX
+            and (self._indexes or self.max_entries is not None)
+        ):
+            raise ValueError(
+                f"Indexes and max_entries need {KeyLayout.PREFIX} in a cluster"
+            )
+        self._invalidation_thread: Optional[redis.client.PubSubWorkerThread] = None
+        if cache is not None and sync_cache:
+            self._invalidation_thread = self._subscribe_invalidations(cache)
+
+    @property
+    def cache(self) -> Optional[EntityCache]:
+        return self._cache
+
+    @property
+    def key_layout(self) -> KeyLayout:
+        return self._key_layout
+
+    @property
+    def bloom_filter(self) -> Optional[BloomFilter]:
+        return self._bloom_filter
+
+    @property
+    def invalidation_channel(self) -> str:
+        return f"{self._key_prefix}.invalidations"
+
+    @property
+    def entries_key(self) -> str:
+        return f"{self._key_prefix}.entries"
+
+    def close(self):
+        """Stops listening to the invalidations of other processes"""
+        if self._invalidation_thread is not None:
+            self._invalidation_thread.stop()
+            self._invalidation_thread.join()
+            self._invalidation_thread = None
+
+    @property
+    def indexes(self) -> Tuple[Index, ...]:
+        return self._indexes
 
     @transactional
     def create_or_update(self, obj: BaseEntity, ctx: RedisDaoContext) -> UUID:
-        return ctx.create_or_update(obj.to_dict(), obj.id)
+        data = self._to_dict(obj)
+        previous = self._indexed_items([obj.id], ctx)
+        id = obj.id if obj.id else uuid4()
+        if self._storage == StorageMode.HASH:
+            ctx.replace_hash_entity(data, id, self.default_ttl)
+        else:
+            ctx.create_or_update(data, id, self._dumps, self.default_ttl)
+        self._reindex([(id, data)], previous, ctx)
+        self._track([id], ctx)
+        self._invalidate([id], ctx)
+        return id
 
     @transactional
     def bulk_create_or_update(
-        self, objs: Iterable[BaseEntity], ctx: RedisDaoContext
+        self,
+        objs: Iterable[BaseEntity],
+        ctx: RedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
     ) -> List[UUID]:
-        return list([ctx.create_or_update(obj.to_dict(), obj.id) for obj in objs])
+        items: Iterable[Tuple[Dict, Optional[UUID]]] = (
+            (self._to_dict(obj), obj.id) for obj in objs
+        )
+        previous = {}
+        if self._indexes:
+            items = list(items)
+            previous = self._indexed_items([id for _, id in items], ctx, chunk_size)
+
+        with ctx.chunks_apart():
+            if self._storage == StorageMode.HASH:
+                ids = ctx.bulk_replace_hash_entities(
+                    items, chunk_size, self.default_ttl
+                )
+            else:
+                ids = ctx.bulk_create_or_update(
+                    items, chunk_size, self._dumps, self.default_ttl
+                )
+        if self._indexes:
+            self._reindex(zip(ids, (data for data, _ in items)), previous, ctx)
+        self._track(ids, ctx, chunk_size)
+        self._invalidate(ids, ctx)
+        return ids
 
     @transactional
     def get_entity(
         self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext
-    ) -> BaseEntity:
-        data = ctx.get_entity(id)
-        return self._schema.load(data) if data else None
+    ) -> Optional[BaseEntity]:
+        is_cached, entity = self._cached(id, ctx)
+        if is_cached:
+            return entity
+
+        generation = self._cache.generation() if self._cache is not None else None
+        if self._storage == StorageMode.HASH:
+            data = ctx.get_hash_fields(id)
+        else:
+            data = ctx.get_entity(id, self._loads)
+        entity = self._from_dict(data) if data else None
+        self._store(id, entity, ctx, generation)
+        return entity
 
     @transactional
-    def get_all(self, ctx: RedisDaoContext) -> List[BaseEntity]:
-        return list([entity for entity in self.iterate_all(ctx)])
+    def exists(self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext) -> bool:
+        return ctx.is_exists(id)
 
     @transactional
-    def iterate_all(self, ctx: RedisDaoContext) -> Iterator[BaseEntity]:
-        for entity in ctx.iterate_all_entities():
-            yield self._schema.load(entity) if entity else None
+    def might_exist(self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext) -> bool:
+        """
+        Cheap negative check, see RedisDaoContext.might_exist, always True without a bloom_filter.
+        False means the entity does not exist, True that exists has to tell.
+        """
+        return ctx.might_exist(id)
+
+    @transactional
+    def rebuild_bloom_filter(
+        self, ctx: RedisDaoContext, count: int = DEFAULT_SCAN_COUNT
+    ) -> int:
+        """Adds the stored entities to the Bloom filter, see RedisDaoContext.rebuild_bloom_filter"""
+        return ctx.rebuild_bloom_filter(count)
+
+    @transactional
+    def get_fields(
+        self, id: Optional[Union[UUID, str]], *fields: str, ctx: RedisDaoContext
+    ) -> Optional[Dict[str, Any]]:
+        """Decodes only the given fields of an entity, None if it does not exist"""
+        is_cached, entity = self._cached(id, ctx)
+        if is_cached:
+            return {field: getattr(entity, field) for field in fields}
+
+        if self._storage == StorageMode.HASH:
+            data = ctx.get_hash_fields(id, list(fields))
+        else:
+            data = ctx.get_entity(id, self._loads)
+        if data is None:
+            return None
+        return {
+            field: None if data.get(field) is None else self._decode_field(field, data)
+            for field in fields
+        }
+
+    @transactional
+    def update_fields(
+        self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext, **changes: Any
+    ):
+        """Sets some fields of an entity stored as a hash, the others are left as they are"""
+        self._check_fields(changes)
+        previous = self._indexed_fields(id, changes, ctx)
+        ctx.set_hash_fields(id, changes)
+        self._reindex([(id, changes)], previous, ctx)
+        self._expire(id, ctx)
+        self._track([id], ctx)
+        self._invalidate([id], ctx)
+
+    @transactional
+    def increment_field(
+        self,
+        id: Optional[Union[UUID, str]],
+        field: str,
+        ctx: RedisDaoContext,
+        amount: Union[int, float] = 1,
+    ) -> Union[int, float]:
+        """Adds amount to a numeric field of an entity stored as a hash, returns the new value"""
+        self._check_fields([field])
+        previous = self._indexed_fields(id, [field], ctx)
+        # Replies queued in an outer transaction are resolved by it
+        value = cast(Union[int, float], ctx.increment_hash_field(id, field, amount))
+        if previous:
+            # Indexed from the value read, which is exact while the key is watched
+            current = (previous[str(id)] or {}).get(field) or 0
+            self._reindex([(id, {field: current + amount})], previous, ctx)
+        self._expire(id, ctx)
+        self._track([id], ctx)
+        self._invalidate([id], ctx)
+        return value
+
+    @transactional
+    def find_by(
+        self,
+        field: str,
+        value: Any,
+        ctx: RedisDaoContext,
+        count: int = DEFAULT_SCAN_COUNT,
+    ) -> Iterator[BaseEntity]:
+        """Streams the entities whose field equals value, loading count ids of the index at a time"""
+        index = self._index_of(field, ordered=False)
+        entry = self._index_entry(index, {field: value})
+        seen: Set[str] = set()
+        pages = self._index_context(ctx).iterate_set_member_pages(
+            f"{field}:{entry}", count
+        )
+        for ids in pages:
+            ids = [id for id in ids if id not in seen]
+            seen.update(ids)
+            for entity in self.get_many(ids, ctx=ctx):
+                # Entries of writes racing an unwatched read may be stale
+                if (
+                    entity is not None
+                    and self._index_entry(index, self._to_dict(entity)) == entry
+                ):
+                    yield entity
+
+    @transactional
+    def range_by(
+        self,
+        field: str,
+        ctx: RedisDaoContext,
+        min_value: Any = None,
+        max_value: Any = None,
+        count: int = DEFAULT_SCAN_COUNT,
+    ) -> Iterator[BaseEntity]:
+        """
+        Streams the entities whose field is within the inclusive bounds in ascending order of the field,
+        loading count ids of the index at a time. A bound of None is open.
+        """
+        index = self._index_of(field, ordered=True)
+        low = self._index_score(index, {field: min_value})
+        high = self._index_score(index, {field: max_value})
+        low = -math.inf if low is None else low
+        high = math.inf if high is None else high
+        pages = self._index_context(ctx).iterate_sorted_set_pages(
+            field, low, high, count
+        )
+        for ids in pages:
+            for entity in self.get_many(ids, ctx=ctx):
+                if entity is None:
+                    continue
+                score = self._index_score(index, self._to_dict(entity))
+                if score is not None and low <= score <= high:
+                    yield entity
+
+    @transactional
+    def get_many(
+        self,
+        ids: Iterable[Union[UUID, str]],
+        ctx: RedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> List[Optional[BaseEntity]]:
+        """Loads the entities in the order of ids, None for missing ones"""
+        if self._cache is None:
+            return self._load_many(self._get_items(ids, ctx, chunk_size))
+
+        ids = list(ids)
+        entities: List[Optional[BaseEntity]] = [None] * len(ids)
+        misses = []
+        for index, id in enumerate(ids):
+            is_cached, entities[index] = self._cached(id, ctx)
+            if not is_cached:
+                misses.append(index)
+
+        generation = self._cache.generation()
+        loaded = self._load_many(
+            self._get_items([ids[index] for index in misses], ctx, chunk_size)
+        )
+        for index, entity in zip(misses, loaded):
+            entities[index] = entity
+            self._store(ids[index], entity, ctx, generation)
+        return entities
+
+    @transactional
+    def get_all(
+        self, ctx: RedisDaoContext, count: int = DEFAULT_SCAN_COUNT, workers: int = 0
+    ) -> List[BaseEntity]:
+        return [
+            entity
+            for page in ctx.iterate_entity_pages(
+                count,
+                workers,
+                hashes=self._storage == StorageMode.HASH,
+                loads=self._loads,
+            )
+            for entity in self._load_all(page)
+        ]
+
+    @transactional
+    def iterate_all(
+        self, ctx: RedisDaoContext, count: int = DEFAULT_SCAN_COUNT, workers: int = 0
+    ) -> Iterator[BaseEntity]:
+        """Streams the entities, decoding them a SCAN page at a time"""
+        for page in ctx.iterate_entity_pages(
+            count,
+            workers,
+            hashes=self._storage == StorageMode.HASH,
+            loads=self._loads,
+        ):
+            yield from self._load_all(page)
 
     @transactional
     def iterate_all_keys(self, ctx: RedisDaoContext) -> Iterator[BaseEntity]:
@@ -308,12 +1712,296 @@ class BaseRedisDao(AbstractDao):
 
     @transactional
     def delete(self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext):
-        return ctx.delete(id)
+        previous = self._indexed_items([id], ctx)
+        ctx.delete(id)
+        self._reindex([(id, None)], previous, ctx)
+        self._untrack([id], ctx)
+        self._invalidate([id], ctx)
+
+    @transactional
+    def bulk_delete(
+        self,
+        ids: Iterable[Union[UUID, str]],
+        ctx: RedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        # Replies queued in an outer transaction are resolved by it
+        if self._cache is None and not self._indexes and self.max_entries is None:
+            with ctx.chunks_apart():
+                return cast(int, ctx.bulk_delete(ids, chunk_size))
+
+        ids = list(ids)
+        previous = self._indexed_items(ids, ctx, chunk_size)
+        with ctx.chunks_apart():
+            deleted = cast(int, ctx.bulk_delete(ids, chunk_size))
+        self._reindex(((id, None) for id in ids), previous, ctx)
+        self._untrack(ids, ctx, chunk_size)
+        self._invalidate(ids, ctx)
+        return deleted
+
+    @transactional
+    def purge(
+        self,
+        ctx: RedisDaoContext,
+        count: int = DEFAULT_PURGE_SCAN_COUNT,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> int:
+        """
+        Removes all entities along with their index entries, see RedisDaoContext.iterate_purge_pages.
+        Returns the number of entities removed.
+        """
+        start = len(self._key_prefix) + 1
+        purged = 0
+        for keys, removed in ctx.iterate_purge_pages(count, chunk_size):
+            purged += removed
+            self._invalidate([key.decode()[start:].strip("{}") for key in keys], ctx)
+        self._index_context(ctx).purge(count, chunk_size)
+        ctx.table(self.entries_key).unlink(None)
+        if self._bloom_filter is not None:
+            self._bloom_filter.clear()
+            if self._bloom_filter.key is not None:
+                ctx.table(self._bloom_filter.key).unlink(None)
+        return purged
+
+    def _get_items(
+        self, ids: Iterable[Union[UUID, str]], ctx: RedisDaoContext, chunk_size: int
+    ) -> List[Optional[Dict]]:
+        if self._storage == StorageMode.HASH:
+            return ctx.get_hash_entities(ids, chunk_size)
+        return ctx.get_entities(ids, chunk_size, self._loads)
+
+    def _index_context(self, ctx: RedisDaoContext) -> RedisDaoContext:
+        return ctx.table(f"{self._key_prefix}.idx")
+
+    def _expire(self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext):
+        """Restarts the default_ttl of an entity written field by field"""
+        if self.default_ttl:
+            ctx.set_expiration_time(id, self.default_ttl)
+
+    def _track(
+        self,
+        ids: Iterable[Optional[Union[UUID, str]]],
+        ctx: RedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        """Records the write times of ids, the entities beyond max_entries are deleted once committed"""
+        if self.max_entries is None:
+            return
+        now = time.time()
+        entries_ctx = ctx.table(self.entries_key)
+        for chunk in chunked(ids, chunk_size):
+            entries_ctx.add_to_sorted_set(None, {str(id): now for id in chunk})
+        ctx.on_commit(self._evict_excess)
+
+    def _untrack(
+        self,
+        ids: Iterable[Optional[Union[UUID, str]]],
+        ctx: RedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ):
+        if self.max_entries is None:
+            return
+        entries_ctx = ctx.table(self.entries_key)
+        for chunk in chunked(ids, chunk_size):
+            entries_ctx.remove_from_sorted_set(None, [str(id) for id in chunk])
+
+    def _evict_excess(self):
+        """
+        Deletes the least recently written entities beyond max_entries.
+        Entries of expired entities are dropped first, so they do not count.
+        """
+        min_score = time.time() - self.default_ttl if self.default_ttl else 0
+        ids = redis_scripts.POP_EXCESS_MEMBERS(
+            self._client(), [self.entries_key], [self.max_entries, min_score]
+        )
+        if ids:
+            self.bulk_delete([id.decode() for id in ids])
+
+    def _index_of(self, field: str, ordered: bool) -> Index:
+        for index in self._indexes:
+            if index.field == field and index.ordered == ordered:
+                return index
+        kind = "ordered index" if ordered else "index"
+        raise ValueError(f"There is no {kind} of {field}")
+
+    @classmethod
+    def _index_entry(
+        cls, index: Index, data: Optional[Dict]
+    ) -> Optional[Union[str, float]]:
+        """Value or score the entity is indexed by, None if it is not"""
+        if index.ordered:
+            return cls._index_score(index, data)
+        if data is None or index.field not in data:
+            return None
+        # Normalized through JSON, so decoded and dumped values compare equal
+        return to_json(data[index.field]).decode()
+
+    @staticmethod
+    def _index_score(index: Index, data: Optional[Dict]) -> Optional[float]:
+        """Score of the entity in an ordered index, None if it is not indexed"""
+        if data is None or index.field not in data:
+            return None
+        value = from_json(to_json(data[index.field]))
+        return None if value is None else float(value)
+
+    def _indexed_items(
+        self,
+        ids: Iterable[Optional[Union[UUID, str]]],
+        ctx: RedisDaoContext,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Dict[str, Dict]:
+        """
+        Current data of the entities about to be written, for their index entries to be replaced.
+        Their keys are watched if the transaction has not written anything yet.
+        """
+        if not self._indexes:
+            return {}
+        keys = [str(id) for id in ids if id]
+        if not keys:
+            return {}
+        if ctx.can_watch:
+            ctx.watch(*keys)
+        items = self._get_items(keys, ctx, chunk_size)
+        return {key: item for key, item in zip(keys, items) if item}
+
+    def _indexed_fields(
+        self,
+        id: Optional[Union[UUID, str]],
+        fields: Iterable[str],
+        ctx: RedisDaoContext,
+    ) -> Dict[str, Optional[Dict]]:
+        """Current values of the indexed ones among fields, like _indexed_items"""
+        indexed = [index.field for index in self._indexes if index.field in fields]
+        if not indexed:
+            return {}
+        if ctx.can_watch:
+            ctx.watch(id)
+        return {str(id): ctx.get_hash_fields(id, indexed)}
+
+    def _reindex(
+        self,
+        items: Iterable[Tuple[Optional[Union[UUID, str]], Optional[Dict]]],
+        previous: Mapping[str, Optional[Dict]],
+        ctx: RedisDaoContext,
+    ):
+        """Queues the moves of (id, data) pairs between index entries, data is None for deleted entities"""
+        if not self._indexes:
+            return
+
+        index_ctx = self._index_context(ctx)
+        for id, data in items:
+            id = str(id)
+            for index in self._indexes:
+                old = self._index_entry(index, previous.get(id))
+                new = self._index_entry(index, data)
+                if old == new:
+                    continue
+                if index.ordered:
+                    if new is None:
+                        index_ctx.remove_from_sorted_set(index.field, [id])
+                    else:
+                        index_ctx.add_to_sorted_set(index.field, {id: float(new)})
+                    continue
+                if old is not None:
+                    index_ctx.remove_members_from_set(f"{index.field}:{old}", [id])
+                if new is not None:
+                    index_ctx.add_members_to_set(f"{index.field}:{new}", [id])
+
+    def _cached(
+        self, id: Optional[Union[UUID, str]], ctx: RedisDaoContext
+    ) -> Tuple[bool, Optional[BaseEntity]]:
+        # Watched reads and the keys written by the transaction have to go to Redis
+        if self._cache is None or ctx.is_watching or ctx.has_written(id):
+            return False, None
+        return self._cache.get(id)
+
+    def _store(
+        self,
+        id: Optional[Union[UUID, str]],
+        entity: Optional[BaseEntity],
+        ctx: RedisDaoContext,
+        generation: Optional[int],
+    ):
+        """Caches an entity loaded since generation, see EntityCache.put"""
+        if (
+            self._cache is None
+            or entity is None
+            or ctx.is_watching
+            or ctx.has_written(id)
+        ):
+            return
+        self._cache.put(id, entity, generation)
+
+    def _invalidate(
+        self, ids: Iterable[Optional[Union[UUID, str]]], ctx: RedisDaoContext
+    ):
+        """Evicts the entities of ids once the writes are committed"""
+        if self._cache is None:
+            return
+
+        ids = [str(id) for id in ids]
+
+        def _evict():
+            for id in ids:
+                self._cache.invalidate(id)
+            if self._invalidation_thread is not None:
+                self._client().publish(self.invalidation_channel, to_json(ids))
+
+        ctx.on_commit(_evict)
+
+    def _subscribe_invalidations(
+        self, cache: EntityCache
+    ) -> redis.client.PubSubWorkerThread:
+        def _on_invalidation(message: Dict):
+            for id in from_json(message["data"]) or []:
+                cache.invalidate(id)
+
+        client = (
+            self._db_pool
+            if self._is_cluster
+            else redis.Redis(connection_pool=self._db_pool)
+        )
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.invalidation_channel: _on_invalidation})
+        return pubsub.run_in_thread(sleep_time=INVALIDATION_POLL_INTERVAL, daemon=True)
+
+    def _tagged(self, value: Any) -> str:
+        """value as a hash tag in a cluster, so the ids built of it share a slot"""
+        return hash_tag(value) if self._is_cluster else str(value)
 
     def _create_context(self, ctx: Optional[BaseContext] = None) -> BaseContext:
         if ctx is not None:
-            return ctx.create_sub_context(self._key_prefix)
+            return ctx.create_sub_context(
+                self._key_prefix,
+                self._key_layout,
+                self._indexed_lists,
+                self._bloom_filter,
+            )
         else:
             return RedisDaoContext(
-                redis.Redis(connection_pool=self._db_pool), self._key_prefix
+                self._client(),
+                self._key_prefix,
+                layout=self._key_layout,
+                indexed_lists=self._indexed_lists,
+                bloom_filter=self._bloom_filter,
+            )
+
+    def _client(self) -> Union[redis.Redis, redis.RedisCluster]:
+        """
+        Client of the calling thread, it keeps a connection of the pool to itself
+        so commands do not go through the pool each time. It is released when the thread ends.
+        The DAOs of a pool share the client of a thread, so a thread keeps a single connection.
+        A cluster client is shared, it has pools of its own.
+        """
+        if self._is_cluster:
+            return self._db_pool
+        clients = getattr(_THREAD_CLIENTS, "by_pool", None)
+        if clients is None:
+            clients = _THREAD_CLIENTS.by_pool = {}
+        client = clients.get(self._db_pool)
+        if client is None:
+            client = redis.Redis(
+                connection_pool=self._db_pool, single_connection_client=True
             )
+            clients[self._db_pool] = client
+        return client
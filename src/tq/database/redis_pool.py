@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Dict
+
+import redis
+
+from tq.metrics import Histogram
+
+# Seconds to wait for a free connection of a blocking pool before giving up
+DEFAULT_POOL_TIMEOUT = 20.0
+# Connections besides the one each worker thread keeps, for pipelines and transactions
+DEFAULT_SPARE_CONNECTIONS = 2
+
+
+class _InstrumentedPool:
+    """Counts checkouts and new connections, and measures the time spent waiting for a connection"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        self._metrics_lock = threading.Lock()
+        self._wait_time = Histogram()
+        self._checkouts = 0
+        self._releases = 0
+        self._created = 0
+        super().__init__(*args, **kwargs)
+
+    def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        connection = super().get_connection(command_name, *keys, **options)
+        with self._metrics_lock:
+            self._wait_time.observe(time.perf_counter() - start)
+            self._checkouts += 1
+        return connection
+
+    def release(self, connection):
+        super().release(connection)
+        with self._metrics_lock:
+            self._releases += 1
+
+    def make_connection(self):
+        connection = super().make_connection()
+        with self._metrics_lock:
+            self._created += 1
+        return connection
+
+    def stats(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {
+                "checkouts": self._checkouts,
+                "in_use": self._checkouts - self._releases,
+                "created": self._created,
+                "wait_time": self._wait_time.summary(),
+            }
+
+
+class InstrumentedConnectionPool(_InstrumentedPool, redis.ConnectionPool):
+    pass
+
+
+class InstrumentedBlockingConnectionPool(
+    _InstrumentedPool, redis.BlockingConnectionPool
+):
+    pass
+
+
+def create_worker_pool(
+    num_of_workers: int,
+    timeout: float = DEFAULT_POOL_TIMEOUT,
+    spare_connections: int = DEFAULT_SPARE_CONNECTIONS,
+    synced_caches: int = 0,
+    **connection_kwargs,
+) -> InstrumentedBlockingConnectionPool:
+    """
+    Blocking pool sized for the workers of a JobManager, see JobManager.num_of_workers.
+    Each thread keeps a single connection for the calls of all the DAOs of the pool,
+    and may take another one for a transaction or pipeline.
+    synced_caches is the number of DAOs with a cache and sync_cache set,
+    each holds a connection for its subscription to the invalidations.
+    """
+    return InstrumentedBlockingConnectionPool(
+        max_connections=2 * num_of_workers + synced_caches + spare_connections,
+        timeout=timeout,
+        **connection_kwargs,
+    )
@@ -0,0 +1,233 @@
+from typing import Any, Optional, Sequence, Union
+
+import redis
+import redis.asyncio
+from redis.commands.core import AsyncScript, Script
+
+from tq.database.redis_cluster import ClusterTransaction
+
+# https://redis.io/docs/interact/programmability/eval-intro/
+
+
+class LuaScript:
+    """
+    Lua script sent with EVALSHA, it is loaded into the script cache of a server the first time it is missing.
+    Scripts run atomically, when given a pipeline they are queued along with its other commands.
+    """
+
+    def __init__(self, source: str) -> None:
+        self._source = source
+        self._script: Optional[Script] = None
+        self._async_script: Optional[AsyncScript] = None
+
+    @property
+    def source(self) -> str:
+        return self._source
+
+    def __call__(
+        self,
+        client: Union[redis.Redis, redis.client.Pipeline, ClusterTransaction],
+        keys: Sequence[str],
+        args: Sequence[Any] = (),
+    ) -> Any:
+        if isinstance(client, ClusterTransaction):
+            # Queued on the node of the transaction, where the script is loaded on execute
+            client = client.pipeline_of(keys[0])
+        if self._script is None:
+            # The client is only needed for the encoding of the source
+            self._script = Script(client, self._source)
+        return self._script(keys=keys, args=args, client=client)
+
+    async def run_async(
+        self,
+        client: Union[redis.asyncio.Redis, redis.asyncio.client.Pipeline],
+        keys: Sequence[str],
+        args: Sequence[Any] = (),
+    ) -> Any:
+        """Runs the script with an async client, or queues it on an async pipeline"""
+        if self._async_script is None:
+            self._async_script = AsyncScript(client, self._source)
+        return await self._async_script(keys=keys, args=args, client=client)
+
+
+# Membership index of a list, a sorted set scored by the number of times each item is in the list.
+# Adds amount to the count of item, items counted down to 0 are removed.
+_COUNT_MEMBER = """
+local function count_member(index, item, amount)
+    if tonumber(redis.call('ZINCRBY', index, amount, item)) <= 0 then
+        redis.call('ZREM', index, item)
+    end
+end
+"""
+
+# KEYS: index | ARGV: amount, items...
+# Adds amount to the counts of the items in a membership index.
+COUNT_MEMBERS = LuaScript(
+    _COUNT_MEMBER
+    + """
+for i = 2, #ARGV do
+    count_member(KEYS[1], ARGV[i], ARGV[1])
+end
+return #ARGV - 1
+"""
+)
+
+# KEYS: list, index | ARGV: items...
+# LPUSH of the items, which are counted in the membership index. Returns the length of the list.
+INDEXED_PUSH = LuaScript(
+    _COUNT_MEMBER
+    + """
+local length = 0
+for i = 1, #ARGV do
+    length = redis.call('LPUSH', KEYS[1], ARGV[i])
+    count_member(KEYS[2], ARGV[i], 1)
+end
+return length
+"""
+)
+
+# KEYS: list, index | ARGV: LPOP or RPOP
+# Pops an item off the list and off the membership index, returns the item.
+INDEXED_POP = LuaScript(
+    _COUNT_MEMBER
+    + """
+local item = redis.call(ARGV[1], KEYS[1])
+if item then
+    count_member(KEYS[2], item, -1)
+end
+return item
+"""
+)
+
+# KEYS: list, index | ARGV: count, item
+# LREM which keeps the membership index, returns the number of items removed.
+INDEXED_REMOVE = LuaScript(
+    _COUNT_MEMBER
+    + """
+local removed = redis.call('LREM', KEYS[1], ARGV[1], ARGV[2])
+if removed > 0 then
+    count_member(KEYS[2], ARGV[2], -removed)
+end
+return removed
+"""
+)
+
+# KEYS: list, index | ARGV: position, item
+# LSET which keeps the membership index.
+INDEXED_SET = LuaScript(
+    _COUNT_MEMBER
+    + """
+local previous = redis.call('LINDEX', KEYS[1], ARGV[1])
+local reply = redis.call('LSET', KEYS[1], ARGV[1], ARGV[2])
+count_member(KEYS[2], previous, -1)
+count_member(KEYS[2], ARGV[2], 1)
+return reply
+"""
+)
+
+# KEYS: list, [index] | ARGV: placeholder, indices...
+# Replaces the items at the indices with a placeholder and removes them all at once,
+# returns the number of items removed. Indices out of range are skipped.
+# The items removed are counted down in the membership index, if given.
+REMOVE_LIST_INDICES = LuaScript(
+    _COUNT_MEMBER
+    + """
+local length = redis.call('LLEN', KEYS[1])
+local marked = 0
+for i = 2, #ARGV do
+    local index = tonumber(ARGV[i])
+    if index < 0 then
+        index = length + index
+    end
+    if index >= 0 and index < length then
+        local item = redis.call('LINDEX', KEYS[1], index)
+        if item ~= ARGV[1] then
+            if KEYS[2] then
+                count_member(KEYS[2], item, -1)
+            end
+            redis.call('LSET', KEYS[1], index, ARGV[1])
+            marked = marked + 1
+        end
+    end
+end
+if marked == 0 then
+    return 0
+end
+return redis.call('LREM', KEYS[1], 0, ARGV[1])
+"""
+)
+
+# KEYS: list, claim, [index] | ARGV: item, claim, ttl in milliseconds
+# Pushes the item unless the claim key is set, in which case its value is returned.
+# The item is counted in the membership index, if given.
+PUSH_UNLESS_CLAIMED = LuaScript(
+    _COUNT_MEMBER
+    + """
+local existing = redis.call('GET', KEYS[2])
+if existing then
+    return existing
+end
+redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+redis.call('LPUSH', KEYS[1], ARGV[1])
+if KEYS[3] then
+    count_member(KEYS[3], ARGV[1], 1)
+end
+return false
+"""
+)
+
+# KEYS: key | ARGV: value
+# Deletes the key if it holds value, returns 1 if it was deleted.
+DELETE_IF_EQUALS = LuaScript(
+    """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+)
+
+# KEYS: source, destination, [source index, destination index] | ARGV: count
+# Pops up to count of the oldest items of source and pushes them onto destination,
+# as that many RPOPLPUSH would. Returns the items moved, oldest first, none if count is not positive.
+# The items are moved between the membership indexes, if given.
+MOVE_LIST_ITEMS = LuaScript(
+    _COUNT_MEMBER
+    + """
+local count = tonumber(ARGV[1])
+if count <= 0 then
+    return {}
+end
+local items = redis.call('LRANGE', KEYS[1], -count, -1)
+if #items == 0 then
+    return items
+end
+redis.call('LTRIM', KEYS[1], 0, -#items - 1)
+local moved = {}
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[2], items[i])
+    if KEYS[3] then
+        count_member(KEYS[3], items[i], -1)
+        count_member(KEYS[4], items[i], 1)
+    end
+    moved[#moved + 1] = items[i]
+end
+return moved
+"""
+)
+
+# KEYS: sorted set | ARGV: max members, min score
+# Drops the members scored below min score, then pops the lowest scored ones beyond
+# max members. Returns the members popped.
+POP_EXCESS_MEMBERS = LuaScript(
+    """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[2])
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[1])
+if excess <= 0 then
+    return {}
+end
+local popped = redis.call('ZRANGE', KEYS[1], 0, excess - 1)
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, excess - 1)
+return popped
+"""
+)
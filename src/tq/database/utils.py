@@ -1,7 +1,8 @@
 import datetime
+import itertools
 import json
 from enum import Enum
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, List, Optional, TypeVar
 from uuid import UUID
 
 import redis
@@ -34,4 +35,16 @@ def from_json(_json: Optional[bytes]) -> Optional[Any]:
     return json.loads(_json.decode()) if _json else None
 
 
+T = TypeVar("T")
+
+
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 # TODO: Transactional
@@ -0,0 +1,413 @@
+import bisect
+import collections
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from sub-millisecond hand-offs up to minute long handlers
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+DEFAULT_RATE_WINDOW = 60.0
+DEFAULT_EXPORT_INTERVAL = 15.0
+
+
+class Histogram:
+    """Counts observations into fixed buckets, quantiles are interpolated within a bucket"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self._bounds: List[float] = sorted(buckets) + [math.inf]
+        self._counts: List[int] = [0] * len(self._bounds)
+        self._count = 0
+        self._sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._count += 1
+        self._sum += value
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """Cumulative counts of observations less than or equal to each bound"""
+        cumulative, total = [], 0
+        for bound, count in zip(self._bounds, self._counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def quantile(self, q: float) -> float:
+        if not self._count:
+            return 0.0
+
+        rank = q * self._count
+        lower, below = 0.0, 0
+        for bound, cumulative in self.buckets():
+            if cumulative >= rank:
+                if math.isinf(bound):
+                    # Nothing is known above the last bound
+                    return lower
+                in_bucket = cumulative - below
+                return lower + (bound - lower) * (rank - below) / in_bucket
+            lower, below = bound, cumulative
+        return lower
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self._count,
+            "sum": self._sum,
+            "mean": self._sum / self._count if self._count else 0.0,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": self.buckets(),
+        }
+
+
+class RateMeter:
+    """Events per second over a sliding window, counted in one second bins"""
+
+    def __init__(self, window: float = DEFAULT_RATE_WINDOW) -> None:
+        self._window = window
+        self._bins: Deque[List[int]] = collections.deque()
+        self._started_at = time.monotonic()
+
+    def mark(self, count: int = 1):
+        second = int(time.monotonic())
+        if self._bins and self._bins[-1][0] == second:
+            self._bins[-1][1] += count
+        else:
+            self._bins.append([second, count])
+        self._expire(second)
+
+    @property
+    def rate(self) -> float:
+        now = time.monotonic()
+        self._expire(int(now))
+        elapsed = min(now - self._started_at, self._window)
+        if elapsed <= 0:
+            return 0.0
+        return sum(count for _, count in self._bins) / elapsed
+
+    def _expire(self, second: int):
+        while self._bins and self._bins[0][0] <= second - self._window:
+            self._bins.popleft()
+
+
+class _TaskTypeMetrics:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.enqueued = 0
+        self.dequeued = 0
+        self.failed = 0
+        self.time_in_queue = Histogram(buckets)
+        self.handler_time = Histogram(buckets)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "failed": self.failed,
+            "time_in_queue": self.time_in_queue.summary(),
+            "handler_time": self.handler_time.summary(),
+        }
+
+
+class TaskMetrics:
+    """Enqueue and dequeue rates, time spent in queue and in handlers, and failures per task type"""
+
+    def __init__(
+        self,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        rate_window: float = DEFAULT_RATE_WINDOW,
+    ) -> None:
+        self._buckets = buckets
+        self._task_types: Dict[str, _TaskTypeMetrics] = {}
+        self._enqueue_rate = RateMeter(rate_window)
+        self._dequeue_rate = RateMeter(rate_window)
+        self._lock = threading.Lock()
+
+    def task_enqueued(self, task: Any):
+        with self._lock:
+            self._of(task).enqueued += 1
+            self._enqueue_rate.mark()
+
+    def task_dequeued(self, task: Any):
+        """Also records the time the task spent in queue, if it was stamped when posted"""
+        enqueued_at = getattr(task, "enqueued_at", None)
+        with self._lock:
+            metrics = self._of(task)
+            metrics.dequeued += 1
+            if enqueued_at is not None:
+                metrics.time_in_queue.observe(max(time.time() - enqueued_at, 0.0))
+            self._dequeue_rate.mark()
+
+    def handler_finished(self, task: Any, seconds: float, is_failed: bool = False):
+        with self._lock:
+            metrics = self._of(task)
+            metrics.handler_time.observe(seconds)
+            if is_failed:
+                metrics.failed += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enqueue_rate": self._enqueue_rate.rate,
+                "dequeue_rate": self._dequeue_rate.rate,
+                "tasks": {
+                    name: metrics.snapshot()
+                    for name, metrics in self._task_types.items()
+                },
+            }
+
+    def _of(self, task: Any) -> _TaskTypeMetrics:
+        name = type(task).__name__
+        if name not in self._task_types:
+            self._task_types[name] = _TaskTypeMetrics(self._buckets)
+        return self._task_types[name]
+
+
+def _labels(**labels) -> str:
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+    return (
+        "{"
+        + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items())
+        + "}"
+    )
+
+
+def _bound(value: float) -> str:
+    return "+Inf" if math.isinf(value) else repr(float(value))
+
+
+def render_prometheus(stats: Dict[str, Any]) -> str:
+    """
+    Renders TaskDispatcher.stats() in the Prometheus text exposition format,
+    along with the stats of a connection pool under "redis_pool"
+    and those of entity caches by DAO name under "entity_caches" if present.
+    """
+    queue = stats["queue"]
+    lines = [
+        "# HELP tq_queue_depth Number of pending tasks",
+        "# TYPE tq_queue_depth gauge",
+        f"tq_queue_depth{_labels(queue=queue)} {stats['depth']}",
+        "# HELP tq_queue_pressure Queue depth relative to the high-water mark",
+        "# TYPE tq_queue_pressure gauge",
+        f"tq_queue_pressure{_labels(queue=queue)} {stats['pressure']}",
+    ]
+
+    tasks = stats["tasks"]
+    for counter, help_text in [
+        ("enqueued", "Tasks posted to the queue"),
+        ("dequeued", "Tasks fetched from the queue"),
+        ("failed", "Tasks whose handler raised or returned a failed result"),
+    ]:
+        lines.append(f"# HELP tq_tasks_{counter}_total {help_text}")
+        lines.append(f"# TYPE tq_tasks_{counter}_total counter")
+        for task_type, metrics in tasks.items():
+            labels = _labels(queue=queue, task_type=task_type)
+            lines.append(f"tq_tasks_{counter}_total{labels} {metrics[counter]}")
+
+    for histogram, help_text in [
+        ("time_in_queue", "Time from posting a task until it is fetched"),
+        ("handler_time", "Time spent in the handlers of a task"),
+    ]:
+        name = f"tq_task_{histogram}_seconds"
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for task_type, metrics in tasks.items():
+            lines.extend(
+                _histogram_lines(
+                    name, metrics[histogram], queue=queue, task_type=task_type
+                )
+            )
+
+    if "redis_pool" in stats:
+        lines.extend(_pool_lines(stats["redis_pool"]))
+    if "entity_caches" in stats:
+        lines.extend(_cache_lines(stats["entity_caches"]))
+
+    return "\n".join(lines) + "\n"
+
+
+def _histogram_lines(name: str, summary: Dict[str, Any], **labels) -> List[str]:
+    lines = [
+        f"{name}_bucket{_labels(**labels, le=_bound(bound))} {count}"
+        for bound, count in summary["buckets"]
+    ]
+    lines.append(f"{name}_sum{_labels(**labels)} {summary['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {summary['count']}")
+    return lines
+
+
+def _pool_lines(pool: Dict[str, Any]) -> List[str]:
+    """Stats of an instrumented connection pool, see tq.database.redis_pool"""
+    return [
+        "# HELP tq_redis_pool_checkouts_total Connections taken from the pool",
+        "# TYPE tq_redis_pool_checkouts_total counter",
+        f"tq_redis_pool_checkouts_total {pool['checkouts']}",
+        "# HELP tq_redis_pool_connections_created_total Connections opened by the pool",
+        "# TYPE tq_redis_pool_connections_created_total counter",
+        f"tq_redis_pool_connections_created_total {pool['created']}",
+        "# HELP tq_redis_pool_connections_in_use Connections currently taken from the pool",
+        "# TYPE tq_redis_pool_connections_in_use gauge",
+        f"tq_redis_pool_connections_in_use {pool['in_use']}",
+        "# HELP tq_redis_pool_wait_seconds Time spent waiting for a connection",
+        "# TYPE tq_redis_pool_wait_seconds histogram",
+        *_histogram_lines("tq_redis_pool_wait_seconds", pool["wait_time"]),
+    ]
+
+
+def _cache_lines(caches: Dict[str, Dict[str, Any]]) -> List[str]:
+    """Stats of entity caches, see tq.database.entity_cache"""
+    lines = []
+    for counter, help_text in [
+        ("hits", "Entities found in the cache"),
+        ("misses", "Entities loaded from the database"),
+        ("evictions", "Entities dropped to make room"),
+    ]:
+        lines.append(f"# HELP tq_entity_cache_{counter}_total {help_text}")
+        lines.append(f"# TYPE tq_entity_cache_{counter}_total counter")
+        for dao, cache in caches.items():
+            lines.append(
+                f"tq_entity_cache_{counter}_total{_labels(dao=dao)} {cache[counter]}"
+            )
+
+    for gauge, help_text in [
+        ("size", "Entities in the cache"),
+        ("hit_ratio", "Share of lookups found in the cache"),
+    ]:
+        lines.append(f"# HELP tq_entity_cache_{gauge} {help_text}")
+        lines.append(f"# TYPE tq_entity_cache_{gauge} gauge")
+        for dao, cache in caches.items():
+            lines.append(f"tq_entity_cache_{gauge}{_labels(dao=dao)} {cache[gauge]}")
+    return lines
+
+
+class PrometheusExporter:
+    """
+    Publishes the stats of a dispatcher in Prometheus text format,
+    rewritten into a file every interval seconds (for a textfile collector) and/or served on a local port.
+    """
+
+    def __init__(
+        self,
+        stats: Callable[[], Dict[str, Any]],
+        path: Optional[str] = None,
+        port: Optional[int] = None,
+        host: str = "127.0.0.1",
+        interval: float = DEFAULT_EXPORT_INTERVAL,
+    ) -> None:
+        if path is None and port is None:
+            raise ValueError("Either a path or a port is needed")
+
+        self._stats = stats
+        self._path = path
+        self._interval = interval
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._server: Optional[ThreadingHTTPServer] = None
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), self._handler_class())
+
+    @property
+    def port(self) -> Optional[int]:
+        return self._server.server_address[1] if self._server else None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *a, **w):
+        self.stop()
+
+    def render(self) -> str:
+        return render_prometheus(self._stats())
+
+    def write(self):
+        """Replaces the file atomically, so collectors never read a partial file"""
+        directory = os.path.dirname(os.path.abspath(self._path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(self.render())
+            os.replace(temp_path, self._path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    def start(self):
+        if self._path is not None:
+            self._threads.append(threading.Thread(target=self._write_loop, daemon=True))
+        if self._server is not None:
+            self._threads.append(
+                threading.Thread(target=self._server.serve_forever, daemon=True)
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        for thread in self._threads:
+            thread.join()
+        if self._path is not None:
+            self.write()
+
+    def _write_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.write()
+            except Exception:
+                logger.error(f"Could not write metrics to {self._path}", exc_info=True)
+            self._stop_event.wait(self._interval)
+
+    def _handler_class(self):
+        exporter = self
+
+        class _MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = exporter.render().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return _MetricsHandler
@@ -1,58 +1,499 @@
-import base64
+import asyncio
 import logging
-import pickle
+import math
+import queue
+import time
 import uuid
-from contextlib import contextmanager
+from contextlib import asynccontextmanager, contextmanager
 from dataclasses import dataclass
-from typing import Iterator
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple
 
+from tq import task_codec
 from tq.database import BaseEntity
-from tq.database.redis_dao import (
-    BaseEntity,
-    BaseRedisDao,
-    RedisDaoContext,
-    transactional,
+from tq.database.async_redis_dao import AsyncBaseRedisDao, AsyncRedisDaoContext
+from tq.database.db import AbstractFsDao, async_transactional
+from tq.database.entity_codec import codec_for
+from tq.database.redis_dao import BaseRedisDao, RedisDaoContext, transactional
+from tq.task_dispacher import (
+    DEFAULT_DEDUP_TTL,
+    DEFAULT_RESULT_TTL,
+    BaseTaskQueue,
+    BaseTaskResultStore,
+    OverflowPolicy,
+    Task,
+    TaskResult,
+    _TaskQueueMixin,
 )
-from tq.task_dispacher import BaseTaskQueue, Task
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_PAYLOAD_THRESHOLD = 1024**2
+
 
 @dataclass
 class TaskEntity(BaseEntity):
-    payload: str = ""
+    # Claim check of a payload offloaded to the payload store
+    payload_ref: Optional[str] = None
+
+
+class _TaskItems:
+    """Encoding of the queue items and their keys, shared by the sync and async queue DAOs"""
+
+    task_queue_id: uuid.UUID
+    payload_store: Optional[AbstractFsDao]
+    payload_threshold: int
+    _tagged: Callable[[Any], str]
+
+    def decode(self, item: bytes) -> Tuple[Task, Optional[str]]:
+        """Decodes a queue item, returns the task along with the reference of its offloaded payload"""
+        if item.startswith(task_codec.MAGIC):
+            return task_codec.loads(item), None
+
+        claim_check = codec_for(TaskEntity).decode(item)
+        payload_ref = claim_check.payload_ref if claim_check else None
+        if payload_ref is None:
+            raise ValueError(
+                f"Task queue {self.task_queue_id} holds an item which is neither a task nor a claim check"
+            )
+        if self.payload_store is None:
+            raise ValueError(
+                f"Task queue {self.task_queue_id} holds a claim check, but has no payload store"
+            )
+        data = self.payload_store.load_by_id(payload_ref)
+        return task_codec.loads(data), payload_ref
+
+    def discard_payload(self, payload_ref: Optional[str]):
+        if payload_ref and self.payload_store is not None:
+            self.payload_store.delete_by_id(payload_ref)
+
+    def _encode(self, task: Task) -> Tuple[bytes, Optional[str]]:
+        item = task_codec.dumps(task)
+        if self.payload_store is None or len(item) <= self.payload_threshold:
+            return item, None
+
+        payload_ref = self.payload_store.store(f"task_payload/{task.task_id}", item)
+        return (
+            codec_for(TaskEntity).encode(
+                TaskEntity(id=uuid.uuid4(), payload_ref=payload_ref)
+            ),
+            payload_ref,
+        )
 
+    def _lane_id(self, lane: int) -> str:
+        # The keys of a queue share a cluster slot, for pops across lanes and the dedup script
+        return f"{self._tagged(self.task_queue_id)}:{lane}"
 
-class RedisTaskQueueDao(BaseRedisDao):
-    def __init__(self, db_pool, task_queue_id=None):
-        super().__init__(db_pool, TaskEntity.schema(), key_prefix="task_queue")
+    def _dedup_id(self, dedup_key: str) -> str:
+        return f"{self._tagged(self.task_queue_id)}.dedup:{dedup_key}"
+
+
+class RedisTaskQueueDao(_TaskItems, BaseRedisDao):
+    def __init__(
+        self,
+        db_pool,
+        task_queue_id=None,
+        dedup_ttl=DEFAULT_DEDUP_TTL,
+        payload_store: Optional[AbstractFsDao] = None,
+        payload_threshold: int = DEFAULT_PAYLOAD_THRESHOLD,
+    ):
+        """
+        Pickled tasks larger than payload_threshold bytes are kept in payload_store, if given,
+        the queue holds a claim check of them encoded with the entity codec instead.
+        """
+        super().__init__(
+            db_pool,
+            TaskEntity.schema(),
+            key_prefix="task_queue",
+            codec=codec_for(TaskEntity),
+        )
         self.task_queue_id = task_queue_id if task_queue_id else uuid.uuid4()
+        self.dedup_ttl = dedup_ttl
+        self.payload_store = payload_store
+        self.payload_threshold = payload_threshold
+
+    def push(self, task: Task, lane: int = 0) -> Optional[uuid.UUID]:
+        """Pushes the task, returns the id of the pending task if it was a duplicate"""
+        item, payload_ref = self._encode(task)
+        if task.dedup_key is None:
+            self.push_raw(item, lane)
+            return None
 
-    def push(self, task: Task):
-        payload = base64.b64encode(pickle.dumps(task)).decode()
-        self.push_raw(payload)
+        pending_task_id = self.push_raw_unique(
+            item, lane, task.dedup_key, str(task.task_id)
+        )
+        if pending_task_id is None:
+            return None
+
+        self.discard_payload(payload_ref)
+        return uuid.UUID(pending_task_id.decode())
 
     @transactional
-    def pop(self, ctx: RedisDaoContext) -> TaskEntity:
-        task_serialized = ctx.list_pop_entity(self.task_queue_id)
-        if task_serialized:
-            task_entity: TaskEntity = self._schema.from_dict(task_serialized)
-            return pickle.loads(base64.b64decode(task_entity.payload.encode()))
+    def pop(
+        self, lanes: List[int], timeout: float, ctx: RedisDaoContext
+    ) -> Optional[Tuple[int, bytes]]:
+        """Pops from the first non-empty lane in the given order, blocks up to timeout if positive"""
+        result = None
+        if timeout > 0:
+            result = ctx.list_blocking_pop_last(
+                [self._lane_id(lane) for lane in lanes], timeout
+            )
+        else:
+            for index, lane in enumerate(lanes):
+                item = ctx.list_pop_last(self._lane_id(lane))
+                if item:
+                    result = index, item
+                    break
+
+        if result:
+            index, item = result
+            return lanes[index], item
         return None
 
     @transactional
-    def push_raw(self, payload: str, ctx: RedisDaoContext):
-        task_entity = TaskEntity(id=uuid.uuid4(), payload=payload)
-        ctx.list_push_entity(self.task_queue_id, task_entity.to_dict())
+    def push_raw(self, item: bytes, lane: int, ctx: RedisDaoContext):
+        ctx.list_push(self._lane_id(lane), item)
+
+    @transactional
+    def push_raw_unique(
+        self,
+        item: bytes,
+        lane: int,
+        dedup_key: str,
+        claim: str,
+        ctx: RedisDaoContext,
+    ) -> Optional[bytes]:
+        return ctx.list_push_unless_claimed(
+            self._lane_id(lane),
+            item,
+            self._dedup_id(dedup_key),
+            claim,
+            self.dedup_ttl,
+        )
+
+    @transactional
+    def depth(self, lanes: List[int], ctx: RedisDaoContext) -> int:
+        return sum(ctx.get_list_lengths([self._lane_id(lane) for lane in lanes]))
+
+    @transactional
+    def release(self, dedup_key: str, claim: str, ctx: RedisDaoContext) -> bool:
+        return ctx.delete_if_equals(self._dedup_id(dedup_key), claim)
 
 
 class RedisTaskQueue(BaseTaskQueue):
-    def __init__(self, db_pool):
-        self._dao = RedisTaskQueueDao(db_pool)
+    def __init__(
+        self,
+        db_pool,
+        *args,
+        payload_store: Optional[AbstractFsDao] = None,
+        payload_threshold: int = DEFAULT_PAYLOAD_THRESHOLD,
+        **kwargs,
+    ):
+        """
+        Tasks larger than payload_threshold bytes are offloaded to payload_store, only a reference is queued.
+        The consumer loads the payload and deletes it once the task is acknowledged.
+        """
+        super().__init__(*args, **kwargs)
+        self._dao = RedisTaskQueueDao(
+            db_pool, self.name, self._dedup_ttl, payload_store, payload_threshold
+        )
+
+    @property
+    def is_shared(self) -> bool:
+        return True
+
+    def depth(self) -> int:
+        return self._dao.depth(list(range(self.lane_count)))
 
-    def put(self, task: Task):
-        self._dao.push(task)
+    def put(
+        self,
+        task: Task,
+        lane: Optional[int] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[uuid.UUID]:
+        """
+        The capacity is a soft limit on Redis, concurrent producers may overshoot it slightly.
+        """
+        self._make_room(overflow if overflow else self._overflow_policy, timeout)
+        pending_task_id = self._dao.push(
+            task, self.lane_of(task) if lane is None else lane
+        )
+        if task.dedup_key is not None:
+            self._count_dedup(pending_task_id is not None)
+        return pending_task_id if pending_task_id else task.task_id
 
     @contextmanager
-    def fetch_task(self) -> Iterator[Task]:
-        yield self._dao.pop()
+    def fetch_task(self, timeout: Optional[float] = None) -> Iterator[Optional[Task]]:
+        timeout = self._poll_timeout if timeout is None else timeout
+        result = self._dao.pop(self._scheduler.order(), timeout)
+        if result is None:
+            yield None
+            return
+
+        lane, item = result
+        self._scheduler.charge(lane)
+        task, payload_ref = self._dao.decode(item)
+        try:
+            yield task
+        finally:
+            self._release(task)
+            self._dao.discard_payload(payload_ref)
+
+    def _make_room(self, overflow: OverflowPolicy, timeout: Optional[float]):
+        if not self._capacity or self.depth() < self._capacity:
+            return
+
+        if overflow == OverflowPolicy.REJECT:
+            raise queue.Full(f"Task queue {self.name} is full")
+
+        if overflow == OverflowPolicy.SHED_OLDEST:
+            # The oldest task of the least urgent lane goes
+            result = self._dao.pop(list(reversed(range(self.lane_count))), 0)
+            if result is not None:
+                _, item = result
+                shed_task, payload_ref = self._dao.decode(item)
+                logger.warning(f"Task queue {self.name} is full, dropping {shed_task}")
+                self._release(shed_task)
+                self._dao.discard_payload(payload_ref)
+            return
+
+        # There is nothing to block on for free room, poll the depth with a backoff
+        for backoff in self._full_queue_backoffs(overflow, timeout):
+            if self.depth() < self._capacity:
+                return
+            time.sleep(backoff)
+
+    def _release(self, task: Task):
+        if task.dedup_key is not None:
+            self._dao.release(task.dedup_key, str(task.task_id))
+
+
+class AsyncRedisTaskQueueDao(_TaskItems, AsyncBaseRedisDao):
+    def __init__(
+        self,
+        db_pool,
+        task_queue_id=None,
+        dedup_ttl=DEFAULT_DEDUP_TTL,
+        payload_store: Optional[AbstractFsDao] = None,
+        payload_threshold: int = DEFAULT_PAYLOAD_THRESHOLD,
+    ):
+        """RedisTaskQueueDao on redis.asyncio, items and keys are the same. The payload store is not async."""
+        super().__init__(
+            db_pool,
+            TaskEntity.schema(),
+            key_prefix="task_queue",
+            codec=codec_for(TaskEntity),
+        )
+        self.task_queue_id = task_queue_id if task_queue_id else uuid.uuid4()
+        self.dedup_ttl = dedup_ttl
+        self.payload_store = payload_store
+        self.payload_threshold = payload_threshold
+
+    async def push(self, task: Task, lane: int = 0) -> Optional[uuid.UUID]:
+        """Pushes the task, returns the id of the pending task if it was a duplicate"""
+        item, payload_ref = self._encode(task)
+        if task.dedup_key is None:
+            await self.push_raw(item, lane)
+            return None
+
+        pending_task_id = await self.push_raw_unique(
+            item, lane, task.dedup_key, str(task.task_id)
+        )
+        if pending_task_id is None:
+            return None
+
+        self.discard_payload(payload_ref)
+        return uuid.UUID(pending_task_id.decode())
+
+    @async_transactional
+    async def pop(
+        self, lanes: List[int], timeout: float, ctx: AsyncRedisDaoContext
+    ) -> Optional[Tuple[int, bytes]]:
+        """Pops from the first non-empty lane in the given order, waits up to timeout if positive"""
+        result = None
+        if timeout > 0:
+            result = await ctx.list_blocking_pop_last(
+                [self._lane_id(lane) for lane in lanes], timeout
+            )
+        else:
+            for index, lane in enumerate(lanes):
+                item = await ctx.list_pop_last(self._lane_id(lane))
+                if item:
+                    result = index, item
+                    break
+
+        if result:
+            index, item = result
+            return lanes[index], item
+        return None
+
+    @async_transactional
+    async def push_raw(self, item: bytes, lane: int, ctx: AsyncRedisDaoContext):
+        await ctx.list_push(self._lane_id(lane), item)
+
+    @async_transactional
+    async def push_raw_unique(
+        self,
+        item: bytes,
+        lane: int,
+        dedup_key: str,
+        claim: str,
+        ctx: AsyncRedisDaoContext,
+    ) -> Optional[bytes]:
+        return await ctx.list_push_unless_claimed(
+            self._lane_id(lane),
+            item,
+            self._dedup_id(dedup_key),
+            claim,
+            self.dedup_ttl,
+        )
+
+    @async_transactional
+    async def depth(self, lanes: List[int], ctx: AsyncRedisDaoContext) -> int:
+        return sum(await ctx.get_list_lengths([self._lane_id(lane) for lane in lanes]))
+
+    @async_transactional
+    async def release(
+        self, dedup_key: str, claim: str, ctx: AsyncRedisDaoContext
+    ) -> bool:
+        return await ctx.delete_if_equals(self._dedup_id(dedup_key), claim)
+
+
+class AsyncRedisTaskQueue(_TaskQueueMixin):
+    """
+    RedisTaskQueue for asyncio producers and consumers, its methods are coroutines.
+    A queue of the same name is shared with RedisTaskQueue, so tasks put here can be dispatched
+    by a TaskDispatcher and the other way around. See AsyncTaskDispatcher for an asyncio consumer.
+    """
+
+    def __init__(
+        self,
+        db_pool,
+        *args,
+        payload_store: Optional[AbstractFsDao] = None,
+        payload_threshold: int = DEFAULT_PAYLOAD_THRESHOLD,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._dao = AsyncRedisTaskQueueDao(
+            db_pool, self.name, self._dedup_ttl, payload_store, payload_threshold
+        )
+
+    async def pressure(self) -> float:
+        """See BaseTaskQueue.pressure"""
+        if not self._high_water_mark:
+            return 0.0
+        return await self.depth() / self._high_water_mark
+
+    async def depth(self) -> int:
+        return await self._dao.depth(list(range(self.lane_count)))
+
+    async def put(
+        self,
+        task: Task,
+        lane: Optional[int] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[uuid.UUID]:
+        """See BaseTaskQueue.put, waiting for room only suspends the calling task"""
+        await self._make_room(overflow if overflow else self._overflow_policy, timeout)
+        pending_task_id = await self._dao.push(
+            task, self.lane_of(task) if lane is None else lane
+        )
+        if task.dedup_key is not None:
+            self._count_dedup(pending_task_id is not None)
+        return pending_task_id if pending_task_id else task.task_id
+
+    @asynccontextmanager
+    async def fetch_task(
+        self, timeout: Optional[float] = None
+    ) -> AsyncIterator[Optional[Task]]:
+        """See BaseTaskQueue.fetch_task"""
+        timeout = self._poll_timeout if timeout is None else timeout
+        result = await self._dao.pop(self._scheduler.order(), timeout)
+        if result is None:
+            yield None
+            return
+
+        lane, item = result
+        self._scheduler.charge(lane)
+        task, payload_ref = self._dao.decode(item)
+        try:
+            yield task
+        finally:
+            await self._release(task)
+            self._dao.discard_payload(payload_ref)
+
+    async def _make_room(self, overflow: OverflowPolicy, timeout: Optional[float]):
+        if not self._capacity or await self.depth() < self._capacity:
+            return
+
+        if overflow == OverflowPolicy.REJECT:
+            raise queue.Full(f"Task queue {self.name} is full")
+
+        if overflow == OverflowPolicy.SHED_OLDEST:
+            result = await self._dao.pop(list(reversed(range(self.lane_count))), 0)
+            if result is not None:
+                _, item = result
+                shed_task, payload_ref = self._dao.decode(item)
+                logger.warning(f"Task queue {self.name} is full, dropping {shed_task}")
+                await self._release(shed_task)
+                self._dao.discard_payload(payload_ref)
+            return
+
+        for backoff in self._full_queue_backoffs(overflow, timeout):
+            if await self.depth() < self._capacity:
+                return
+            await asyncio.sleep(backoff)
+
+    async def _release(self, task: Task):
+        if task.dedup_key is not None:
+            await self._dao.release(task.dedup_key, str(task.task_id))
+
+
+class RedisTaskResultDao(BaseRedisDao):
+    def __init__(self, db_pool):
+        super().__init__(db_pool, TaskEntity.schema(), key_prefix="task_result")
+
+    @transactional
+    def store(self, task_id: uuid.UUID, data: bytes, ttl: float, ctx: RedisDaoContext):
+        # Kept as a single item list, so waiters can block on it
+        ctx.list_replace(task_id, data, max(1, math.ceil(ttl)))
+
+    @transactional
+    def load(
+        self, task_id: uuid.UUID, timeout: float, ctx: RedisDaoContext
+    ) -> Optional[bytes]:
+        if timeout > 0:
+            return ctx.list_blocking_peek_last(task_id, timeout)
+        return ctx.list_get(task_id, 0)
+
+    @transactional
+    def load_many(
+        self, task_ids: List[uuid.UUID], ctx: RedisDaoContext
+    ) -> List[Optional[bytes]]:
+        return ctx.get_list_items(task_ids, 0)
+
+
+class RedisTaskResultStore(BaseTaskResultStore):
+    def __init__(self, db_pool, ttl: float = DEFAULT_RESULT_TTL):
+        self._dao = RedisTaskResultDao(db_pool)
+        self._ttl = ttl
+
+    def store(self, task_result: TaskResult):
+        self._dao.store(task_result.task_id, task_codec.dumps(task_result), self._ttl)
+
+    @property
+    def is_shared(self) -> bool:
+        return True
+
+    def get(self, task_id: uuid.UUID, timeout: float = 0) -> Optional[TaskResult]:
+        data = self._dao.load(task_id, timeout)
+        return task_codec.loads(data) if data else None
+
+    def get_many(self, task_ids: List[uuid.UUID]) -> List[Optional[TaskResult]]:
+        """Loads the results in a single round trip"""
+        return [
+            task_codec.loads(data) if data else None
+            for data in self._dao.load_many(task_ids)
+        ]
@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import multiprocessing
+import queue
+import struct
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Iterator, Optional
+from uuid import UUID
+
+from tq import task_codec
+from tq.task_dispacher import (
+    DEFAULT_HIGH_WATER_RATIO,
+    BaseTaskQueue,
+    OverflowPolicy,
+    Task,
+    posted_task_id,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SHM_CAPACITY = 1024
+DEFAULT_SLOT_SIZE = 4096
+DEFAULT_SHM_DEDUP_CAPACITY = 4096
+
+# Shared memory layout:
+#  - head and tail counters of each lane's ring
+#  - open addressing table of the dedup keys of pending tasks
+#  - capacity slots per lane, each a length followed by an encoded task
+_LANE = struct.Struct("<QQ")
+_DEDUP_ENTRY = struct.Struct("<Q16sd")
+_SLOT_LENGTH = struct.Struct("<I")
+
+_EMPTY = 0
+_RELEASED = 1
+
+
+class SharedMemoryTaskQueue(BaseTaskQueue):
+    """
+    Task queue shared by the processes of a single host, without a round trip to a server.
+    Each lane is a ring of fixed size slots in shared memory, guarded by a process shared lock,
+    producers and consumers block on semaphores counting the free slots and the pending tasks.
+
+    The queue is handed to other processes as an argument of multiprocessing.Process,
+    the creating process should unlink it once it is not used anymore.
+    The lane schedule is kept by each consumer process on its own.
+    """
+
+    def __init__(
+        self,
+        *args,
+        slot_size: int = DEFAULT_SLOT_SIZE,
+        dedup_capacity: int = DEFAULT_SHM_DEDUP_CAPACITY,
+        mp_context: Optional[multiprocessing.context.BaseContext] = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        if not self._capacity:
+            self._capacity = DEFAULT_SHM_CAPACITY
+            self._high_water_mark = self._high_water_mark or int(
+                self._capacity * DEFAULT_HIGH_WATER_RATIO
+            )
+
+        self._slot_size = slot_size
+        self._dedup_capacity = dedup_capacity
+        self._dedup_offset = self.lane_count * _LANE.size
+        self._slots_offset = self._dedup_offset + dedup_capacity * _DEDUP_ENTRY.size
+        size = self._slots_offset + self.lane_count * self._capacity * slot_size
+
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._shm.buf[: self._slots_offset] = bytes(self._slots_offset)
+        self._is_owner = True
+
+        mp_context = mp_context if mp_context else multiprocessing.get_context()
+        self._lock = mp_context.Lock()
+        self._free_slots = mp_context.Semaphore(self._capacity)
+        self._pending_tasks = mp_context.Semaphore(0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shm"] = self._shm.name
+        state["_is_owner"] = False
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._shm = shared_memory.SharedMemory(name=state["_shm"])
+
+    @property
+    def slot_size(self) -> int:
+        return self._slot_size
+
+    @property
+    def is_shared(self) -> bool:
+        return True
+
+    def close(self):
+        """Detaches this process from the queue"""
+        self._shm.close()
+
+    def unlink(self):
+        """Detaches and frees the shared memory, only the creating process should call this"""
+        self.close()
+        if self._is_owner:
+            self._shm.unlink()
+
+    def depth(self) -> int:
+        with self._lock:
+            return sum(
+                tail - head
+                for head, tail in map(self._read_lane, range(self.lane_count))
+            )
+
+    def put(
+        self,
+        task: Task,
+        lane: Optional[int] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[UUID]:
+        lane = self.lane_of(task) if lane is None else lane
+        frames = task_codec.encode_frames(task)
+        size = task_codec.packed_size(frames)
+        if _SLOT_LENGTH.size + size > self._slot_size:
+            raise ValueError(
+                f"Task of {size} bytes does not fit into a slot of {self.name}"
+            )
+
+        if task.dedup_key is not None:
+            with self._lock:
+                pending_task_id = self._claim(task.dedup_key, posted_task_id(task))
+            self._count_dedup(pending_task_id is not None)
+            if pending_task_id is not None:
+                return pending_task_id
+
+        try:
+            self._make_room(overflow if overflow else self._overflow_policy, timeout)
+        except queue.Full:
+            self._release(task)
+            raise
+
+        with self._lock:
+            head, tail = self._read_lane(lane)
+            offset = self._slot_offset(lane, tail)
+            _SLOT_LENGTH.pack_into(self._shm.buf, offset, size)
+            task_codec.pack_frames_into(
+                frames, self._shm.buf, offset + _SLOT_LENGTH.size
+            )
+            _LANE.pack_into(self._shm.buf, self._lane_offset(lane), head, tail + 1)
+        self._pending_tasks.release()
+        return task.task_id
+
+    @contextmanager
+    def fetch_task(self, timeout: Optional[float] = None) -> Iterator[Optional[Task]]:
+        timeout = self._poll_timeout if timeout is None else timeout
+        task = None
+        if self._pending_tasks.acquire(timeout=timeout):
+            task = task_codec.loads(self._pop())
+            self._free_slots.release()
+        try:
+            yield task
+        finally:
+            self._release(task)
+
+    def _make_room(self, overflow: OverflowPolicy, timeout: Optional[float]):
+        if overflow == OverflowPolicy.REJECT:
+            if not self._free_slots.acquire(block=False):
+                raise queue.Full(f"Task queue {self.name} is full")
+            return
+
+        if overflow == OverflowPolicy.SHED_OLDEST:
+            while not self._free_slots.acquire(block=False):
+                if self._pending_tasks.acquire(block=False):
+                    # The slot of the shed task is taken over
+                    shed_task = task_codec.loads(self._pop(shed=True))
+                    logger.warning(
+                        f"Task queue {self.name} is full, dropping {shed_task}"
+                    )
+                    self._release(shed_task)
+                    return
+                # A consumer is about to free a slot
+                if self._free_slots.acquire(timeout=self._poll_timeout):
+                    return
+            return
+
+        if overflow == OverflowPolicy.TIMEOUT:
+            timeout = self._poll_timeout if timeout is None else timeout
+        else:
+            timeout = None
+
+        if not self._free_slots.acquire(timeout=timeout):
+            raise queue.Full(f"Task queue {self.name} is full")
+
+    def _pop(self, shed: bool = False) -> bytes:
+        """Takes an encoded task, the caller has to hold one of the pending tasks"""
+        # The oldest task of the least urgent lane is shed
+        order = reversed(range(self.lane_count)) if shed else self._scheduler.order()
+        with self._lock:
+            for lane in order:
+                head, tail = self._read_lane(lane)
+                if head == tail:
+                    continue
+
+                if not shed:
+                    self._scheduler.charge(lane)
+                offset = self._slot_offset(lane, head)
+                (size,) = _SLOT_LENGTH.unpack_from(self._shm.buf, offset)
+                start = offset + _SLOT_LENGTH.size
+                data = bytes(self._shm.buf[start : start + size])
+                _LANE.pack_into(self._shm.buf, self._lane_offset(lane), head + 1, tail)
+                return data
+        raise RuntimeError(f"Task queue {self.name} is out of sync")
+
+    def _release(self, task: Optional[Task]):
+        if task is not None and task.dedup_key is not None:
+            with self._lock:
+                self._release_key(task.dedup_key, posted_task_id(task))
+
+    def _lane_offset(self, lane: int) -> int:
+        return lane * _LANE.size
+
+    def _read_lane(self, lane: int):
+        return _LANE.unpack_from(self._shm.buf, self._lane_offset(lane))
+
+    def _slot_offset(self, lane: int, position: int) -> int:
+        return (
+            self._slots_offset
+            + (lane * self._capacity + position % self._capacity) * self._slot_size
+        )
+
+    def _dedup_entries(self, key: str) -> Iterator[int]:
+        """Yields the offsets of the entries along the probe sequence of the key"""
+        key_hash = self._key_hash(key)
+        for probe in range(self._dedup_capacity):
+            index = (key_hash + probe) % self._dedup_capacity
+            yield self._dedup_offset + index * _DEDUP_ENTRY.size
+
+    @staticmethod
+    def _key_hash(key: str) -> int:
+        # Stable across processes, unlike hash(), and never one of the markers
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") | 2
+
+    def _claim(self, key: str, task_id: UUID) -> Optional[UUID]:
+        """Claims the key for task_id, returns the id of the task holding it already"""
+        now = time.monotonic()
+        key_hash = self._key_hash(key)
+        free_offset = None
+        for offset in self._dedup_entries(key):
+            entry_hash, entry_id, expires_at = _DEDUP_ENTRY.unpack_from(
+                self._shm.buf, offset
+            )
+            if entry_hash == key_hash and expires_at > now:
+                return UUID(bytes=entry_id)
+
+            if entry_hash in (_EMPTY, _RELEASED) or expires_at <= now:
+                free_offset = offset if free_offset is None else free_offset
+                if entry_hash == _EMPTY:
+                    break
+
+        if free_offset is None:
+            logger.warning(f"Dedup table of {self.name} is full, {key} is not tracked")
+        else:
+            _DEDUP_ENTRY.pack_into(
+                self._shm.buf,
+                free_offset,
+                key_hash,
+                task_id.bytes,
+                now + self._dedup_ttl,
+            )
+        return None
+
+    def _release_key(self, key: str, task_id: UUID):
+        key_hash = self._key_hash(key)
+        for offset in self._dedup_entries(key):
+            entry_hash, entry_id, _ = _DEDUP_ENTRY.unpack_from(self._shm.buf, offset)
+            if entry_hash == _EMPTY:
+                return
+            if entry_hash == key_hash and entry_id == task_id.bytes:
+                _DEDUP_ENTRY.pack_into(self._shm.buf, offset, _RELEASED, bytes(16), 0)
+                return
@@ -0,0 +1,144 @@
+import io
+import pickle
+import struct
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+# Tasks are pickled with protocol 5, large buffers are kept out of band as separate frames.
+# A message is: magic, frame count, frame lengths, then the frames themselves.
+# Frame 0 is the pickle stream, the rest are the out of band buffers it references.
+# Encoding does not copy the buffers, packing copies each frame once into the message,
+# a single value for Redis or a slot of shared memory. Decoding references the message.
+
+MAGIC = b"TQF1"
+HEADER = struct.Struct("<4sI")
+
+# Smaller buffers are cheaper to copy into the pickle stream
+OUT_OF_BAND_THRESHOLD = 64 * 1024
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+# The C pickler handles bytes and bytearray before any reducer hook, only persistent_id sees them.
+# Their persistent id carries a PickleBuffer, which is pickled out of band along with the rest.
+_BUFFER_TYPES = {bytes: "bytes", bytearray: "bytearray", memoryview: "memoryview"}
+
+
+class _FramePickler(pickle.Pickler):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # Persistent ids are not memoized by pickle, shared buffers are tracked here
+        self._buffers: Dict[int, Tuple[int, Any]] = {}
+
+    def persistent_id(self, obj):
+        tag = _BUFFER_TYPES.get(type(obj))
+        if tag is None:
+            return None
+
+        view = memoryview(obj)
+        if view.nbytes < OUT_OF_BAND_THRESHOLD or not view.c_contiguous:
+            # Memoryviews do not pickle on their own
+            return ("inline", view.tobytes()) if tag == "memoryview" else None
+
+        if id(obj) in self._buffers:
+            return "ref", self._buffers[id(obj)][0]
+
+        self._buffers[id(obj)] = (len(self._buffers), obj)
+        return tag, pickle.PickleBuffer(obj)
+
+
+class _FrameUnpickler(pickle.Unpickler):
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._buffers: List[Any] = []
+
+    def persistent_load(self, pid):
+        tag, buffer = pid
+        if tag == "ref":
+            return self._buffers[buffer]
+        if tag == "inline":
+            return memoryview(buffer)
+
+        if tag == "bytes":
+            obj = bytes(buffer)
+        elif tag == "bytearray":
+            obj = bytearray(buffer)
+        elif tag == "memoryview":
+            # A view over the received frame, no copy is made
+            obj = memoryview(buffer)
+        else:
+            raise pickle.UnpicklingError(f"Unknown persistent id {tag}")
+
+        self._buffers.append(obj)
+        return obj
+
+
+def encode_frames(obj: Any) -> List[BytesLike]:
+    """Pickles obj, buffers larger than OUT_OF_BAND_THRESHOLD are returned as separate frames without copying"""
+    buffers: List[pickle.PickleBuffer] = []
+    stream = io.BytesIO()
+    _FramePickler(stream, protocol=5, buffer_callback=buffers.append).dump(obj)
+    frames: List[BytesLike] = [stream.getbuffer()]
+    frames.extend(buffer.raw() for buffer in buffers)
+    return frames
+
+
+def decode_frames(frames: Sequence[BytesLike]) -> Any:
+    """
+    Unpickles the frames, out of band buffers are referenced rather than copied.
+    Memoryviews and NumPy arrays end up as views over the frames, bytes and bytearrays get a single copy.
+    """
+    return _FrameUnpickler(io.BytesIO(frames[0]), buffers=frames[1:]).load()
+
+
+def _frame_lengths(frames: Sequence[BytesLike]) -> bytes:
+    return struct.pack(f"<{len(frames)}Q", *(memoryview(f).nbytes for f in frames))
+
+
+def packed_size(frames: Sequence[BytesLike]) -> int:
+    return (
+        HEADER.size
+        + struct.calcsize(f"<{len(frames)}Q")
+        + sum(memoryview(f).nbytes for f in frames)
+    )
+
+
+def pack_frames(frames: Sequence[BytesLike]) -> bytes:
+    """Packs the frames into a single message, which copies each of them once"""
+    return b"".join([HEADER.pack(MAGIC, len(frames)), _frame_lengths(frames), *frames])
+
+
+def pack_frames_into(
+    frames: Sequence[BytesLike], buffer: memoryview, offset: int = 0
+) -> int:
+    """Packs the frames straight into a writable buffer, returns the number of bytes written"""
+    HEADER.pack_into(buffer, offset, MAGIC, len(frames))
+    position = offset + HEADER.size
+    for chunk in [_frame_lengths(frames), *frames]:
+        chunk = memoryview(chunk).cast("B")
+        buffer[position : position + chunk.nbytes] = chunk
+        position += chunk.nbytes
+    return position - offset
+
+
+def unpack_frames(data: BytesLike) -> List[memoryview]:
+    view = memoryview(data)
+    magic, count = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise ValueError("Not a task message")
+
+    lengths = struct.unpack_from(f"<{count}Q", view, HEADER.size)
+    offset = HEADER.size + struct.calcsize(f"<{count}Q")
+    frames = []
+    for length in lengths:
+        frames.append(view[offset : offset + length])
+        offset += length
+    return frames
+
+
+def dumps(obj: Any) -> bytes:
+    """Message of obj, its large buffers are copied once into it rather than pickled in band"""
+    return pack_frames(encode_frames(obj))
+
+
+def loads(data: BytesLike) -> Any:
+    return decode_frames(unpack_frames(data))
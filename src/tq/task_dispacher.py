@@ -1,24 +1,79 @@
 import abc
+import collections
+import enum
 import logging
 import queue
+import threading
+import time
+from concurrent.futures import Future
 from contextlib import contextmanager
 from dataclasses import dataclass
 from multiprocessing import Event
-from typing import Any, Callable, Dict, Iterator, List, Optional, Type, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 from uuid import UUID, uuid4
 
 from tq import bind_function
 from tq.job_system import Job, JobManager
+from tq.metrics import TaskMetrics
 
 LOGGER = logging.getLogger(__name__)
 
+# Priority lanes, lower is more urgent
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+DEFAULT_LANE_WEIGHTS = (4, 2, 1)
+DEFAULT_POLL_TIMEOUT = 1.0
+
+DEFAULT_DEDUP_TTL = 3600.0
+DEFAULT_HIGH_WATER_RATIO = 0.8
+# First and shortest sleep of producers polling a full queue for room
+FULL_QUEUE_BACKOFF = 0.05
+
+DEFAULT_RESULT_TTL = 3600.0
+# Seconds between the result store reads of the futures of a dispatcher
+RESULT_POLL_INTERVAL = 0.1
+DEFAULT_DEDUP_CAPACITY = 100000
+
 
 @dataclass
 class Task:
+    # Subclasses may set `_priority` as a class attribute to pick a default lane
     @property
     def task_id(self) -> Optional[UUID]:
         return getattr(self, "_task_id", None)
 
+    @property
+    def priority(self) -> int:
+        return getattr(self, "_priority", PRIORITY_NORMAL)
+
+    @property
+    def queue_name(self) -> Optional[str]:
+        return getattr(self, "_queue_name", None)
+
+    @property
+    def dedup_key(self) -> Optional[str]:
+        return getattr(self, "_dedup_key", None)
+
+    @property
+    def enqueued_at(self) -> Optional[float]:
+        """Wall clock time the task was posted at"""
+        return getattr(self, "_enqueued_at", None)
+
 
 @dataclass
 class TaskResult(Task):
@@ -42,6 +97,14 @@ class TaskResult(Task):
         return getattr(self, "_failure_reason", None)
 
 
+def posted_task_id(task: Task) -> UUID:
+    """Id of a posted task, for the queues and stores which need one, post_task assigns it"""
+    task_id = task.task_id
+    if task_id is None:
+        raise ValueError(f"{task} has no task id, tasks get one when posted")
+    return task_id
+
+
 TaskType = TypeVar("TaskType", bound=Task)
 TaskResultType = TypeVar("TaskResultType", bound=TaskResult)
 
@@ -50,6 +113,22 @@ class TerminateDispatcherLoop(Task):
     pass
 
 
+class TaskFuture(Future):
+    """
+    Resolved with the TaskResult of the task once it arrives to the dispatcher,
+    or shows up in its result store when that is shared by the processes.
+    Failed results resolve it too, check TaskResult.is_failed. Use asyncio.wrap_future() to await it.
+    """
+
+    def __init__(self, task_id: UUID) -> None:
+        super().__init__()
+        self._task_id = task_id
+
+    @property
+    def task_id(self) -> UUID:
+        return self._task_id
+
+
 def task_handler(*task_type_list):
     """
     Decorator for task handler functions.
@@ -67,39 +146,489 @@ def task_handler(*task_type_list):
     return decorator
 
 
-class BaseTaskQueue(abc.ABC):
+class WeightedScheduler:
+    """
+    Weighted round-robin over a fixed set of lanes.
+    Lanes which still have credit in the current round are polled first, in lane order.
+    Serving a lane without credit means every lane with credit was empty, so a new round starts.
+    """
+
+    def __init__(self, weights: Sequence[int]) -> None:
+        if not weights or any(weight <= 0 for weight in weights):
+            raise ValueError(f"Lane weights must be positive, got {weights}")
+
+        self._weights: List[float] = list(weights)
+        self._credits: List[float] = list(weights)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._weights)
+
+    @property
+    def weights(self) -> List[float]:
+        return list(self._weights)
+
+    def order(self) -> List[int]:
+        with self._lock:
+            # Lanes out of credit follow, the least indebted first
+            return sorted(
+                range(len(self._credits)),
+                key=lambda lane: (
+                    self._credits[lane] <= 0,
+                    -min(self._credits[lane], 0),
+                ),
+            )
+
+    def charge(self, lane: int, cost: float = 1):
+        with self._lock:
+            if self._credits[lane] <= 0:
+                # Debt is carried over to the next round
+                self._credits = [
+                    weight + min(credit, 0)
+                    for weight, credit in zip(self._weights, self._credits)
+                ]
+            self._credits[lane] -= cost
+
+
+class OverflowPolicy(enum.Enum):
+    BLOCK = "block"
+    TIMEOUT = "timeout"
+    REJECT = "reject"
+    SHED_OLDEST = "shed_oldest"
+
+
+# Policies which never wait for room
+_NON_BLOCKING_POLICIES = (OverflowPolicy.REJECT, OverflowPolicy.SHED_OLDEST)
+
+
+class _TaskQueueMixin:
+    """Lanes, dedup counters, capacity and overflow waits of a task queue, shared by the sync and async queues"""
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        lane_weights: Sequence[int] = DEFAULT_LANE_WEIGHTS,
+        poll_timeout: float = DEFAULT_POLL_TIMEOUT,
+        dedup_ttl: float = DEFAULT_DEDUP_TTL,
+        capacity: int = 0,
+        high_water_mark: Optional[int] = None,
+        overflow_policy: OverflowPolicy = OverflowPolicy.BLOCK,
+    ) -> None:
+        self._name: str = name if name else str(uuid4())
+        self._scheduler = WeightedScheduler(lane_weights)
+        self._poll_timeout = poll_timeout
+        self._dedup_ttl = dedup_ttl
+        self._dedup_counter = collections.Counter(hits=0, misses=0)
+        self._capacity = capacity
+        self._high_water_mark = (
+            high_water_mark
+            if high_water_mark
+            else int(capacity * DEFAULT_HIGH_WATER_RATIO)
+        )
+        self._overflow_policy = overflow_policy
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def capacity(self) -> int:
+        """Maximum number of pending tasks, 0 if unbounded"""
+        return self._capacity
+
+    @property
+    def high_water_mark(self) -> int:
+        return self._high_water_mark
+
+    @property
+    def dedup_stats(self) -> Dict[str, int]:
+        return dict(self._dedup_counter)
+
+    def _count_dedup(self, is_hit: bool):
+        self._dedup_counter.update({"hits" if is_hit else "misses": 1})
+
+    @property
+    def lane_count(self) -> int:
+        return len(self._scheduler)
+
+    def lane_of(self, task: Task) -> int:
+        return min(max(task.priority, 0), self.lane_count - 1)
+
+    def _full_queue_backoffs(
+        self, overflow: OverflowPolicy, timeout: Optional[float]
+    ) -> Iterator[float]:
+        """
+        Seconds to sleep between depth checks of a full queue which has nothing to block on,
+        raises queue.Full once the timeout of OverflowPolicy.TIMEOUT passes.
+        """
+        if overflow == OverflowPolicy.TIMEOUT:
+            timeout = self._poll_timeout if timeout is None else timeout
+            deadline = time.monotonic() + timeout
+        else:
+            deadline = None
+
+        backoff = FULL_QUEUE_BACKOFF
+        while True:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Full(f"Task queue {self.name} is full")
+                backoff = min(backoff, remaining)
+            yield backoff
+            backoff = min(backoff * 2, self._poll_timeout)
+
+
+class BaseTaskQueue(_TaskQueueMixin, abc.ABC):
+    @property
+    def pressure(self) -> float:
+        """Queue depth relative to the high-water mark, producers should slow down above 1.0"""
+        if not self._high_water_mark:
+            return 0.0
+        return self.depth() / self._high_water_mark
+
+    @property
+    def is_under_pressure(self) -> bool:
+        return self.pressure >= 1.0
+
+    @property
+    def is_shared(self) -> bool:
+        """Whether tasks may be consumed by other processes"""
+        return False
+
+    @abc.abstractmethod
+    def depth(self) -> int:
+        """Number of pending tasks"""
+        pass
+
     @abc.abstractmethod
-    def put(self, task: Task):
+    def put(
+        self,
+        task: Task,
+        lane: Optional[int] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[UUID]:
+        """
+        Enqueues the task unless a task with the same dedup key is still pending or in flight.
+        Returns the id of the task which ends up in the queue.
+        When the queue is at capacity the overflow policy (defaults to the queue's) decides what happens,
+        queue.Full is raised when the task is rejected or timeout seconds pass without room.
+        """
         pass
 
     @contextmanager
     @abc.abstractmethod
-    def fetch_task(self) -> Iterator[Task]:
+    def fetch_task(self, timeout: Optional[float] = None) -> Iterator[Optional[Task]]:
+        """
+        Yields the next task or None if nothing arrived within timeout (defaults to poll_timeout).
+        The task is acknowledged, and its dedup key released, when the context exits.
+        """
         yield
 
 
+class DedupIndex:
+    """LRU of dedup keys of pending tasks, entries expire after ttl seconds"""
+
+    def __init__(
+        self, ttl: float = DEFAULT_DEDUP_TTL, capacity: int = DEFAULT_DEDUP_CAPACITY
+    ) -> None:
+        self._ttl = ttl
+        self._capacity = capacity
+        self._entries: "collections.OrderedDict[str, Tuple[UUID, float]]" = (
+            collections.OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def claim(self, key: str, task_id: UUID) -> Optional[UUID]:
+        """Claims the key for task_id, returns the id of the task holding it already"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+            self._entries[key] = (task_id, now + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._capacity:
+                self._entries.popitem(last=False)
+            return None
+
+    def release(self, key: str, task_id: UUID):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == task_id:
+                del self._entries[key]
+
+
 class LocalTaskQueue(BaseTaskQueue):
-    def __init__(self) -> None:
-        super().__init__()
-        self.queue = queue.Queue()
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._lanes: List[Deque[Task]] = [
+            collections.deque() for _ in range(self.lane_count)
+        ]
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._dedup_index = DedupIndex(self._dedup_ttl)
+
+    def depth(self) -> int:
+        with self._lock:
+            return self._depth()
+
+    def put(
+        self,
+        task: Task,
+        lane: Optional[int] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[UUID]:
+        lane = self.lane_of(task) if lane is None else lane
+        with self._lock:
+            if task.dedup_key is not None:
+                pending_task_id = self._dedup_index.claim(
+                    task.dedup_key, posted_task_id(task)
+                )
+                self._count_dedup(pending_task_id is not None)
+                if pending_task_id is not None:
+                    return pending_task_id
 
-    def put(self, task: Task):
-        self.queue.put(task)
+            try:
+                self._make_room(
+                    overflow if overflow else self._overflow_policy, timeout
+                )
+            except queue.Full:
+                if task.dedup_key is not None:
+                    self._dedup_index.release(task.dedup_key, posted_task_id(task))
+                raise
+
+            self._lanes[lane].append(task)
+            self._not_empty.notify()
+        return task.task_id
 
     @contextmanager
-    def fetch_task(self) -> Iterator[Task]:
-        yield self.queue.get()
-        self.queue.task_done()
+    def fetch_task(self, timeout: Optional[float] = None) -> Iterator[Optional[Task]]:
+        timeout = self._poll_timeout if timeout is None else timeout
+        with self._lock:
+            self._not_empty.wait_for(lambda: any(self._lanes), timeout)
+            task = self._pop()
+            if task is not None:
+                self._not_full.notify()
+        try:
+            yield task
+        finally:
+            self._release(task)
+
+    def _depth(self) -> int:
+        return sum(len(lane) for lane in self._lanes)
+
+    def _make_room(self, overflow: OverflowPolicy, timeout: Optional[float]):
+        if not self._capacity or self._depth() < self._capacity:
+            return
+
+        if overflow == OverflowPolicy.REJECT:
+            raise queue.Full(f"Task queue {self.name} is full")
+
+        if overflow == OverflowPolicy.SHED_OLDEST:
+            # The oldest task of the least urgent lane goes
+            lane = next(lane for lane in reversed(self._lanes) if lane)
+            shed_task = lane.popleft()
+            LOGGER.warning(f"Task queue {self.name} is full, dropping {shed_task}")
+            self._release(shed_task)
+            return
+
+        if overflow == OverflowPolicy.TIMEOUT:
+            timeout = self._poll_timeout if timeout is None else timeout
+        else:
+            timeout = None
+
+        if not self._not_full.wait_for(lambda: self._depth() < self._capacity, timeout):
+            raise queue.Full(f"Task queue {self.name} is full")
+
+    def _pop(self) -> Optional[Task]:
+        for lane in self._scheduler.order():
+            if self._lanes[lane]:
+                self._scheduler.charge(lane)
+                return self._lanes[lane].popleft()
+        return None
+
+    def _release(self, task: Optional[Task]):
+        if task is not None and task.dedup_key is not None:
+            self._dedup_index.release(task.dedup_key, posted_task_id(task))
+
+
+class TaskQueueGroup(BaseTaskQueue):
+    """
+    Consumes several named queues as the lanes of a single queue.
+    Queues are served by weighted round-robin, or by deficit round-robin when task_cost is given.
+    Tasks are put into the queue named by task.queue_name, or into the first queue.
+    """
+
+    def __init__(
+        self,
+        queues: Sequence[BaseTaskQueue],
+        weights: Optional[Sequence[int]] = None,
+        task_cost: Optional[Callable[[Task], float]] = None,
+        name: Optional[str] = None,
+        poll_timeout: float = DEFAULT_POLL_TIMEOUT,
+    ) -> None:
+        super().__init__(
+            name=name,
+            lane_weights=weights if weights else [1] * len(queues),
+            poll_timeout=poll_timeout,
+        )
+        if len(queues) != self.lane_count:
+            raise ValueError("Queues and weights must have the same length")
+
+        self._queues: List[BaseTaskQueue] = list(queues)
+        self._queue_index: Dict[str, int] = {
+            task_queue.name: index for index, task_queue in enumerate(self._queues)
+        }
+        self._task_cost: Callable[[Task], float] = (
+            task_cost if task_cost else lambda task: 1
+        )
+
+    @property
+    def queues(self) -> List[BaseTaskQueue]:
+        return list(self._queues)
+
+    @property
+    def is_shared(self) -> bool:
+        return any(task_queue.is_shared for task_queue in self._queues)
+
+    @property
+    def dedup_stats(self) -> Dict[str, int]:
+        counter: collections.Counter = collections.Counter(hits=0, misses=0)
+        for task_queue in self._queues:
+            counter.update(task_queue.dedup_stats)
+        return dict(counter)
+
+    def lane_of(self, task: Task) -> int:
+        if task.queue_name is None:
+            return 0
+        if task.queue_name not in self._queue_index:
+            raise KeyError(f"No such queue '{task.queue_name}' in {self.name}")
+        return self._queue_index[task.queue_name]
+
+    def depth(self) -> int:
+        return sum(task_queue.depth() for task_queue in self._queues)
+
+    def put(
+        self,
+        task: Task,
+        lane: Optional[int] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+    ) -> Optional[UUID]:
+        task_queue = self._queues[self.lane_of(task) if lane is None else lane]
+        return task_queue.put(task, overflow=overflow, timeout=timeout)
+
+    @contextmanager
+    def fetch_task(self, timeout: Optional[float] = None) -> Iterator[Optional[Task]]:
+        timeout = self._poll_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        wait_slice = self._poll_timeout / len(self._queues)
+
+        while True:
+            order = self._scheduler.order()
+            remaining = max(deadline - time.monotonic(), 0)
+            # Sweep every queue without blocking, then wait on the one next in turn
+            attempts: List[Tuple[int, float]] = [(index, 0) for index in order]
+            attempts.append((order[0], min(remaining, wait_slice)))
+
+            for index, wait in attempts:
+                with self._queues[index].fetch_task(timeout=wait) as task:
+                    if task is not None:
+                        self._scheduler.charge(index, self._task_cost(task))
+                        yield task
+                        return
+
+            if time.monotonic() >= deadline:
+                break
+
+        yield None
+
+
+class BaseTaskResultStore(abc.ABC):
+    """Keeps task results by task id for a while, so they can be fetched instead of being re-queued"""
+
+    @abc.abstractmethod
+    def store(self, task_result: TaskResult):
+        pass
+
+    @abc.abstractmethod
+    def get(self, task_id: UUID, timeout: float = 0) -> Optional[TaskResult]:
+        """Returns the result of the task, waits up to timeout seconds for it to arrive if positive"""
+        pass
+
+    @property
+    def is_shared(self) -> bool:
+        """Whether results stored by other processes can be read"""
+        return False
+
+    def get_many(self, task_ids: List[UUID]) -> List[Optional[TaskResult]]:
+        """Results of the tasks without waiting, None for the ones not there"""
+        return [self.get(task_id) for task_id in task_ids]
+
+
+class LocalTaskResultStore(BaseTaskResultStore):
+    def __init__(self, ttl: float = DEFAULT_RESULT_TTL) -> None:
+        self._ttl = ttl
+        # Ordered by expiry, as every entry lives for the same ttl
+        self._results: "collections.OrderedDict[UUID, Tuple[TaskResult, float]]" = (
+            collections.OrderedDict()
+        )
+        self._arrived = threading.Condition()
+
+    def store(self, task_result: TaskResult):
+        task_id = posted_task_id(task_result)
+        now = time.monotonic()
+        with self._arrived:
+            while self._results and next(iter(self._results.values()))[1] <= now:
+                self._results.popitem(last=False)
+            self._results[task_id] = (task_result, now + self._ttl)
+            self._results.move_to_end(task_id)
+            self._arrived.notify_all()
+
+    def get(self, task_id: UUID, timeout: float = 0) -> Optional[TaskResult]:
+        with self._arrived:
+            self._arrived.wait_for(lambda: task_id in self._results, timeout)
+            entry = self._results.get(task_id)
+
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        return entry[0]
 
 
 class TaskDispatcher:
-    def __init__(self, task_queue: BaseTaskQueue, job_manager: JobManager) -> None:
+    def __init__(
+        self,
+        task_queue: BaseTaskQueue,
+        job_manager: JobManager,
+        result_store: Optional[BaseTaskResultStore] = None,
+    ) -> None:
+        """
+        Results returned by handlers are re-posted to the queue, or kept in result_store when given.
+        Results kept in the store are not dispatched to TaskResult handlers.
+        """
         # TODO: Use defaultdict
         self.task_handlers: Dict[Type, List[Callable]] = {}
         self.task_queque: BaseTaskQueue = task_queue
         self.tasks = []
         self.job_manager = job_manager
         self._exit_event = Event()
+        self._futures: Dict[UUID, TaskFuture] = {}
+        self._futures_lock = threading.Lock()
+        self._result_poller: Optional[threading.Thread] = None
+        # Tasks posted by handlers or the dispatcher itself which did not fit into the queue,
+        # handled before fetching
+        self._own_tasks: Deque[Task] = collections.deque()
+        self._worker_state = threading.local()
+        self.result_store: Optional[BaseTaskResultStore] = result_store
+        self.metrics = TaskMetrics()
 
     @property
     def is_exit(self):
@@ -114,9 +643,23 @@ class TaskDispatcher:
         LOGGER.debug("Dispatch loop terminating.")
         self._exit_event.set()
 
+    @property
+    def queue_pressure(self) -> float:
+        return self.task_queque.pressure
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and pressure, enqueue and dequeue rates, and timings and failures per task type"""
+        return {
+            "queue": self.task_queque.name,
+            "depth": self.task_queque.depth(),
+            "pressure": self.task_queque.pressure,
+            "dedup": self.task_queque.dedup_stats,
+            **self.metrics.snapshot(),
+        }
+
     def terminate(self):
         # TODO: This does not work the way intended
-        self.post_task(TerminateDispatcherLoop())
+        self._post_own_task(TerminateDispatcherLoop())
 
     @staticmethod
     def _get_task_hanlders(clazz: Type):
@@ -143,12 +686,174 @@ class TaskDispatcher:
 
     # TODO: Add unregister
 
-    def post_task(self, task: Task) -> UUID:
-        if not task.task_id:
-            setattr(task, "_task_id", uuid4())
-        LOGGER.debug(f"Task posted: {task}")
-        self.task_queque.put(task)
-        return task.task_id
+    def post_task(
+        self,
+        task: Task,
+        priority: Optional[int] = None,
+        queue_name: Optional[str] = None,
+        dedup_key: Optional[str] = None,
+        overflow: Optional[OverflowPolicy] = None,
+        timeout: Optional[float] = None,
+        with_future: bool = False,
+    ) -> Union[UUID, TaskFuture]:
+        """
+        Posts the task into the queue.
+        When a task with the same dedup key is still pending or in flight the task is dropped,
+        and the id of the pending one is returned instead.
+        When the queue is full the overflow policy applies, see BaseTaskQueue.put.
+        Posts of handlers never wait for room though, as waiting could leave no worker to drain the queue,
+        unless the policy is REJECT or SHED_OLDEST the task is kept for this dispatcher to handle next instead.
+        With with_future a TaskFuture is returned instead of the id, it is resolved when the TaskResult
+        of the task gets dispatched by this dispatcher, or stored in its result store if that is shared.
+        A queue consumed by other processes needs a shared result store for that.
+        """
+        if (
+            with_future
+            and self.task_queque.is_shared
+            and not (self.result_store is not None and self.result_store.is_shared)
+        ):
+            raise ValueError(
+                "Futures of tasks of a shared queue need a shared result store"
+            )
+        own_task_id = task.task_id
+        if not own_task_id:
+            own_task_id = uuid4()
+            setattr(task, "_task_id", own_task_id)
+        if priority is not None:
+            setattr(task, "_priority", priority)
+        if queue_name is not None:
+            setattr(task, "_queue_name", queue_name)
+        if dedup_key is not None:
+            setattr(task, "_dedup_key", dedup_key)
+        setattr(task, "_enqueued_at", time.time())
+        lane = self.task_queque.lane_of(task)
+        LOGGER.debug(f"Task posted: {task} to lane {lane}")
+        future = self._create_future(own_task_id) if with_future else None
+        try:
+            if self._is_worker_thread and overflow not in _NON_BLOCKING_POLICIES:
+                pending_task_id = self._put_or_keep(task, lane)
+            else:
+                pending_task_id = self.task_queque.put(
+                    task, lane, overflow=overflow, timeout=timeout
+                )
+        except Exception:
+            if future is not None:
+                self._discard_future(own_task_id)
+            raise
+
+        task_id = pending_task_id if pending_task_id else own_task_id
+        if task_id == own_task_id:
+            self.metrics.task_enqueued(task)
+        if future is None:
+            return task_id
+
+        if task_id != own_task_id:
+            # Dropped as duplicate, follow the pending task instead
+            self._discard_future(own_task_id)
+            future = self._create_future(task_id)
+        return future
+
+    def get_result(self, task_id: UUID, timeout: float = 0) -> Optional[TaskResult]:
+        """Fetches a result from the result store, waits up to timeout seconds if positive"""
+        if self.result_store is None:
+            raise RuntimeError("Dispatcher has no result store")
+        return self.result_store.get(task_id, timeout)
+
+    def _create_future(self, task_id: UUID) -> TaskFuture:
+        with self._futures_lock:
+            future = self._futures.setdefault(task_id, TaskFuture(task_id))
+            if (
+                self.result_store is not None
+                and self.result_store.is_shared
+                and self._result_poller is None
+            ):
+                self._result_poller = threading.Thread(
+                    target=self._poll_results, name="result-poller", daemon=True
+                )
+                self._result_poller.start()
+            return future
+
+    def _poll_results(self):
+        """Resolves futures from the result store, results of other processes arrive there only"""
+        while True:
+            with self._futures_lock:
+                for task_id, future in list(self._futures.items()):
+                    if future.cancelled():
+                        del self._futures[task_id]
+                task_ids = list(self._futures)
+                if not task_ids:
+                    self._result_poller = None
+                    return
+
+            try:
+                task_results = self.result_store.get_many(task_ids)
+            except Exception:
+                LOGGER.exception("Failed to read task results")
+                task_results = []
+            for task_result in task_results:
+                if task_result is not None:
+                    self._resolve_future(task_result)
+            time.sleep(RESULT_POLL_INTERVAL)
+
+    def _discard_future(self, task_id: UUID):
+        with self._futures_lock:
+            self._futures.pop(task_id, None)
+
+    @property
+    def _is_worker_thread(self) -> bool:
+        """Whether the calling thread runs a handler or the dispatcher itself posts"""
+        return getattr(self._worker_state, "depth", 0) > 0
+
+    @contextmanager
+    def _on_worker_thread(self) -> Iterator[None]:
+        self._worker_state.depth = getattr(self._worker_state, "depth", 0) + 1
+        try:
+            yield
+        finally:
+            self._worker_state.depth -= 1
+
+    def _post_own_task(self, task: Task):
+        """Posts a result or the terminate sentinel, past the capacity of the queue"""
+        with self._on_worker_thread():
+            self.post_task(task)
+
+    def _put_or_keep(self, task: Task, lane: int) -> Optional[UUID]:
+        """
+        Puts the task without waiting for room. Waiting could block the workers of the dispatcher,
+        the consumers of the queue, so when it is full the task is kept for this dispatcher to handle next.
+        """
+        try:
+            return self.task_queque.put(task, lane, overflow=OverflowPolicy.REJECT)
+        except queue.Full:
+            LOGGER.debug(f"Task queue {self.task_queque.name} is full, keeping {task}")
+            self._own_tasks.append(task)
+            return None
+
+    @contextmanager
+    def _fetch_task(self) -> Iterator[Optional[Task]]:
+        try:
+            own_task = self._own_tasks.popleft()
+        except IndexError:
+            with self.task_queque.fetch_task() as task:
+                yield task
+            return
+        yield own_task
+
+    def _return_result(self, task_result: TaskResult):
+        if self.result_store is None:
+            self._post_own_task(task_result)
+            return
+
+        self.result_store.store(task_result)
+        self._resolve_future(task_result)
+
+    def _resolve_future(self, task_result: TaskResult):
+        if task_result.task_id is None:
+            return
+        with self._futures_lock:
+            future = self._futures.pop(task_result.task_id, None)
+        if future is not None and not future.cancelled():
+            future.set_result(task_result)
 
     def _schedule_dispatch_job(self):
         job = self.job_manager.create_job(
@@ -159,25 +864,34 @@ class TaskDispatcher:
     def _dispatch_loop(self, job: Job, manager: JobManager):
         LOGGER.debug("dispatch loop_tick")
         is_continue = True
-        with self.task_queque.fetch_task() as task:
+        with self._fetch_task() as task:
             if task:
+                self.metrics.task_dequeued(task)
                 LOGGER.info(f"Dispatch task: {task}")
                 is_continue = self._dispatch_task(task, job, manager)
-                if is_continue:
-                    LOGGER.debug("schedule dispatch next tick")
-                    self._schedule_dispatch_job()
-                else:
-                    LOGGER.info("Dispatcher terminated")
+
+        if is_continue and not self.is_exit:
+            LOGGER.debug("schedule dispatch next tick")
+            self._schedule_dispatch_job()
+        else:
+            LOGGER.info("Dispatcher terminated")
 
     def _dispatch_task(self, task: Task, job: Job, manager: JobManager):
         if not isinstance(task, TerminateDispatcherLoop):
+            if isinstance(task, TaskResult):
+                self._resolve_future(task)
+
             task_type = type(task)
             handler_jobs = []
             if task_type in self.task_handlers:
                 for handler in self.task_handlers[task_type]:
                     LOGGER.debug(f"Create job = {handler} for task = {task}")
                     handler_job = manager.create_child_job(
-                        job, handler, task, dispatcher=self
+                        job,
+                        bind_function(TaskDispatcher._run_handler, self),
+                        handler,
+                        task,
+                        dispatcher=self,
                     )
                     manager.schedule_job(handler_job)
                     handler_jobs.append(handler_job)
@@ -188,9 +902,20 @@ class TaskDispatcher:
 
             for handler_job in handler_jobs:
                 if handler_job.result and isinstance(handler_job.result, TaskResult):
-                    self.post_task(handler_job.result)
+                    self._return_result(handler_job.result)
 
             return True
 
         self._exit_event.set()
         return False
+
+    def _run_handler(self, handler: Callable, task: Task, *args, **kwargs):
+        start = time.perf_counter()
+        is_failed = True
+        try:
+            with self._on_worker_thread():
+                result = handler(task, *args, **kwargs)
+            is_failed = isinstance(result, TaskResult) and result.is_failed
+            return result
+        finally:
+            self.metrics.handler_finished(task, time.perf_counter() - start, is_failed)
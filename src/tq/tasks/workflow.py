@@ -146,6 +146,10 @@ class AbstractFlowStep(abc.ABC):
             ]
         )
 
+    @property
+    def is_timeout(self) -> bool:
+        return self.state == FlowStateMachine.TIMEOUT
+
     @property
     def is_finished(self) -> bool:
         return any(
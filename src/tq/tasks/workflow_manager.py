@@ -3,6 +3,7 @@ import logging
 from collections import defaultdict
 from dataclasses import dataclass, field
 from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
 
 from tq.task_dispacher import TaskResult, task_handler
 from tq.tasks.workflow import FlowStepType
@@ -24,6 +25,7 @@ class Workflow:
         self._root: WorkflowNode = WorkflowNode()
         self._args: List[Any] = []
         self._kwargs: Dict[str, Any] = defaultdict(lambda: None)
+        self._pending_steps: Dict[UUID, FlowStepType] = {}
 
     # TODO: Workflow id?
 
@@ -64,8 +66,16 @@ class Workflow:
     def poll(self, max_count: int = 0) -> int:
         flow_count = 0
         for flow_step in self.iterate_incomplete_steps():
+            previous_task_id = flow_step.task_id
             flow_step.poll(*self._args, **self._kwargs)
 
+            if previous_task_id != flow_step.task_id:
+                self._pending_steps.pop(previous_task_id, None)
+            if flow_step.is_pending:
+                self._pending_steps[flow_step.task_id] = flow_step
+            elif flow_step.task_id in self._pending_steps:
+                del self._pending_steps[flow_step.task_id]
+
             if flow_step.is_failed:
                 self.mark_children_as_failed(flow_step)
 
@@ -74,6 +84,14 @@ class Workflow:
                 return flow_count
         return flow_count
 
+    def find_pending_step(self, task_id: UUID) -> Optional[FlowStepType]:
+        step = self._pending_steps.get(task_id)
+        # Steps failed, reset or re-posted since the last poll leave their entries behind
+        if step is not None and (not step.is_pending or step.task_id != task_id):
+            del self._pending_steps[task_id]
+            return None
+        return step
+
     def is_done(self) -> bool:
         return all([step.is_done for step in self.iterate_steps()])
 
@@ -162,15 +180,16 @@ class WorkflowManager:
     @task_handler(TaskResult)
     def handle_task_result(self, task_result: TaskResult, *a, **w):
         task_id = task_result.task_id
-        # Any better idea ???
+        if task_id is None:
+            return
 
         LOGGER.info(f"Task {task_id} result returned, updating workflows")
 
         for workflow in self._workflows:
-            for step in workflow.iterate_incomplete_steps():
-                if step.task_id == task_id:
-                    LOGGER.info(f"Task {task_id} result returned, updating {step.name}")
-                    step.set_task_result(task_result)
+            step = workflow.find_pending_step(task_id)
+            if step is not None:
+                LOGGER.info(f"Task {task_id} result returned, updating {step.name}")
+                step.set_task_result(task_result)
 
     def reset_steps_with_timeout(self):
         for workflow in self._workflows:
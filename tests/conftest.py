@@ -5,7 +5,10 @@ import tempfile
 from contextlib import ExitStack
 
 import fakeredis
+import fakeredis.aioredis
 import pytest
+import redis
+import redis.asyncio
 
 from tq.job_system import JobManager
 from tq.task_dispacher import LocalTaskQueue, TaskDispatcher
@@ -131,6 +134,26 @@ def fakeredis_connection():
     redis.flushall()
 
 
+@pytest.fixture(scope="function")
+def fakeredis_server() -> fakeredis.FakeServer:
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture(scope="function")
+def fakeredis_pool(fakeredis_server) -> redis.ConnectionPool:
+    yield redis.ConnectionPool(
+        connection_class=fakeredis.FakeConnection, server=fakeredis_server
+    )
+
+
+@pytest.fixture(scope="function")
+def fakeredis_async_pool(fakeredis_server) -> redis.asyncio.ConnectionPool:
+    # Shares the server of fakeredis_pool
+    yield redis.asyncio.ConnectionPool(
+        connection_class=fakeredis.aioredis.FakeConnection, server=fakeredis_server
+    )
+
+
 @pytest.fixture(scope="function")
 def generate_random_data():
     return lambda size: os.urandom(size)
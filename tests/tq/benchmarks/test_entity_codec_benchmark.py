@@ -0,0 +1,89 @@
+import datetime
+import enum
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+from uuid import UUID, uuid4
+
+import pytest
+from dataclasses_json import DataClassJsonMixin
+
+from tq.database.entity_codec import JSON, MSGPACK, ORJSON, EntityCodec
+from tq.database.utils import from_json, to_json
+
+logger = logging.getLogger(__name__)
+
+COUNT = 10000
+
+
+class State(enum.Enum):
+    NEW = "new"
+    DONE = "done"
+
+
+@dataclass
+class Child(DataClassJsonMixin):
+    id: UUID = None
+    created_at: Optional[datetime.datetime] = None
+
+
+@dataclass
+class Entity(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+    string: str = "test_str"
+    state: State = State.NEW
+    created_at: Optional[datetime.datetime] = None
+    children: List[Child] = field(default_factory=list)
+
+
+def make_entities() -> List[Entity]:
+    now = datetime.datetime.now(datetime.timezone.utc).astimezone()
+    return [
+        Entity(
+            id=uuid4(),
+            integer=i,
+            created_at=now,
+            children=[Child(uuid4(), now) for _ in range(3)],
+        )
+        for i in range(COUNT)
+    ]
+
+
+def log_rate(what: str, start: float):
+    elapsed = time.perf_counter() - start
+    logger.info(f"{what} {COUNT} entities: {COUNT / elapsed:.0f} entities/s")
+
+
+@pytest.mark.slow
+def test_schema_path():
+    objs = make_entities()
+    schema = Entity.schema()
+
+    start = time.perf_counter()
+    items = [to_json(obj.to_dict()) for obj in objs]
+    log_rate("schema encoded", start)
+
+    start = time.perf_counter()
+    decoded = [schema.load(from_json(item)) for item in items]
+    log_rate("schema decoded", start)
+    assert decoded == objs
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("backend", [JSON, ORJSON, MSGPACK])
+def test_codec(backend):
+    if backend != JSON:
+        pytest.importorskip(backend)
+    objs = make_entities()
+    codec = EntityCodec(Entity, backend)
+
+    start = time.perf_counter()
+    items = [codec.encode(obj) for obj in objs]
+    log_rate(f"{backend} encoded", start)
+
+    start = time.perf_counter()
+    decoded = [codec.decode(item) for item in items]
+    log_rate(f"{backend} decoded", start)
+    assert decoded == objs
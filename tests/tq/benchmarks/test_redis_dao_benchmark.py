@@ -0,0 +1,93 @@
+import logging
+import time
+from dataclasses import dataclass
+from uuid import UUID, uuid4
+
+import pytest
+import redis
+from dataclasses_json import DataClassJsonMixin
+
+from tq.database.redis_dao import BaseRedisDao, RedisDaoContext
+from tq.database.utils import to_json
+
+logger = logging.getLogger(__name__)
+
+SIZES = [10000, 100000]
+
+
+@dataclass
+class MyData(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+    string: str = "test_str"
+
+
+class MyDataDao(BaseRedisDao):
+    def __init__(self, db_pool):
+        super().__init__(db_pool, MyData.schema(), key_prefix="my_data")
+
+
+def log_rate(what: str, count: int, start: float):
+    elapsed = time.perf_counter() - start
+    logger.info(f"{what} {count} entities: {count / elapsed:.0f} entities/s")
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("count", SIZES)
+def test_bulk_writes(fakeredis_pool, count):
+    dao = MyDataDao(fakeredis_pool)
+    objs = [MyData(id=uuid4(), integer=i) for i in range(count)]
+
+    start = time.perf_counter()
+    for obj in objs[: count // 10]:
+        dao.create_or_update(obj)
+    log_rate("create_or_update", count // 10, start)
+
+    start = time.perf_counter()
+    dao.bulk_create_or_update(objs)
+    log_rate("bulk_create_or_update", count, start)
+
+    start = time.perf_counter()
+    assert dao.bulk_delete(obj.id for obj in objs) == count
+    log_rate("bulk_delete", count, start)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("count", SIZES)
+def test_full_scan(fakeredis_pool, count):
+    dao = MyDataDao(fakeredis_pool)
+    dao.bulk_create_or_update(MyData(id=uuid4(), integer=i) for i in range(count))
+    db = redis.Redis(connection_pool=fakeredis_pool)
+
+    if count <= SIZES[0]:
+        # fakeredis walks the whole keyspace on each SCAN, small pages do not scale there
+        start = time.perf_counter()
+        assert sum(1 for key in db.scan_iter("my_data:*") if db.get(key)) == count
+        log_rate("scan_iter and GET", count, start)
+
+    for workers in [0, 4]:
+        start = time.perf_counter()
+        assert sum(1 for _ in dao.iterate_all(workers=workers)) == count
+        log_rate(f"iterate_all with {workers} workers", count, start)
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("count", SIZES)
+def test_list_stream(fakeredis_pool, count):
+    ctx = RedisDaoContext(redis.Redis(connection_pool=fakeredis_pool), "my_list")
+    objs = [MyData(id=uuid4(), integer=i).to_dict() for i in range(count)]
+    with ctx.db.pipeline(transaction=False) as pipe:
+        for obj in objs:
+            pipe.lpush("my_list:list", to_json(obj))
+        pipe.execute()
+
+    # The former default window
+    start = time.perf_counter()
+    assert sum(1 for _ in ctx.iter_all_from_list("list", fetch_bucket_size=10)) == count
+    log_rate("iter_all_from_list by 10", count, start)
+
+    for prefetch in [False, True]:
+        start = time.perf_counter()
+        items = ctx.iter_all_entities_from_list("list", prefetch=prefetch)
+        assert sum(1 for _ in items) == count
+        log_rate(f"iter_all_entities_from_list, prefetch {prefetch}", count, start)
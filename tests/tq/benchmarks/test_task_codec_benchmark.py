@@ -0,0 +1,68 @@
+import base64
+import logging
+import pickle
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from tq import task_codec
+from tq.database.utils import from_json, to_json
+from tq.task_dispacher import Task
+
+logger = logging.getLogger(__name__)
+
+SIZES = [1, 10, 100]
+ROUNDS = 5
+# Sizes from which the codec has to beat the legacy encoding, timings of 1 MB are too noisy
+FASTER_FROM_MB = 10
+
+
+@dataclass
+class PayloadTask(Task):
+    data: object = None
+
+
+def legacy_round_trip(task):
+    item = to_json({"payload": base64.b64encode(pickle.dumps(task)).decode("ascii")})
+    return pickle.loads(base64.b64decode(from_json(item)["payload"]))
+
+
+def codec_round_trip(task):
+    return task_codec.loads(task_codec.dumps(task))
+
+
+def measure(round_trip, task) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        round_trip(task)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("size_mb", SIZES)
+def test_bytes_payload(size_mb):
+    task = PayloadTask(data=b"x" * size_mb * 1024**2)
+    legacy = measure(legacy_round_trip, task)
+    codec = measure(codec_round_trip, task)
+    logger.info(
+        f"{size_mb} MB bytes: legacy {legacy * 1000:.1f} ms, codec {codec * 1000:.1f} ms"
+    )
+    assert codec_round_trip(task) == task
+    if size_mb >= FASTER_FROM_MB:
+        assert codec < legacy
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("size_mb", SIZES)
+def test_numpy_payload(size_mb):
+    np = pytest.importorskip("numpy")
+    task = PayloadTask(data=np.ones(size_mb * 1024**2 // 8))
+    legacy = measure(legacy_round_trip, task)
+    codec = measure(codec_round_trip, task)
+    logger.info(
+        f"{size_mb} MB ndarray: legacy {legacy * 1000:.1f} ms, codec {codec * 1000:.1f} ms"
+    )
+    assert (codec_round_trip(task).data == task.data).all()
+    if size_mb >= FASTER_FROM_MB:
+        assert codec < legacy
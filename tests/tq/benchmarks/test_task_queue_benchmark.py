@@ -0,0 +1,59 @@
+import logging
+import multiprocessing
+import time
+from dataclasses import dataclass
+
+import pytest
+
+from tq.shm_task_queue import SharedMemoryTaskQueue
+from tq.task_dispacher import LocalTaskQueue, Task
+
+logger = logging.getLogger(__name__)
+
+COUNT = 10000
+
+
+@dataclass
+class DummyTask(Task):
+    value: int = 0
+
+
+def produce(task_queue, count):
+    for value in range(count):
+        task_queue.put(DummyTask(value=value))
+    task_queue.close()
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize("queue_type", [LocalTaskQueue, SharedMemoryTaskQueue])
+def test_put_fetch_latency(queue_type):
+    task_queue = queue_type()
+    start = time.perf_counter()
+    for value in range(COUNT):
+        task_queue.put(DummyTask(value=value))
+        with task_queue.fetch_task(timeout=0):
+            pass
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"{queue_type.__name__}: {elapsed / COUNT * 1e6:.1f} us per put and fetch"
+    )
+
+    if isinstance(task_queue, SharedMemoryTaskQueue):
+        task_queue.unlink()
+
+
+@pytest.mark.slow
+def test_shm_queue_throughput_between_processes():
+    task_queue = SharedMemoryTaskQueue()
+    producer = multiprocessing.Process(target=produce, args=(task_queue, COUNT))
+    start = time.perf_counter()
+    producer.start()
+    for _ in range(COUNT):
+        with task_queue.fetch_task(timeout=5) as task:
+            assert task is not None
+    elapsed = time.perf_counter() - start
+    producer.join()
+    logger.info(
+        f"SharedMemoryTaskQueue: {COUNT / elapsed:.0f} tasks/s between processes"
+    )
+    task_queue.unlink()
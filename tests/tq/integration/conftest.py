@@ -9,6 +9,8 @@ LOGGER = logging.getLogger(__name__)
 
 DB_PORT = 6379
 DB_HOST = "localhost"
+# Primaries of the redis-cluster service, see docker-compose.dev.yaml
+CLUSTER_PORT = 7000
 
 MONGO_HOST = "localhost:27017"
 MONGO_CONNECTION_STRING = "mongodb://root:toor@" + MONGO_HOST
@@ -27,6 +29,14 @@ def cache_db_connection(cache_db_pool) -> redis.Redis:
     db.flushall()
 
 
+@pytest.fixture(scope="function")
+def cluster_db() -> redis.RedisCluster:
+    db = redis.RedisCluster(host=DB_HOST, port=CLUSTER_PORT)
+    yield db
+    db.flushall()
+    db.close()
+
+
 @pytest.fixture(scope="session")
 def mongo_db():
     test_user = "test_user"
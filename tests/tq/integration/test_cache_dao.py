@@ -4,6 +4,7 @@ from typing import Optional
 from uuid import UUID, uuid4
 
 import pytest
+import redis
 from dataclasses_json import DataClassJsonMixin
 
 from tq.database import BaseEntity
@@ -115,3 +116,25 @@ def test_stack_push_pop(cache_db_pool):
 
 
 # TODO: Test hashes
+
+
+@pytest.mark.integration
+def test_list_has(cache_db_pool):
+    ctx = RedisDaoContext(redis.Redis(connection_pool=cache_db_pool), "my_data")
+    id = uuid4()
+    ctx.list_push(id, "a")
+    ctx.list_push(id, "a")
+
+    assert ctx.list_has(id, "a")
+    assert not ctx.list_has(id, "b")
+    ctx.delete(id)
+
+
+@pytest.mark.integration
+def test_purge(cache_db_pool):
+    dao = MyDataDao(cache_db_pool)
+    dao.purge()
+    ids = dao.bulk_create_or_update([MyData(id=uuid4()) for _ in range(2500)])
+
+    assert dao.purge(count=100, chunk_size=30) == 2500
+    assert dao.get_many(ids) == [None] * 2500
@@ -113,3 +113,17 @@ def test_delete(mongodb_client):
     id = dao.create_or_update(entity)
     dao.delete(id)
     assert dao.get_entity(id) is None
+
+
+@pytest.mark.mongo
+def test_get_many(mongodb_client):
+    dao = MyDao(mongodb_client)
+    alice_id = dao.create_or_update(MyEntity(id=None, name="Alice"))
+    bob_id = dao.create_or_update(MyEntity(id=None, name="Bob"))
+
+    entities = dao.get_many([bob_id, uuid.uuid4(), alice_id])
+    assert [entity.name if entity else None for entity in entities] == [
+        "Bob",
+        None,
+        "Alice",
+    ]
@@ -0,0 +1,102 @@
+from dataclasses import dataclass
+from uuid import UUID, uuid4
+
+import pytest
+from dataclasses_json import DataClassJsonMixin
+from redis.exceptions import RedisClusterException
+
+from tq.database.redis_cluster import KeyLayout
+from tq.database.redis_dao import (
+    BaseRedisDao,
+    Index,
+    RedisDaoContext,
+    StorageMode,
+    transactional,
+)
+from tq.redis_task_queue import RedisTaskQueue
+from tq.task_dispacher import Task, TaskDispatcher
+
+
+@dataclass
+class MyData(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+    string: str = "test_str"
+
+
+class MyDataDao(BaseRedisDao):
+    def __init__(self, db, **kwargs):
+        super().__init__(db, MyData.schema(), key_prefix="my_data", **kwargs)
+
+    @transactional
+    def save_all(self, objs, ctx: RedisDaoContext):
+        for obj in objs:
+            self.create_or_update(obj, ctx=ctx)
+
+    @transactional
+    def increment(self, id: UUID, ctx: RedisDaoContext):
+        ctx.watch(id)
+        obj = self.get_entity(id, ctx=ctx)
+        obj.integer += 1
+        self.create_or_update(obj, ctx=ctx)
+
+
+@dataclass
+class DummyTask(Task):
+    value: int = 0
+
+
+@pytest.mark.redis
+@pytest.mark.parametrize("storage", [StorageMode.JSON, StorageMode.HASH])
+def test_entities_spread_across_slots(cluster_db, storage):
+    dao = MyDataDao(cluster_db, storage=storage)
+    objs = [MyData(id=uuid4(), integer=i) for i in range(100)]
+    dao.bulk_create_or_update(objs)
+
+    assert dao.key_layout == KeyLayout.ID
+    assert len({cluster_db.keyslot(f"my_data:{{{obj.id}}}") for obj in objs}) > 1
+    assert dao.get_many([obj.id for obj in objs]) == objs
+    assert sorted(dao.iterate_all(), key=lambda obj: obj.integer) == objs
+
+    dao.increment(objs[0].id)
+    assert dao.get_entity(objs[0].id).integer == 1
+
+    assert dao.bulk_delete([obj.id for obj in objs[:50]]) == 50
+    assert dao.purge(count=10) == 50
+
+
+@pytest.mark.redis
+def test_transactions_stay_within_a_slot(cluster_db):
+    dao = MyDataDao(cluster_db)
+
+    with pytest.raises(RedisClusterException):
+        dao.save_all([MyData(id=uuid4()) for _ in range(10)])
+    with pytest.raises(ValueError):
+        MyDataDao(cluster_db, indexes=[Index("integer", ordered=True)])
+
+
+@pytest.mark.redis
+def test_prefix_layout(cluster_db):
+    dao = MyDataDao(
+        cluster_db,
+        key_layout=KeyLayout.PREFIX,
+        indexes=[Index("integer", ordered=True)],
+    )
+    objs = [MyData(id=uuid4(), integer=i) for i in range(10)]
+    dao.save_all(objs)
+
+    assert list(dao.range_by("integer", min_value=5)) == objs[5:]
+    assert dao.purge() == 10
+
+
+@pytest.mark.redis
+def test_task_queue(cluster_db):
+    task_queue = RedisTaskQueue(cluster_db)
+    dispatcher = TaskDispatcher(task_queue, None)
+    first_id = dispatcher.post_task(DummyTask(value=1), dedup_key="same")
+
+    assert dispatcher.post_task(DummyTask(value=2), dedup_key="same") == first_id
+    with task_queue.fetch_task(timeout=1) as task:
+        assert task.value == 1
+    with task_queue.fetch_task(timeout=0) as task:
+        assert task is None
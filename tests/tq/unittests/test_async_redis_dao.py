@@ -0,0 +1,310 @@
+import asyncio
+from dataclasses import dataclass
+from uuid import UUID, uuid4
+
+import pytest
+from dataclasses_json import DataClassJsonMixin
+
+from tq.async_task_dispatcher import AsyncTaskDispatcher
+from tq.database.async_redis_dao import AsyncBaseRedisDao, AsyncRedisDaoContext
+from tq.database.db import async_transactional
+from tq.database.entity_cache import EntityCache
+from tq.database.redis_dao import BaseRedisDao, Index, StorageMode
+from tq.redis_task_queue import AsyncRedisTaskQueue, RedisTaskQueue
+from tq.task_dispacher import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    Task,
+    TaskResult,
+    task_handler,
+)
+
+
+@dataclass
+class MyData(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+    string: str = "test_str"
+
+
+class AsyncMyDataDao(AsyncBaseRedisDao):
+    def __init__(self, db_pool, **kwargs):
+        super().__init__(db_pool, MyData.schema(), key_prefix="my_data", **kwargs)
+
+    @async_transactional
+    async def save_all(self, objs, ctx: AsyncRedisDaoContext, check=None):
+        for obj in objs:
+            await self.create_or_update(obj, ctx=ctx)
+            if check:
+                await check(obj, ctx)
+
+    @async_transactional
+    async def increment(self, id: UUID, ctx: AsyncRedisDaoContext, on_read=None):
+        await ctx.watch(id)
+        obj = await self.get_entity(id, ctx=ctx)
+        if on_read:
+            await on_read()
+        obj.integer += 1
+        await self.create_or_update(obj, ctx=ctx)
+
+
+@dataclass
+class DummyTask(Task):
+    value: int = 0
+
+
+@pytest.fixture(params=[StorageMode.JSON, StorageMode.HASH])
+def dao(request, fakeredis_async_pool):
+    return AsyncMyDataDao(fakeredis_async_pool, storage=request.param)
+
+
+def test_create_or_update(dao):
+    async def run():
+        obj = MyData(id=uuid4(), integer=1)
+        await dao.create_or_update(obj)
+        assert await dao.get_entity(obj.id) == obj
+        assert await dao.get_fields(obj.id, "integer") == {"integer": 1}
+
+        objs = [MyData(id=uuid4(), integer=i) for i in range(25)]
+        assert await dao.bulk_create_or_update(objs, chunk_size=10) == [
+            obj.id for obj in objs
+        ]
+        entities = await dao.get_many([objs[3].id, uuid4(), objs[0].id])
+        assert [entity.integer if entity else None for entity in entities] == [
+            3,
+            None,
+            0,
+        ]
+
+        await dao.delete(obj.id)
+        assert await dao.get_entity(obj.id) is None
+        assert await dao.bulk_delete([obj.id for obj in objs[:20]], chunk_size=7) == 20
+        assert sorted(entity.integer for entity in await dao.get_all(count=2)) == list(
+            range(20, 25)
+        )
+
+    asyncio.run(run())
+
+
+def test_shares_entities_with_sync_dao(fakeredis_pool, fakeredis_async_pool):
+    sync_dao = BaseRedisDao(fakeredis_pool, MyData.schema(), key_prefix="my_data")
+    dao = AsyncMyDataDao(fakeredis_async_pool)
+    obj = MyData(id=uuid4())
+    sync_dao.create_or_update(obj)
+
+    async def run():
+        assert await dao.get_entity(obj.id) == obj
+        await dao.create_or_update(MyData(id=obj.id, integer=1))
+
+    asyncio.run(run())
+    assert sync_dao.get_entity(obj.id).integer == 1
+
+
+def test_iterate_all(dao):
+    async def run():
+        objs = [MyData(id=uuid4(), integer=i) for i in range(50)]
+        await dao.bulk_create_or_update(objs)
+
+        entities = [entity async for entity in dao.iterate_all(count=7)]
+        assert sorted(entity.integer for entity in entities) == list(range(50))
+        keys = {key async for key in dao.iterate_all_keys()}
+        assert keys == {obj.id for obj in objs}
+
+        assert await dao.purge() == 50
+        assert await dao.get_all() == []
+
+    asyncio.run(run())
+
+
+def test_nested_calls_commit_together(fakeredis_async_pool):
+    dao = AsyncMyDataDao(fakeredis_async_pool)
+    other_dao = AsyncMyDataDao(fakeredis_async_pool)
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+
+    async def check(obj, ctx):
+        # Visible within the transaction, but not outside before it commits
+        assert (await dao.get_entity(obj.id, ctx=ctx)).integer == obj.integer
+        assert await other_dao.get_entity(obj.id) is None
+
+    async def fail(obj, ctx):
+        if obj.integer == 2:
+            raise ValueError()
+
+    async def run():
+        with pytest.raises(ValueError):
+            await dao.save_all(objs, check=fail)
+        assert await dao.get_many([obj.id for obj in objs]) == [None, None, None]
+
+        await dao.save_all(objs, check=check)
+        entities = await dao.get_many([obj.id for obj in objs])
+        assert [entity.integer for entity in entities] == [0, 1, 2]
+
+    asyncio.run(run())
+
+
+def test_watched_transaction_is_retried(fakeredis_async_pool):
+    dao = AsyncMyDataDao(fakeredis_async_pool)
+    other_dao = AsyncMyDataDao(fakeredis_async_pool)
+    obj = MyData(id=uuid4(), integer=0)
+    reads = []
+
+    async def on_read():
+        reads.append(True)
+        if len(reads) == 1:
+            await other_dao.create_or_update(MyData(id=obj.id, integer=10))
+
+    async def run():
+        await dao.create_or_update(obj)
+        await dao.increment(obj.id, on_read=on_read)
+        assert (await dao.get_entity(obj.id)).integer == 11
+
+    asyncio.run(run())
+    assert len(reads) == 2
+
+
+def test_fields(fakeredis_async_pool):
+    dao = AsyncMyDataDao(fakeredis_async_pool, storage=StorageMode.HASH)
+    obj = MyData(id=uuid4(), integer=1)
+
+    async def run():
+        await dao.create_or_update(obj)
+        await dao.update_fields(obj.id, string="updated")
+        assert await dao.increment_field(obj.id, "integer", amount=2) == 3
+        assert await dao.get_entity(obj.id) == MyData(obj.id, 3, "updated")
+
+    asyncio.run(run())
+
+
+def test_unsupported_options(fakeredis_async_pool):
+    class BoundedDao(AsyncMyDataDao):
+        max_entries = 10
+
+    with pytest.raises(ValueError, match="cache"):
+        AsyncMyDataDao(fakeredis_async_pool, cache=EntityCache())
+    with pytest.raises(ValueError, match="indexes"):
+        AsyncMyDataDao(fakeredis_async_pool, indexes=[Index("integer")])
+    with pytest.raises(ValueError, match="max_entries"):
+        BoundedDao(fakeredis_async_pool)
+
+
+@pytest.mark.parametrize("fetch_bucket_size, prefetch", [(None, True), (3, False)])
+def test_lists(fakeredis_async_pool, fetch_bucket_size, prefetch):
+    ctx = AsyncMyDataDao(fakeredis_async_pool)._create_context().table("my_list")
+
+    async def run():
+        for i in range(10):
+            await ctx.list_push_entity("list", {"value": i})
+        items = [
+            item["value"]
+            async for item in ctx.iter_all_entities_from_list(
+                "list", fetch_bucket_size, prefetch=prefetch
+            )
+        ]
+        assert items == list(range(10))
+
+        assert await ctx.bulk_remove_from_list_by_id("list", [0, -1, 42]) == 2
+        assert await ctx.get_list_length("list") == 8
+        assert await ctx.list_move_many("list", "other", 3) == [
+            b'{"value": 1}',
+            b'{"value": 2}',
+            b'{"value": 3}',
+        ]
+        assert (
+            await ctx.list_push_unless_claimed("other", b"item", "claim", "a", 10)
+            is None
+        )
+        assert (
+            await ctx.list_push_unless_claimed("other", b"item", "claim", "b", 10)
+            == b"a"
+        )
+        assert await ctx.delete_if_equals("claim", "a")
+
+    asyncio.run(run())
+
+
+def test_hashes_and_sets(fakeredis_async_pool):
+    ctx = AsyncMyDataDao(fakeredis_async_pool)._create_context()
+
+    async def run():
+        await ctx.set_hash_entity("hash", "key", {"value": 1})
+        assert await ctx.get_hash_entity("hash", "key") == {"value": 1}
+        assert [key async for key in ctx.iterate_hash_keys("hash")] == ["key"]
+
+        await ctx.add_members_to_set("set", [str(i) for i in range(10)])
+        members = [
+            member
+            async for page in ctx.iterate_set_member_pages("set", count=3)
+            for member in page
+        ]
+        assert sorted(map(int, set(members))) == list(range(10))
+
+        await ctx.add_to_sorted_set("sorted", {str(i): i for i in range(10)})
+        pages = [
+            page async for page in ctx.iterate_sorted_set_pages("sorted", 2, 7, count=4)
+        ]
+        assert pages == [["2", "3", "4", "5"], ["6", "7"]]
+
+    asyncio.run(run())
+
+
+def test_async_task_queue_is_shared_with_sync_queue(
+    fakeredis_pool, fakeredis_async_pool
+):
+    task_queue = AsyncRedisTaskQueue(fakeredis_async_pool, name="shared")
+    consumer = RedisTaskQueue(fakeredis_pool, name="shared")
+    low, high, duplicate = DummyTask(), DummyTask(value=1), DummyTask()
+    for task in (low, high, duplicate):
+        setattr(task, "_task_id", uuid4())
+    setattr(low, "_priority", PRIORITY_LOW)
+    setattr(high, "_priority", PRIORITY_HIGH)
+    setattr(duplicate, "_dedup_key", "key")
+
+    async def run():
+        for task in (low, high, duplicate):
+            assert await task_queue.put(task) == task.task_id
+        again = DummyTask()
+        setattr(again, "_task_id", uuid4())
+        setattr(again, "_dedup_key", "key")
+        assert await task_queue.put(again) == duplicate.task_id
+        assert await task_queue.depth() == 3
+
+        async with task_queue.fetch_task(timeout=0) as task:
+            assert task.value == 1
+
+    asyncio.run(run())
+    with consumer.fetch_task(timeout=0) as task:
+        assert task.task_id == duplicate.task_id
+    with consumer.fetch_task(timeout=0) as task:
+        assert task.task_id == low.task_id
+
+
+class AsyncResultHandler:
+    @task_handler(DummyTask)
+    async def handle(self, task: DummyTask, dispatcher):
+        return TaskResult(task=task)
+
+    @task_handler(TaskResult)
+    def handle_result(self, task_result: TaskResult, dispatcher):
+        if task_result.task.value == 2:
+            dispatcher.terminate()
+
+
+def test_async_dispatcher(fakeredis_async_pool):
+    dispatcher = AsyncTaskDispatcher(
+        AsyncRedisTaskQueue(fakeredis_async_pool, capacity=2, poll_timeout=0.1),
+        concurrency=2,
+    )
+    dispatcher.register_task_handler(AsyncResultHandler())
+
+    async def produce():
+        # Waits for room, as the queue holds two tasks only
+        for value in range(3):
+            await dispatcher.post_task(DummyTask(value=value))
+
+    async def run():
+        await asyncio.wait_for(asyncio.gather(produce(), dispatcher.run()), timeout=10)
+        return await dispatcher.stats()
+
+    stats = asyncio.run(run())
+    assert stats["depth"] == 0
+    assert stats["tasks"]["DummyTask"]["dequeued"] == 3
@@ -0,0 +1,67 @@
+import fakeredis
+import redis
+
+from tq.database.bloom_filter import BloomFilter
+
+
+def test_has_no_false_negatives():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom_filter.add(f"key:{i}")
+
+    assert all(f"key:{i}" in bloom_filter for i in range(1000))
+    false_positives = sum(f"other:{i}" in bloom_filter for i in range(10000))
+    assert false_positives < 300
+    assert bloom_filter.stats()["error_rate"] < 0.03
+
+
+def test_sizing():
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+
+    assert bloom_filter.size == 9586
+    assert bloom_filter.hash_count == 7
+
+
+def test_clear():
+    bloom_filter = BloomFilter(capacity=10)
+    bloom_filter.add("key")
+    bloom_filter.clear()
+
+    assert "key" not in bloom_filter
+
+
+def test_bits_are_shared_through_a_bitmap():
+    db = fakeredis.FakeStrictRedis()
+    writer = BloomFilter(capacity=100, key="bloom")
+    reader = BloomFilter(capacity=100, key="bloom")
+    writer.publish(db, writer.add("key"))
+
+    # The bits are numbered as SETBIT does
+    assert all(db.getbit("bloom", offset) for offset in writer.offsets("key"))
+    assert "key" not in reader
+    assert reader.might_contain(db, "key")
+    assert not reader.might_contain(db, "other")
+    # Kept once read
+    assert "key" in reader
+
+    other = BloomFilter(capacity=100, key="bloom")
+    other.refresh(db)
+    assert "key" in other
+
+
+def test_might_contain_reads_the_bits_of_the_value_only(monkeypatch):
+    db = fakeredis.FakeStrictRedis()
+    writer = BloomFilter(key="bloom")
+    reader = BloomFilter(key="bloom")
+    writer.publish(db, writer.add("key"))
+    commands = []
+    execute = redis.client.Pipeline.execute
+
+    def recording_execute(pipe, *args, **kwargs):
+        commands.append([command[0][0] for command in pipe.command_stack])
+        return execute(pipe, *args, **kwargs)
+
+    monkeypatch.setattr(redis.client.Pipeline, "execute", recording_execute)
+    assert reader.might_contain(db, "key")
+    # Not the bitmap as a whole
+    assert commands == [["GETBIT"] * reader.hash_count]
@@ -0,0 +1,84 @@
+import time
+from dataclasses import dataclass
+
+from tq.database.entity_cache import EntityCache
+
+
+@dataclass
+class Item:
+    value: int
+
+
+def test_evicts_least_recently_used():
+    cache = EntityCache(capacity=2)
+    cache.put("a", Item(1))
+    cache.put("b", Item(2))
+    cache.get("a")
+    cache.put("c", Item(3))
+
+    assert cache.get("a") == (True, Item(1))
+    assert cache.get("b") == (False, None)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire():
+    cache = EntityCache(ttl=0.01)
+    cache.put("a", Item(1))
+    time.sleep(0.02)
+
+    assert cache.get("a") == (False, None)
+
+
+def test_invalidate():
+    cache = EntityCache()
+    cache.put("a", Item(1))
+    cache.invalidate("a")
+    cache.invalidate("missing")
+
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+
+def test_entities_are_copied():
+    cache = EntityCache()
+    item = Item(1)
+    cache.put("a", item)
+    item.value = 2
+    _, cached = cache.get("a")
+    cached.value = 3
+
+    assert cache.get("a") == (True, Item(1))
+
+
+def test_stats():
+    cache = EntityCache()
+    cache.put("a", Item(1))
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+    assert stats["hit_ratio"] == 2 / 3
+
+
+def test_put_skips_keys_invalidated_since_generation():
+    cache = EntityCache(capacity=2)
+    generation = cache.generation()
+    cache.invalidate("a")
+    cache.put("a", Item(1), generation)
+    cache.put("b", Item(2), generation)
+
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (True, Item(2))
+
+    # Once forgotten, invalidations of any key count
+    generation = cache.generation()
+    for key in "cde":
+        cache.invalidate(key)
+    cache.put("f", Item(3), generation)
+    assert cache.get("f") == (False, None)
+    cache.put("f", Item(3), cache.generation())
+    assert cache.get("f") == (True, Item(3))
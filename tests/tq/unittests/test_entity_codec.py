@@ -0,0 +1,120 @@
+import datetime
+import enum
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID, uuid4
+
+import pytest
+from dataclasses_json import DataClassJsonMixin
+
+from tq.database.entity_codec import JSON, MSGPACK, ORJSON, EntityCodec
+from tq.database.utils import from_json, to_json
+
+
+class Color(enum.Enum):
+    RED = "red"
+    BLUE = "blue"
+
+
+@dataclass
+class Inner(DataClassJsonMixin):
+    id: UUID = None
+    created_at: Optional[datetime.datetime] = None
+
+
+@dataclass
+class Outer(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+    color: Color = Color.RED
+    inner: Optional[Inner] = None
+    inners: List[Inner] = field(default_factory=list)
+    ids: List[UUID] = field(default_factory=list)
+    counts: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class Plain:
+    id: UUID = None
+    tags: Set[str] = field(default_factory=set)
+    pair: Tuple[int, str] = (0, "")
+    anything: Any = None
+
+
+def make_outer() -> Outer:
+    now = datetime.datetime.now(datetime.timezone.utc).astimezone()
+    return Outer(
+        id=uuid4(),
+        integer=7,
+        color=Color.BLUE,
+        inner=Inner(uuid4(), now),
+        inners=[Inner(uuid4(), now), Inner(uuid4())],
+        ids=[uuid4(), uuid4()],
+        counts={"a": 1},
+    )
+
+
+@pytest.fixture(params=[JSON, ORJSON])
+def backend(request):
+    return request.param
+
+
+def test_round_trip(backend):
+    codec = EntityCodec(Outer, backend)
+    obj = make_outer()
+
+    assert codec.decode(codec.encode(obj)) == obj
+    assert codec.from_dict(codec.to_dict(obj)) == obj
+
+
+def test_compatible_with_dataclasses_json(backend):
+    codec = EntityCodec(Outer, backend)
+    obj = make_outer()
+
+    assert codec.loads(codec.encode(obj)) == from_json(to_json(obj.to_dict()))
+    assert codec.decode(to_json(obj.to_dict())) == obj
+    assert Outer.schema().load(codec.loads(codec.encode(obj))) == obj
+
+
+def test_missing_fields_get_defaults(backend):
+    codec = EntityCodec(Outer, backend)
+    id = uuid4()
+
+    assert codec.decode(codec.dumps({"id": str(id), "unknown": 1})) == Outer(id=id)
+    assert codec.decode(None) is None
+
+
+def test_native_dict_keeps_uuids_and_datetimes():
+    codec = EntityCodec(Outer, JSON)
+    obj = make_outer()
+
+    data = codec.to_dict(obj, encode_json=False)
+
+    assert data["id"] == obj.id
+    assert data["inner"]["created_at"] == obj.inner.created_at
+    assert data["color"] == "blue"
+    assert codec.from_dict(data) == obj
+
+
+def test_plain_dataclass(backend):
+    codec = EntityCodec(Plain, backend)
+    obj = Plain(id=uuid4(), tags={"a", "b"}, pair=(1, "x"), anything={"id": uuid4()})
+
+    decoded = codec.decode(codec.encode(obj))
+
+    assert decoded.tags == obj.tags
+    assert decoded.pair == obj.pair
+    assert decoded.anything == {"id": str(obj.anything["id"])}
+
+
+def test_msgpack():
+    pytest.importorskip("msgpack")
+    codec = EntityCodec(Outer, MSGPACK)
+    obj = make_outer()
+
+    assert codec.decode(codec.encode(obj)) == obj
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        EntityCodec(Outer, "xml")
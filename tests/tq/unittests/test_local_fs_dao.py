@@ -0,0 +1,52 @@
+from uuid import uuid4
+
+import pytest
+
+from tq.database.local_fs_dao import LocalFsDao
+
+
+@pytest.fixture(scope="function")
+def test_data(generate_random_data) -> bytes:
+    return generate_random_data(256)
+
+
+@pytest.fixture(scope="function")
+def test_file_name() -> str:
+    return f"test_file_{str(uuid4())}.txt"
+
+
+@pytest.fixture
+def local_fs_dao(tmp_path):
+    return LocalFsDao(tmp_path)
+
+
+def test_store_and_load(local_fs_dao, test_data, test_file_name):
+    file_id = local_fs_dao.store(test_file_name, test_data)
+    assert file_id
+    assert local_fs_dao.find_file_id(test_file_name) == file_id
+    assert local_fs_dao.load(test_file_name) == test_data
+    assert list(local_fs_dao.iterate_filenames()) == [test_file_name]
+
+
+def test_delete(local_fs_dao, test_data, test_file_name):
+    file_id = local_fs_dao.store(test_file_name, test_data)
+    assert local_fs_dao.load_by_id(file_id) == test_data
+
+    assert local_fs_dao.delete(test_file_name)
+    assert local_fs_dao.load(test_file_name) is None
+    assert not local_fs_dao.delete(test_file_name)
+    assert not local_fs_dao.delete_by_id(file_id)
+
+
+def test_open_read_write(local_fs_dao, test_data, test_file_name):
+    with local_fs_dao.open(test_file_name, "wb") as f:
+        f.write(test_data)
+
+    with local_fs_dao.open(test_file_name, "rb") as f:
+        assert f.read() == test_data
+
+
+def test_open_file_as_tempfile(local_fs_dao, test_data, test_file_name):
+    file_id = local_fs_dao.store(test_file_name, test_data)
+    with local_fs_dao.as_tempfile(file_id) as tmp:
+        assert tmp.read() == test_data
@@ -0,0 +1,114 @@
+import time
+import urllib.request
+from contextlib import ExitStack
+from dataclasses import dataclass
+
+import pytest
+import waiting
+
+from tq.job_system import JobManager
+from tq.metrics import Histogram, PrometheusExporter, RateMeter, render_prometheus
+from tq.task_dispacher import (
+    LocalTaskQueue,
+    Task,
+    TaskDispatcher,
+    TaskResult,
+    task_handler,
+)
+
+
+@dataclass
+class SlowTask(Task):
+    pass
+
+
+@dataclass
+class FailingTask(Task):
+    pass
+
+
+class Handler:
+    @task_handler(SlowTask)
+    def slow(self, task, *a, **w):
+        time.sleep(0.01)
+
+    @task_handler(FailingTask)
+    def failing(self, task, *a, **w):
+        return TaskResult(task=task).failed("broken")
+
+
+def test_histogram_quantiles():
+    histogram = Histogram([1.0, 2.0, 4.0])
+    for value in [0.5, 1.5, 1.5, 3.0]:
+        histogram.observe(value)
+
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(6.5)
+    assert histogram.buckets() == [(1.0, 1), (2.0, 3), (4.0, 4), (float("inf"), 4)]
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(1.0) == pytest.approx(4.0)
+
+
+def test_rate_meter_counts_events_in_window():
+    meter = RateMeter(window=60)
+    meter.mark(10)
+    assert meter.rate > 0
+    assert RateMeter().rate == 0
+
+
+def test_dispatcher_stats():
+    with ExitStack() as stack:
+        job_manager = stack.enter_context(JobManager(num_of_workers=2))
+        dispatcher = stack.enter_context(
+            TaskDispatcher(LocalTaskQueue(poll_timeout=0.1), job_manager)
+        )
+        dispatcher.register_task_handler(Handler())
+        dispatcher.post_task(SlowTask())
+        dispatcher.post_task(FailingTask())
+        dispatcher.post_task(SlowTask(), dedup_key="key")
+        dispatcher.post_task(SlowTask(), dedup_key="key")
+
+        # The failed result is posted back and dispatched as well
+        waiting.wait(
+            lambda: "TaskResult" in dispatcher.stats()["tasks"]
+            and dispatcher.stats()["tasks"]["TaskResult"]["dequeued"] == 1,
+            sleep_seconds=0.05,
+            timeout_seconds=3,
+        )
+
+    stats = dispatcher.stats()
+    slow = stats["tasks"]["SlowTask"]
+    assert slow["enqueued"] == 2
+    assert slow["dequeued"] == 2
+    assert slow["failed"] == 0
+    assert slow["handler_time"]["p50"] >= 0.005
+    assert slow["time_in_queue"]["count"] == 2
+    assert stats["tasks"]["FailingTask"]["failed"] == 1
+    assert stats["depth"] == 0
+    assert stats["enqueue_rate"] > 0
+
+
+def test_render_prometheus():
+    dispatcher = TaskDispatcher(LocalTaskQueue(name="jobs"), None)
+    dispatcher.post_task(SlowTask())
+    text = render_prometheus(dispatcher.stats())
+
+    assert 'tq_queue_depth{queue="jobs"} 1' in text
+    assert 'tq_tasks_enqueued_total{queue="jobs",task_type="SlowTask"} 1' in text
+    assert (
+        'tq_task_handler_time_seconds_bucket{queue="jobs",task_type="SlowTask",le="+Inf"} 0'
+        in text
+    )
+
+
+def test_exporter_writes_file_and_serves_port(tmp_path):
+    dispatcher = TaskDispatcher(LocalTaskQueue(name="jobs"), None)
+    path = tmp_path / "tq.prom"
+    with PrometheusExporter(dispatcher.stats, path=str(path), port=0) as exporter:
+        dispatcher.post_task(SlowTask())
+        url = f"http://127.0.0.1:{exporter.port}/metrics"
+        body = urllib.request.urlopen(url, timeout=3).read().decode()
+        assert 'tq_queue_depth{queue="jobs"} 1' in body
+
+    assert 'tq_queue_depth{queue="jobs"} 1' in path.read_text()
+    assert list(tmp_path.iterdir()) == [path]
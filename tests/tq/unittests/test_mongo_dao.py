@@ -0,0 +1,42 @@
+from uuid import uuid4
+
+import bson
+
+from tq.database.mongo_dao import MongoDaoContext
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def find(self, query):
+        ids = query["_id"]["$in"]
+        return [dict(doc) for doc in self._docs if doc["_id"] in ids]
+
+
+class FakeClient:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def get_default_database(self):
+        return self
+
+    def get_collection(self, name):
+        return self._collection
+
+
+def test_get_entities():
+    alice, bob = uuid4(), uuid4()
+    collection = FakeCollection(
+        [
+            {"_id": bson.Binary.from_uuid(alice), "name": "Alice"},
+            {"_id": bson.Binary.from_uuid(bob), "name": "Bob"},
+        ]
+    )
+    ctx = MongoDaoContext(FakeClient(collection), "my_data")
+
+    assert ctx.get_entities([bob, uuid4(), str(alice)]) == [
+        {"id": bob, "name": "Bob"},
+        None,
+        {"id": alice, "name": "Alice"},
+    ]
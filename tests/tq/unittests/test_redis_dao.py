@@ -0,0 +1,886 @@
+import time
+from dataclasses import dataclass
+from uuid import UUID, uuid4
+
+import pytest
+import redis
+from dataclasses_json import DataClassJsonMixin
+
+from tq.database.bloom_filter import BloomFilter
+from tq.database.entity_cache import EntityCache
+from tq.database.entity_codec import EntityCodec
+from tq.database.redis_cluster import KeyLayout
+from tq.database.redis_dao import (
+    BaseRedisDao,
+    Index,
+    RedisDaoContext,
+    StorageMode,
+    transactional,
+)
+from tq.database.utils import to_json
+from tq.metrics import render_prometheus
+from tq.task_dispacher import LocalTaskQueue, TaskDispatcher
+
+
+@dataclass
+class MyData(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+    string: str = "test_str"
+
+
+class MyDataDao(BaseRedisDao):
+    def __init__(self, db_pool, **kwargs):
+        super().__init__(db_pool, MyData.schema(), key_prefix="my_data", **kwargs)
+
+    @transactional
+    def save_all(self, objs, ctx: RedisDaoContext, check=None):
+        for obj in objs:
+            self.create_or_update(obj, ctx=ctx)
+            if check:
+                check(obj, ctx)
+
+    @transactional
+    def increment(self, id: UUID, ctx: RedisDaoContext, on_read=None):
+        ctx.watch(id)
+        obj = self.get_entity(id, ctx=ctx)
+        if on_read:
+            on_read()
+        obj.integer += 1
+        self.create_or_update(obj, ctx=ctx)
+
+
+@pytest.fixture
+def dao(fakeredis_pool):
+    return MyDataDao(fakeredis_pool)
+
+
+@pytest.fixture
+def cached_dao(fakeredis_pool):
+    dao = MyDataDao(fakeredis_pool, cache=EntityCache())
+    yield dao
+    dao.close()
+
+
+@pytest.fixture
+def hash_dao(fakeredis_pool):
+    return MyDataDao(fakeredis_pool, storage=StorageMode.HASH)
+
+
+@pytest.fixture(params=[StorageMode.JSON, StorageMode.HASH])
+def indexed_dao(request, fakeredis_pool):
+    return MyDataDao(
+        fakeredis_pool,
+        storage=request.param,
+        indexes=[Index("string"), Index("integer", ordered=True)],
+    )
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_bulk_create_or_update_in_chunks(dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(25)]
+    ids = dao.bulk_create_or_update(objs, chunk_size=10)
+
+    assert ids == [obj.id for obj in objs]
+    assert dao.get_entity(objs[17].id).integer == 17
+    assert len(list(dao.iterate_all())) == 25
+
+
+def test_bulk_create_or_update_generates_missing_ids(dao):
+    ids = dao.bulk_create_or_update(iter([MyData(), MyData()]))
+
+    assert len(set(ids)) == 2
+    assert dao.get_entity(ids[0]) is not None
+
+
+def test_bulk_delete(dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(25)]
+    dao.bulk_create_or_update(objs)
+
+    deleted = dao.bulk_delete([obj.id for obj in objs[:20]] + [uuid4()], chunk_size=7)
+
+    assert deleted == 20
+    assert sorted(obj.integer for obj in dao.iterate_all()) == list(range(20, 25))
+    assert dao.bulk_delete([]) == 0
+
+
+@pytest.fixture
+def executed(monkeypatch):
+    """Number of commands of each pipeline executed"""
+    sizes = []
+    execute = redis.client.Pipeline.execute
+
+    def counting_execute(pipe, *args, **kwargs):
+        sizes.append(len(pipe.command_stack))
+        return execute(pipe, *args, **kwargs)
+
+    monkeypatch.setattr(redis.client.Pipeline, "execute", counting_execute)
+    return sizes
+
+
+@pytest.mark.parametrize("storage, commands", [("json", 1), ("hash", 2)])
+def test_bulk_writes_send_a_pipeline_per_chunk(
+    fakeredis_pool, executed, storage, commands
+):
+    dao = MyDataDao(fakeredis_pool, storage=StorageMode(storage))
+    objs = [MyData(id=uuid4(), integer=i) for i in range(250)]
+
+    dao.bulk_create_or_update(objs, chunk_size=100)
+    # The empty EXEC of the transaction comes last
+    assert executed == [100 * commands, 100 * commands, 50 * commands, 0]
+
+
+def test_bulk_writes_join_an_outer_transaction(dao, executed):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(25)]
+
+    @transactional
+    def save(self, ctx: RedisDaoContext):
+        self.bulk_create_or_update(objs, ctx=ctx, chunk_size=10)
+
+    save(dao)
+    assert executed == [25]
+
+
+def test_get_many_keeps_order_and_gaps(dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(5)]
+    dao.bulk_create_or_update(objs)
+    missing_id = uuid4()
+
+    ids = [objs[3].id, missing_id, objs[0].id, objs[4].id]
+    entities = dao.get_many(ids, chunk_size=2)
+
+    assert [entity.integer if entity else None for entity in entities] == [
+        3,
+        None,
+        0,
+        4,
+    ]
+    assert dao.get_many([]) == []
+    assert dao.get_entity(missing_id) is None
+
+
+@pytest.mark.parametrize("workers", [0, 3])
+def test_iterate_all_streams_scan_pages(dao, workers):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(50)]
+    dao.bulk_create_or_update(objs)
+    # Keys of other types under the prefix are skipped
+    dao._create_context().list_push("some_list", b"item")
+
+    entities = list(dao.iterate_all(count=7, workers=workers))
+
+    assert sorted(entity.integer for entity in entities) == list(range(50))
+    assert len(dao.get_all(count=7, workers=workers)) == 50
+
+
+def test_iterate_all_keys(dao):
+    objs = [MyData(id=uuid4()) for _ in range(10)]
+    dao.bulk_create_or_update(objs)
+
+    assert set(dao.iterate_all_keys()) == {obj.id for obj in objs}
+
+
+def test_nested_calls_commit_together(dao, fakeredis_pool):
+    other_dao = MyDataDao(fakeredis_pool)
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+
+    def check(obj, ctx):
+        # Visible within the transaction, but not outside before it commits
+        assert dao.get_entity(obj.id, ctx=ctx).integer == obj.integer
+        assert other_dao.get_entity(obj.id) is None
+
+    dao.save_all(objs, check=check)
+
+    assert [entity.integer for entity in dao.get_many([obj.id for obj in objs])] == [
+        0,
+        1,
+        2,
+    ]
+
+
+def test_failed_transaction_writes_nothing(dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+
+    def check(obj, ctx):
+        if obj.integer == 2:
+            raise ValueError()
+
+    with pytest.raises(ValueError):
+        dao.save_all(objs, check=check)
+
+    assert dao.get_many([obj.id for obj in objs]) == [None, None, None]
+
+
+def test_watched_transaction_is_retried(dao, fakeredis_pool):
+    obj = MyData(id=uuid4(), integer=0)
+    dao.create_or_update(obj)
+    other_dao = MyDataDao(fakeredis_pool)
+    reads = []
+
+    def on_read():
+        reads.append(True)
+        if len(reads) == 1:
+            other_dao.create_or_update(MyData(id=obj.id, integer=10))
+
+    dao.increment(obj.id, on_read=on_read)
+
+    assert len(reads) == 2
+    assert dao.get_entity(obj.id).integer == 11
+
+
+def test_watch_needs_to_precede_writes(dao):
+    @transactional
+    def write_then_watch(self, ctx: RedisDaoContext):
+        ctx.set("key", b"value")
+        ctx.watch("key")
+
+    with pytest.raises(RuntimeError):
+        write_then_watch(dao)
+
+
+def test_cache_reads_through(cached_dao, dao):
+    obj = MyData(id=uuid4(), integer=1)
+    cached_dao.create_or_update(obj)
+    assert cached_dao.get_entity(obj.id) == obj
+
+    # Written behind the back of the cache
+    dao.create_or_update(MyData(id=obj.id, integer=2))
+
+    assert cached_dao.get_entity(obj.id) == obj
+    assert cached_dao.cache.stats()["hits"] == 1
+
+
+def test_cache_is_invalidated_by_writes(cached_dao):
+    obj = MyData(id=uuid4(), integer=1)
+    cached_dao.create_or_update(obj)
+    cached_dao.get_entity(obj.id)
+
+    cached_dao.create_or_update(MyData(id=obj.id, integer=2))
+    assert cached_dao.get_entity(obj.id).integer == 2
+
+    cached_dao.bulk_create_or_update([MyData(id=obj.id, integer=3)])
+    assert cached_dao.get_entity(obj.id).integer == 3
+
+    cached_dao.delete(obj.id)
+    assert cached_dao.get_entity(obj.id) is None
+
+
+@pytest.mark.parametrize("get", ["get_entity", "get_many"])
+def test_cache_skips_entities_invalidated_while_loading(cached_dao, get):
+    obj = MyData(id=uuid4(), integer=1)
+    cached_dao.create_or_update(obj)
+    decode_name = "_from_dict" if get == "get_entity" else "_load_many"
+    decode = getattr(cached_dao, decode_name)
+
+    def write_after_read(data):
+        # Another writer commits between the read and the cache fill
+        setattr(cached_dao, decode_name, decode)
+        cached_dao.create_or_update(MyData(id=obj.id, integer=2))
+        return decode(data)
+
+    setattr(cached_dao, decode_name, write_after_read)
+    if get == "get_entity":
+        assert cached_dao.get_entity(obj.id).integer == 1
+    else:
+        assert cached_dao.get_many([obj.id])[0].integer == 1
+    assert cached_dao.get_entity(obj.id).integer == 2
+
+
+def test_cached_get_many(cached_dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(5)]
+    cached_dao.bulk_create_or_update(objs)
+    cached_dao.get_many([objs[1].id, objs[3].id])
+
+    missing_id = uuid4()
+    ids = [obj.id for obj in objs] + [missing_id]
+    assert cached_dao.get_many(ids) == objs + [None]
+    assert cached_dao.cache.stats()["hits"] == 2
+
+    cached_dao.bulk_delete(ids)
+    assert cached_dao.get_many(ids) == [None] * 6
+
+
+def test_cache_keeps_uncommitted_writes_out(cached_dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+
+    def check(obj, ctx):
+        cached_dao.get_entity(obj.id, ctx=ctx)
+        if obj.integer == 2:
+            raise ValueError()
+
+    with pytest.raises(ValueError):
+        cached_dao.save_all(objs, check=check)
+
+    assert cached_dao.get_entity(objs[0].id) is None
+    assert len(cached_dao.cache) == 0
+
+
+def test_watched_reads_bypass_cache(cached_dao, dao):
+    obj = MyData(id=uuid4(), integer=0)
+    cached_dao.create_or_update(obj)
+    cached_dao.get_entity(obj.id)
+    dao.create_or_update(MyData(id=obj.id, integer=10))
+
+    cached_dao.increment(obj.id)
+
+    assert cached_dao.get_entity(obj.id).integer == 11
+
+
+def test_cache_invalidations_are_published(cached_dao, fakeredis_pool):
+    obj = MyData(id=uuid4(), integer=1)
+    cached_dao.create_or_update(obj)
+    other_dao = MyDataDao(fakeredis_pool, cache=EntityCache())
+    try:
+        assert other_dao.get_entity(obj.id) == obj
+
+        cached_dao.create_or_update(MyData(id=obj.id, integer=2))
+
+        wait_until(lambda: len(other_dao.cache) == 0)
+        assert other_dao.get_entity(obj.id).integer == 2
+    finally:
+        other_dao.close()
+
+
+def test_cache_stats_are_rendered(cached_dao):
+    obj = MyData(id=uuid4())
+    cached_dao.create_or_update(obj)
+    cached_dao.get_entity(obj.id)
+    cached_dao.get_entity(obj.id)
+    dispatcher = TaskDispatcher(LocalTaskQueue(name="jobs"), None)
+
+    text = render_prometheus(
+        {**dispatcher.stats(), "entity_caches": {"my_data": cached_dao.cache.stats()}}
+    )
+
+    assert 'tq_entity_cache_hits_total{dao="my_data"} 1' in text
+    assert 'tq_entity_cache_hit_ratio{dao="my_data"} 0.5' in text
+
+
+def test_hash_storage(hash_dao, fakeredis_pool):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+    hash_dao.create_or_update(objs[0])
+    hash_dao.bulk_create_or_update(objs[1:])
+
+    db = redis.Redis(connection_pool=fakeredis_pool)
+    assert db.hgetall(f"my_data:{objs[0].id}")[b"integer"] == b"0"
+    assert hash_dao.get_entity(objs[0].id) == objs[0]
+    assert hash_dao.get_many([objs[2].id, uuid4(), objs[1].id]) == [
+        objs[2],
+        None,
+        objs[1],
+    ]
+    assert sorted(hash_dao.iterate_all(), key=lambda obj: obj.integer) == objs
+
+    hash_dao.delete(objs[0].id)
+    assert hash_dao.get_entity(objs[0].id) is None
+
+
+@pytest.mark.parametrize("storage", [StorageMode.JSON, StorageMode.HASH])
+def test_codec(fakeredis_pool, dao, storage):
+    codec_dao = MyDataDao(
+        fakeredis_pool,
+        storage=storage,
+        codec=EntityCodec(MyData),
+        indexes=[Index("integer", ordered=True)],
+    )
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+    codec_dao.create_or_update(objs[0])
+    codec_dao.bulk_create_or_update(objs[1:])
+
+    assert codec_dao.get_entity(objs[0].id) == objs[0]
+    assert codec_dao.get_many([objs[2].id, uuid4(), objs[1].id]) == [
+        objs[2],
+        None,
+        objs[1],
+    ]
+    assert sorted(codec_dao.iterate_all(), key=lambda obj: obj.integer) == objs
+    assert codec_dao.get_fields(objs[1].id, "id", "integer") == {
+        "id": objs[1].id,
+        "integer": 1,
+    }
+    assert list(codec_dao.range_by("integer", min_value=1)) == objs[1:]
+    if storage == StorageMode.JSON:
+        # Entities are stored as the schema would
+        assert dao.get_entity(objs[0].id) == objs[0]
+
+
+def test_update_fields(hash_dao):
+    obj = MyData(id=uuid4(), integer=1, string="before")
+    hash_dao.create_or_update(obj)
+
+    hash_dao.update_fields(obj.id, string="after")
+
+    assert hash_dao.get_entity(obj.id) == MyData(id=obj.id, integer=1, string="after")
+    with pytest.raises(ValueError):
+        hash_dao.update_fields(obj.id, unknown=1)
+
+
+def test_update_fields_needs_hash_storage(dao):
+    obj = MyData(id=uuid4())
+    dao.create_or_update(obj)
+
+    with pytest.raises(ValueError):
+        dao.update_fields(obj.id, integer=1)
+
+
+def test_get_fields(hash_dao, dao):
+    for storage_dao in [hash_dao, dao]:
+        obj = MyData(id=uuid4(), integer=7)
+        storage_dao.create_or_update(obj)
+
+        assert storage_dao.get_fields(obj.id, "id", "integer") == {
+            "id": obj.id,
+            "integer": 7,
+        }
+        assert storage_dao.get_fields(uuid4(), "integer") is None
+
+
+def test_increment_field(hash_dao):
+    obj = MyData(id=uuid4(), integer=1)
+    hash_dao.create_or_update(obj)
+
+    assert hash_dao.increment_field(obj.id, "integer") == 2
+    assert hash_dao.increment_field(obj.id, "integer", amount=-5) == -3
+    assert hash_dao.get_entity(obj.id).integer == -3
+
+
+def test_increments_commit_together(hash_dao):
+    obj = MyData(id=uuid4(), integer=0)
+    hash_dao.create_or_update(obj)
+
+    @transactional
+    def increment_twice(self, ctx: RedisDaoContext):
+        self.increment_field(obj.id, "integer", ctx=ctx)
+        return self.increment_field(obj.id, "integer", ctx=ctx)
+
+    assert increment_twice(hash_dao) == 2
+
+
+def test_cache_is_invalidated_by_field_updates(fakeredis_pool):
+    cached_dao = MyDataDao(
+        fakeredis_pool, cache=EntityCache(), storage=StorageMode.HASH, sync_cache=False
+    )
+    obj = MyData(id=uuid4(), integer=1)
+    cached_dao.create_or_update(obj)
+    cached_dao.get_entity(obj.id)
+
+    cached_dao.increment_field(obj.id, "integer")
+    assert cached_dao.get_fields(obj.id, "integer") == {"integer": 2}
+
+    cached_dao.update_fields(obj.id, integer=5)
+    assert cached_dao.get_entity(obj.id).integer == 5
+
+
+def test_find_by(indexed_dao):
+    objs = [MyData(id=uuid4(), integer=i, string=f"s{i % 3}") for i in range(10)]
+    indexed_dao.bulk_create_or_update(objs[:5])
+    for obj in objs[5:]:
+        indexed_dao.create_or_update(obj)
+
+    found = list(indexed_dao.find_by("string", "s1", count=2))
+
+    assert sorted(obj.integer for obj in found) == [1, 4, 7]
+    assert list(indexed_dao.find_by("string", "missing")) == []
+
+
+def test_range_by(indexed_dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(10)]
+    indexed_dao.bulk_create_or_update(objs)
+
+    found = indexed_dao.range_by("integer", min_value=3, max_value=6, count=2)
+    assert list(found) == objs[3:7]
+    assert list(indexed_dao.range_by("integer", max_value=1)) == objs[:2]
+    assert list(indexed_dao.range_by("integer", min_value=8)) == objs[8:]
+
+
+def test_indexes_follow_writes(indexed_dao):
+    obj = MyData(id=uuid4(), integer=1, string="before")
+    indexed_dao.create_or_update(obj)
+    indexed_dao.create_or_update(MyData(id=obj.id, integer=5, string="after"))
+
+    assert list(indexed_dao.find_by("string", "before")) == []
+    assert [found.id for found in indexed_dao.find_by("string", "after")] == [obj.id]
+    assert list(indexed_dao.range_by("integer", max_value=4)) == []
+
+    indexed_dao.delete(obj.id)
+    assert list(indexed_dao.find_by("string", "after")) == []
+    assert list(indexed_dao.range_by("integer")) == []
+
+
+def test_indexes_follow_field_updates(fakeredis_pool):
+    dao = MyDataDao(
+        fakeredis_pool,
+        storage=StorageMode.HASH,
+        indexes=[Index("string"), Index("integer", ordered=True)],
+    )
+    obj = MyData(id=uuid4(), integer=1, string="before")
+    dao.create_or_update(obj)
+
+    dao.update_fields(obj.id, string="after")
+    dao.increment_field(obj.id, "integer", amount=10)
+
+    assert list(dao.find_by("string", "before")) == []
+    assert [found.integer for found in dao.find_by("string", "after")] == [11]
+    assert [found.id for found in dao.range_by("integer", min_value=11)] == [obj.id]
+
+
+def test_failed_transaction_leaves_indexes(indexed_dao):
+    objs = [MyData(id=uuid4(), integer=i) for i in range(3)]
+
+    def check(obj, ctx):
+        if obj.integer == 2:
+            raise ValueError()
+
+    with pytest.raises(ValueError):
+        indexed_dao.save_all(objs, check=check)
+
+    assert list(indexed_dao.range_by("integer")) == []
+
+
+def test_queries_need_an_index(indexed_dao, fakeredis_pool):
+    with pytest.raises(ValueError):
+        list(indexed_dao.find_by("integer", 1))
+    with pytest.raises(ValueError):
+        MyDataDao(fakeredis_pool, indexes=[Index("unknown")])
+
+
+class ExpiringDao(MyDataDao):
+    default_ttl = 100
+
+
+class BoundedDao(MyDataDao):
+    max_entries = 3
+
+
+def test_purge(fakeredis_pool):
+    dao = MyDataDao(
+        fakeredis_pool, cache=EntityCache(), indexes=[Index("integer", ordered=True)]
+    )
+    objs = [MyData(id=uuid4(), integer=i) for i in range(25)]
+    dao.bulk_create_or_update(objs)
+    dao.get_many([obj.id for obj in objs])
+    db = redis.Redis(connection_pool=fakeredis_pool)
+    db.set("other:key", b"kept")
+
+    # fakeredis does not keep the SCAN guarantees while keys are removed, so a single page
+    assert dao.purge(count=100, chunk_size=3) == 25
+    assert dao.get_many([obj.id for obj in objs]) == [None] * 25
+    assert list(dao.range_by("integer")) == []
+    assert set(db.keys()) == {b"other:key"}
+    assert dao.purge() == 0
+    dao.close()
+
+
+def test_cleanup(dao, list_ctx):
+    dao.create_or_update(MyData(id=uuid4()))
+    list_ctx.list_push("list", "a")
+
+    assert list_ctx.cleanup() == 1
+    assert list_ctx.get_list_length("list") == 0
+    assert dao.get_all() != []
+
+
+@pytest.mark.parametrize("storage", [StorageMode.JSON, StorageMode.HASH])
+def test_default_ttl(fakeredis_pool, storage):
+    dao = ExpiringDao(fakeredis_pool, storage=storage)
+    db = redis.Redis(connection_pool=fakeredis_pool)
+    obj, other = MyData(id=uuid4()), MyData(id=uuid4())
+    dao.create_or_update(obj)
+    dao.bulk_create_or_update([other])
+
+    assert 0 < db.ttl(f"my_data:{obj.id}") <= 100
+    assert 0 < db.ttl(f"my_data:{other.id}") <= 100
+    if storage == StorageMode.HASH:
+        db.persist(f"my_data:{obj.id}")
+        dao.increment_field(obj.id, "integer")
+        assert 0 < db.ttl(f"my_data:{obj.id}") <= 100
+
+
+def test_max_entries(fakeredis_pool):
+    dao = BoundedDao(fakeredis_pool, cache=EntityCache())
+    objs = [MyData(id=uuid4(), integer=i) for i in range(4)]
+    for obj in objs[:3]:
+        dao.create_or_update(obj)
+        time.sleep(0.01)
+    # Rewriting the oldest entity makes the second one the least recently written
+    dao.create_or_update(objs[0])
+    dao.get_many([obj.id for obj in objs])
+
+    dao.create_or_update(objs[3])
+
+    assert dao.get_many([obj.id for obj in objs]) == [objs[0], None, objs[2], objs[3]]
+    dao.delete(objs[0].id)
+    dao.bulk_create_or_update([MyData(id=uuid4()) for _ in range(5)])
+    assert len(dao.get_all()) == 3
+    dao.close()
+
+
+def test_key_layouts(fakeredis_pool):
+    db = redis.Redis(connection_pool=fakeredis_pool)
+    obj = MyData(id=uuid4())
+    for layout, key in [
+        (KeyLayout.PLAIN, f"my_data:{obj.id}"),
+        (KeyLayout.PREFIX, f"{{my_data}}:{obj.id}"),
+        (KeyLayout.ID, f"my_data:{{{obj.id}}}"),
+    ]:
+        layout_dao = MyDataDao(fakeredis_pool, key_layout=layout)
+        layout_dao.create_or_update(obj)
+
+        assert db.exists(key)
+        assert layout_dao.get_entity(obj.id) == obj
+        assert list(layout_dao.iterate_all_keys()) == [obj.id]
+        assert layout_dao.purge() == 1
+
+
+def test_id_layout_keeps_hash_tags(list_ctx):
+    ctx = RedisDaoContext(list_ctx.db, "lists", layout=KeyLayout.ID)
+    ctx.list_push("{queue}:0", "a")
+    ctx.list_push("plain", "b")
+
+    assert set(list_ctx.db.keys()) == {b"lists:{queue}:0", b"lists:{plain}"}
+
+
+@pytest.fixture
+def list_ctx(fakeredis_pool):
+    return RedisDaoContext(redis.Redis(connection_pool=fakeredis_pool), "lists")
+
+
+def test_bulk_remove_from_list_by_id(list_ctx):
+    for item in "abcdef":
+        list_ctx.list_push("list", item)
+    # Pushed to the head, so the list is f e d c b a
+
+    assert list_ctx.bulk_remove_from_list_by_id("list", [0, 2, -1, 2, 10]) == 3
+    assert list_ctx.remove_from_list_by_id("list", 1) == 1
+    assert list(list_ctx.db.lrange("lists:list", 0, -1)) == [b"e", b"b"]
+
+
+def test_list_removals_commit_together(list_ctx, dao):
+    for item in "abc":
+        list_ctx.list_push("list", item)
+
+    @transactional
+    def remove_twice(self, ctx: RedisDaoContext):
+        lists = ctx.table("lists")
+        lists.remove_from_list_by_id("list", 0)
+        return lists.remove_from_list_by_id("list", 0)
+
+    assert remove_twice(dao) == 1
+    assert list(list_ctx.db.lrange("lists:list", 0, -1)) == [b"a"]
+
+
+def test_list_push_unless_claimed(list_ctx):
+    assert list_ctx.list_push_unless_claimed("list", "a", "claim", "first", 10) is None
+    assert (
+        list_ctx.list_push_unless_claimed("list", "b", "claim", "second", 10)
+        == b"first"
+    )
+    assert list_ctx.get_list_length("list") == 1
+
+    assert not list_ctx.delete_if_equals("claim", "second")
+    assert list_ctx.delete_if_equals("claim", "first")
+    assert list_ctx.list_push_unless_claimed("list", "b", "claim", "second", 10) is None
+
+    # Claims of less than a millisecond are kept for one, SET rejects PX 0
+    assert (
+        list_ctx.list_push_unless_claimed("list", "c", "short", "third", 1e-4) is None
+    )
+
+
+def test_list_move_many(list_ctx):
+    for item in "abcde":
+        list_ctx.list_push("source", item)
+        list_ctx.list_push("expected_source", item)
+    list_ctx.list_push("destination", "z")
+    list_ctx.list_push("expected_destination", "z")
+    db = list_ctx.db
+    for _ in range(3):
+        db.rpoplpush("lists:expected_source", "lists:expected_destination")
+
+    assert list_ctx.list_move_many("source", "destination", 3) == [b"a", b"b", b"c"]
+    for name in ["source", "destination"]:
+        assert db.lrange(f"lists:{name}", 0, -1) == db.lrange(
+            f"lists:expected_{name}", 0, -1
+        )
+    assert list_ctx.list_move_many("source", "destination", 0) == []
+    assert list_ctx.list_move_many("source", "destination", 10) == [b"d", b"e"]
+    assert list_ctx.list_move_many("source", "destination", 10) == []
+
+
+def test_blocking_pop_keeps_fractional_timeouts(fakeredis_pool):
+    db = redis.Redis(connection_pool=fakeredis_pool)
+    db.rpush("lists:list", "a", "b")
+    timeouts = []
+    brpop = db.brpop
+
+    def accepting_floats(names, timeout):
+        timeouts.append(timeout)
+        return brpop(names, timeout=1)
+
+    db.brpop = accepting_floats
+    assert RedisDaoContext(db, "lists").list_blocking_pop_last(["list"], 0.2) == (
+        0,
+        b"b",
+    )
+    assert timeouts == [0.2]
+
+    # Like servers older than Redis 6, fakeredis takes whole seconds only
+    db.brpop = brpop
+    assert RedisDaoContext(db, "lists").list_blocking_pop_last(["list"], 0.2) == (
+        0,
+        b"a",
+    )
+    started = time.monotonic()
+    assert RedisDaoContext(db, "lists").list_blocking_pop_last(["list"], 0.2) is None
+    assert time.monotonic() - started >= 1
+
+
+@pytest.mark.parametrize("fetch_bucket_size", [None, 1, 7, 100])
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_iter_all_from_list(list_ctx, fetch_bucket_size, prefetch):
+    items = [str(i).encode() for i in range(250)]
+    for item in items:
+        list_ctx.list_push("list", item)
+
+    oldest_first = list_ctx.iter_all_from_list(
+        "list", fetch_bucket_size, prefetch=prefetch
+    )
+    newest_first = list_ctx.iter_all_from_list(
+        "list", fetch_bucket_size, reverse=True, prefetch=prefetch
+    )
+
+    assert list(oldest_first) == items
+    assert list(newest_first) == items[::-1]
+    assert list(list_ctx.iter_all_from_list("missing", fetch_bucket_size)) == []
+
+
+def test_iter_all_from_list_ignores_pushes(list_ctx):
+    for i in range(20):
+        list_ctx.list_push("list", str(i))
+
+    streamed = []
+    for item in list_ctx.iter_all_from_list("list", fetch_bucket_size=3):
+        # Newer items follow the ones there were when the stream started
+        if item == b"new":
+            break
+        streamed.append(int(item))
+        list_ctx.list_push("list", "new")
+
+    assert streamed == list(range(20))
+
+
+def test_iter_all_entities_from_list(list_ctx):
+    objs = [{"index": i} for i in range(5)]
+    for obj in objs:
+        list_ctx.list_push_entity("list", obj)
+
+    assert list(list_ctx.iter_all_entities_from_list("list", 2)) == objs
+
+
+@pytest.fixture
+def indexed_list_ctx(list_ctx):
+    return RedisDaoContext(list_ctx.db, "lists", indexed_lists=True)
+
+
+def list_members(ctx, name):
+    members = ctx.db.zrange(f"lists:{name}.members", 0, -1, withscores=True)
+    return {member.decode(): int(score) for member, score in members}
+
+
+def test_indexed_lists_follow_writes(indexed_list_ctx, dao):
+    ctx = indexed_list_ctx
+    for item in "abcab":
+        ctx.list_push("list", item)
+    assert list_members(ctx, "list") == {"a": 2, "b": 2, "c": 1}
+
+    assert ctx.list_pop_last("list") == b"a"
+    assert ctx.list_pop("list") == b"b"
+    ctx.list_set("list", 0, "d")
+    assert ctx.bulk_remove_from_list_by_id("list", [-1, -1]) == 1
+    assert list_members(ctx, "list") == {"c": 1, "d": 1}
+
+    ctx.list_push_unless_claimed("list", "e", "claim", "first", 10)
+    assert ctx.list_move_many("list", "other", 2) == [b"c", b"d"]
+    assert list_members(ctx, "list") == {"e": 1}
+    assert list_members(ctx, "other") == {"c": 1, "d": 1}
+    assert ctx.list_blocking_pop_last(["other"], 1) == (0, b"c")
+    assert list_members(ctx, "other") == {"d": 1}
+
+    ctx.list_replace("other", "f", 10)
+    assert list_members(ctx, "other") == {"f": 1}
+    ctx.delete("other")
+    assert ctx.db.keys("lists:other*") == []
+
+    @transactional
+    def push_and_remove(self, ctx: RedisDaoContext):
+        lists = ctx.create_sub_context("lists", indexed_lists=True)
+        lists.list_push("list", to_json({"value": 1}))
+        lists.remove_from_list("list", {"value": 1})
+        lists.remove_from_list("list", {"value": 2})
+
+    push_and_remove(dao)
+    assert list_members(ctx, "list") == {"e": 1}
+
+
+def test_indexed_list_has(indexed_list_ctx):
+    ctx = indexed_list_ctx
+    ctx.list_push("list", "a")
+
+    assert ctx.list_has("list", "a")
+    assert not ctx.list_has("list", "b")
+    assert not ctx.list_has("missing", "a")
+    # Without the item the list is not scanned
+    assert ctx.list_find_all("list", "b") == []
+
+
+def test_bloom_filter_rules_out_missing_keys(fakeredis_pool):
+    before = MyData(id=uuid4())
+    MyDataDao(fakeredis_pool).create_or_update(before)
+    bloom_filter = BloomFilter(capacity=1000)
+    dao = MyDataDao(fakeredis_pool, bloom_filter=bloom_filter)
+    obj = MyData(id=uuid4())
+    dao.create_or_update(obj)
+
+    assert dao.might_exist(obj.id)
+    assert not dao.might_exist(uuid4())
+    # Written before the filter existed, reads find it regardless
+    assert dao.exists(before.id)
+    assert dao.get_many([obj.id, before.id]) == [obj, before]
+    assert dao.rebuild_bloom_filter() == 2
+    assert dao.might_exist(before.id)
+
+    dao.purge()
+    assert not dao.might_exist(obj.id)
+    assert not dao.exists(obj.id)
+
+
+def test_shared_bloom_filter(fakeredis_pool):
+    key = "my_data.bloom"
+    dao = MyDataDao(fakeredis_pool, bloom_filter=BloomFilter(1000, key=key))
+    other_dao = MyDataDao(fakeredis_pool, bloom_filter=BloomFilter(1000, key=key))
+    first, second = MyData(id=uuid4()), MyData(id=uuid4())
+
+    assert not other_dao.might_exist(first.id)
+    dao.save_all([first, second])
+    # Seen by the other process right away, through the bitmap
+    assert other_dao.might_exist(first.id)
+    assert other_dao.exists(first.id)
+    assert other_dao.get_many([first.id, second.id]) == [first, second]
+
+
+def test_bloom_filter_bits_are_published_before_the_write(fakeredis_pool):
+    key = "my_data.bloom"
+    bloom_dao = MyDataDao(fakeredis_pool, bloom_filter=BloomFilter(1000, key=key))
+    other_dao = MyDataDao(fakeredis_pool, bloom_filter=BloomFilter(1000, key=key))
+    obj = MyData(id=uuid4())
+
+    def check(_, ctx):
+        # Not committed yet, but no longer ruled out
+        assert other_dao.might_exist(obj.id)
+
+    bloom_dao.save_all([obj], check=check)
@@ -0,0 +1,93 @@
+import threading
+from dataclasses import dataclass
+from uuid import UUID, uuid4
+
+import fakeredis
+from dataclasses_json import DataClassJsonMixin
+
+from tq.database.entity_cache import EntityCache
+from tq.database.redis_dao import BaseRedisDao
+from tq.database.redis_pool import create_worker_pool
+from tq.metrics import render_prometheus
+from tq.task_dispacher import LocalTaskQueue, TaskDispatcher
+
+
+@dataclass
+class MyData(DataClassJsonMixin):
+    id: UUID = None
+    integer: int = 42
+
+
+class MyDataDao(BaseRedisDao):
+    def __init__(self, db_pool):
+        super().__init__(db_pool, MyData.schema(), key_prefix="my_data")
+
+
+def create_pool(num_of_workers: int = 2, **kwargs):
+    return create_worker_pool(
+        num_of_workers,
+        **kwargs,
+        connection_class=fakeredis.FakeConnection,
+        server=fakeredis.FakeServer(),
+    )
+
+
+def test_client_is_kept_per_thread():
+    dao = MyDataDao(create_pool())
+    clients = []
+
+    def use_dao():
+        dao.create_or_update(MyData(id=uuid4()))
+        clients.append(dao._client())
+        clients.append(dao._client())
+
+    threads = [threading.Thread(target=use_dao) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert clients[0] is clients[1]
+    assert clients[2] is clients[3]
+    assert clients[0] is not clients[2]
+
+
+def test_daos_share_the_thread_client():
+    pool = create_pool(1, spare_connections=0, synced_caches=1, timeout=1)
+    daos = [MyDataDao(pool) for _ in range(3)]
+    cached_dao = BaseRedisDao(
+        pool, MyData.schema(), key_prefix="my_data", cache=EntityCache()
+    )
+
+    for dao in daos + [cached_dao]:
+        entity_id = dao.create_or_update(MyData(id=uuid4()))
+        assert dao.get_entity(entity_id) is not None
+    cached_dao.close()
+
+    assert len({id(dao._client()) for dao in daos + [cached_dao]}) == 1
+    # The thread's own connection, the one of transactions and the subscription
+    assert pool.stats()["created"] == 3
+
+
+def test_pool_is_reused_across_calls():
+    pool = create_pool()
+    dao = MyDataDao(pool)
+    ids = [dao.create_or_update(MyData(id=uuid4())) for _ in range(20)]
+    assert all(dao.get_entity(id) is not None for id in ids)
+
+    stats = pool.stats()
+    # The thread's own connection, and the one taken by transactions
+    assert stats["created"] == 2
+    assert stats["in_use"] == 1
+    assert stats["wait_time"]["count"] == stats["checkouts"]
+
+
+def test_pool_stats_are_rendered():
+    pool = create_pool()
+    MyDataDao(pool).create_or_update(MyData(id=uuid4()))
+    dispatcher = TaskDispatcher(LocalTaskQueue(name="jobs"), None)
+
+    text = render_prometheus({**dispatcher.stats(), "redis_pool": pool.stats()})
+
+    assert "tq_redis_pool_connections_created_total 2" in text
+    assert 'tq_redis_pool_wait_seconds_bucket{le="+Inf"}' in text
@@ -0,0 +1,81 @@
+import multiprocessing
+from dataclasses import dataclass
+
+import pytest
+
+from tq.shm_task_queue import SharedMemoryTaskQueue
+from tq.task_dispacher import Task, TaskDispatcher
+
+
+@dataclass
+class DummyTask(Task):
+    value: int = 0
+
+
+@dataclass
+class BlobTask(Task):
+    blob: bytes = b""
+
+
+@pytest.fixture
+def shm_queue():
+    task_queue = SharedMemoryTaskQueue(capacity=8)
+    yield task_queue
+    task_queue.unlink()
+
+
+def produce(task_queue, first, count):
+    dispatcher = TaskDispatcher(task_queue, None)
+    for value in range(first, first + count):
+        dispatcher.post_task(DummyTask(value=value))
+    task_queue.close()
+
+
+def test_tasks_are_shared_between_processes(shm_queue):
+    # More tasks than slots, producers block until the consumer catches up
+    producers = [
+        multiprocessing.Process(target=produce, args=(shm_queue, first, 20))
+        for first in (0, 100)
+    ]
+    for producer in producers:
+        producer.start()
+
+    values = []
+    for _ in range(40):
+        with shm_queue.fetch_task(timeout=5) as task:
+            values.append(task.value)
+
+    for producer in producers:
+        producer.join(5)
+        assert producer.exitcode == 0
+
+    assert sorted(values) == list(range(20)) + list(range(100, 120))
+    assert [value for value in values if value < 100] == list(range(20))
+    assert shm_queue.depth() == 0
+
+
+def post_duplicate(task_queue, results):
+    dispatcher = TaskDispatcher(task_queue, None)
+    results.put(dispatcher.post_task(DummyTask(value=2), dedup_key="same"))
+    task_queue.close()
+
+
+def test_duplicates_are_dropped_across_processes(shm_queue):
+    dispatcher = TaskDispatcher(shm_queue, None)
+    task_id = dispatcher.post_task(DummyTask(value=1), dedup_key="same")
+
+    results = multiprocessing.Queue()
+    producer = multiprocessing.Process(target=post_duplicate, args=(shm_queue, results))
+    producer.start()
+    assert results.get(timeout=5) == task_id
+    producer.join(5)
+
+    with shm_queue.fetch_task(timeout=0) as task:
+        assert task.value == 1
+    assert shm_queue.depth() == 0
+
+
+def test_rejects_task_larger_than_slot(shm_queue):
+    with pytest.raises(ValueError):
+        shm_queue.put(BlobTask(blob=b"x" * shm_queue.slot_size))
+    assert shm_queue.depth() == 0
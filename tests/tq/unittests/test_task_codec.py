@@ -0,0 +1,59 @@
+from dataclasses import dataclass, field
+
+import pytest
+
+from tq import task_codec
+from tq.task_dispacher import Task
+
+LARGE = task_codec.OUT_OF_BAND_THRESHOLD
+
+
+@dataclass
+class PayloadTask(Task):
+    data: bytes = b""
+    buffer: bytearray = field(default_factory=bytearray)
+    meta: dict = field(default_factory=dict)
+
+
+def test_round_trip():
+    task = PayloadTask(
+        data=b"x" * LARGE, buffer=bytearray(b"y" * LARGE), meta={"small": b"z"}
+    )
+    result = task_codec.loads(task_codec.dumps(task))
+
+    assert result == task
+    assert isinstance(result.data, bytes)
+    assert isinstance(result.buffer, bytearray)
+
+
+def test_large_buffers_are_out_of_band():
+    task = PayloadTask(
+        data=b"x" * LARGE, buffer=bytearray(b"y" * LARGE), meta={"small": b"z" * 16}
+    )
+    frames = task_codec.encode_frames(task)
+
+    assert len(frames) == 3
+    assert len(frames[0]) < LARGE
+
+
+def test_memoryview_is_not_copied():
+    frames = task_codec.encode_frames({"view": memoryview(b"x" * LARGE)})
+    received = [bytearray(frame) for frame in frames]
+    result = task_codec.decode_frames(received)
+
+    received[1][0] = ord("y")
+    assert result["view"][0] == ord("y")
+
+
+def test_shared_buffers_are_sent_once():
+    data = b"x" * LARGE
+    frames = task_codec.encode_frames([data, data])
+    result = task_codec.decode_frames(frames)
+
+    assert len(frames) == 2
+    assert result[0] is result[1]
+
+
+def test_rejects_foreign_data():
+    with pytest.raises(ValueError):
+        task_codec.loads(b"not a task message")
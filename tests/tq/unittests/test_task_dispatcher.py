@@ -1,10 +1,22 @@
+from contextlib import ExitStack
 from dataclasses import dataclass
 
 from unittest.mock import Mock
 
+import pytest
 import waiting
 
-from tq.task_dispacher import Task, TaskDispatcher, task_handler
+from tq.job_system import JobManager
+from tq.redis_task_queue import RedisTaskQueue, RedisTaskResultStore
+from tq.task_dispacher import (
+    LocalTaskQueue,
+    LocalTaskResultStore,
+    OverflowPolicy,
+    Task,
+    TaskDispatcher,
+    TaskResult,
+    task_handler,
+)
 
 import logging
 
@@ -72,3 +84,138 @@ def test_task_dipatcher_dispatches_task(task_dispatcher: TaskDispatcher):
         sleep_seconds=0.1,
         timeout_seconds=3,
     )
+
+
+class ResultTaskHandler:
+    @task_handler(DummyTaskOne)
+    def task_one(self, task: DummyTaskOne, *a, **w):
+        return TaskResult(task=task)
+
+
+def test_post_task_returns_future_resolved_by_result():
+    with ExitStack() as stack:
+        job_manager = stack.enter_context(JobManager(num_of_workers=2))
+        dispatcher = stack.enter_context(
+            TaskDispatcher(LocalTaskQueue(poll_timeout=0.1), job_manager)
+        )
+        dispatcher.register_task_handler(ResultTaskHandler())
+
+        future = dispatcher.post_task(DummyTaskOne(), with_future=True)
+        result = future.result(timeout=3)
+
+        assert isinstance(result, TaskResult)
+        assert result.task_id == future.task_id
+
+
+def test_future_follows_pending_duplicate():
+    dispatcher = TaskDispatcher(LocalTaskQueue(), None)
+    first = dispatcher.post_task(DummyTaskOne(), dedup_key="key", with_future=True)
+    second = dispatcher.post_task(DummyTaskTwo(), dedup_key="key", with_future=True)
+
+    assert first is second
+    assert not first.done()
+
+
+def test_results_go_to_result_store():
+    with ExitStack() as stack:
+        job_manager = stack.enter_context(JobManager(num_of_workers=2))
+        task_queue = LocalTaskQueue(poll_timeout=0.1)
+        dispatcher = stack.enter_context(
+            TaskDispatcher(task_queue, job_manager, LocalTaskResultStore())
+        )
+        dispatcher.register_task_handler(ResultTaskHandler())
+
+        future = dispatcher.post_task(DummyTaskOne(), with_future=True)
+
+        assert future.result(timeout=3).task_id == future.task_id
+        assert dispatcher.get_result(future.task_id).task_id == future.task_id
+        assert task_queue.depth() == 0
+
+
+def test_results_do_not_block_on_full_queue():
+    with ExitStack() as stack:
+        job_manager = stack.enter_context(JobManager(num_of_workers=2))
+        task_queue = LocalTaskQueue(capacity=4, poll_timeout=0.1)
+        dispatcher = stack.enter_context(TaskDispatcher(task_queue, job_manager))
+        dispatcher.register_task_handler(ResultTaskHandler())
+
+        # The producer keeps the queue full, so results have no room
+        futures = [
+            dispatcher.post_task(
+                DummyTaskOne(),
+                overflow=OverflowPolicy.TIMEOUT,
+                timeout=3,
+                with_future=True,
+            )
+            for _ in range(12)
+        ]
+
+        for future in futures:
+            assert future.result(timeout=3).task_id == future.task_id
+        waiting.wait(lambda: task_queue.depth() == 0, timeout_seconds=3)
+        dispatcher.terminate()
+
+
+@dataclass
+class FanOutTask(Task):
+    remaining: int = 0
+
+
+class FanOutTaskHandler:
+    def __init__(self) -> None:
+        self.handled = 0
+
+    @task_handler(FanOutTask)
+    def fan_out(self, task: FanOutTask, dispatcher: TaskDispatcher, **kwargs):
+        self.handled += 1
+        for _ in range(2 if task.remaining else 0):
+            dispatcher.post_task(
+                FanOutTask(remaining=task.remaining - 1),
+                overflow=OverflowPolicy.BLOCK,
+            )
+
+
+def test_handler_posts_do_not_block_on_full_queue():
+    with ExitStack() as stack:
+        job_manager = stack.enter_context(JobManager(num_of_workers=2))
+        task_queue = LocalTaskQueue(capacity=1, poll_timeout=0.1)
+        dispatcher = stack.enter_context(TaskDispatcher(task_queue, job_manager))
+        handler = FanOutTaskHandler()
+        dispatcher.register_task_handler(handler)
+
+        dispatcher.post_task(FanOutTask(remaining=3))
+
+        waiting.wait(lambda: handler.handled == 15, timeout_seconds=5)
+        assert task_queue.depth() == 0
+        dispatcher.terminate()
+
+
+def test_futures_resolve_from_shared_result_store(fakeredis_pool):
+    producer = TaskDispatcher(
+        RedisTaskQueue(fakeredis_pool, name="shared"),
+        None,
+        RedisTaskResultStore(fakeredis_pool),
+    )
+    future = producer.post_task(DummyTaskOne(), with_future=True)
+
+    with ExitStack() as stack:
+        job_manager = stack.enter_context(JobManager(num_of_workers=2))
+        # Stands in for the dispatcher of another process
+        consumer = stack.enter_context(
+            TaskDispatcher(
+                RedisTaskQueue(fakeredis_pool, name="shared", poll_timeout=0.1),
+                job_manager,
+                RedisTaskResultStore(fakeredis_pool),
+            )
+        )
+        consumer.register_task_handler(ResultTaskHandler())
+
+        assert future.result(timeout=3).task_id == future.task_id
+        consumer.terminate()
+
+
+def test_futures_of_shared_queue_need_shared_result_store(fakeredis_pool):
+    for result_store in (None, LocalTaskResultStore()):
+        dispatcher = TaskDispatcher(RedisTaskQueue(fakeredis_pool), None, result_store)
+        with pytest.raises(ValueError):
+            dispatcher.post_task(DummyTaskOne(), with_future=True)
@@ -0,0 +1,368 @@
+import logging
+import queue
+import threading
+from dataclasses import dataclass
+from uuid import uuid4
+
+import pytest
+
+from tq.database.local_fs_dao import LocalFsDao
+from tq.redis_task_queue import RedisTaskQueue
+from tq.shm_task_queue import SharedMemoryTaskQueue
+from tq.task_dispacher import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    DedupIndex,
+    LocalTaskQueue,
+    OverflowPolicy,
+    Task,
+    TaskDispatcher,
+    TaskQueueGroup,
+    WeightedScheduler,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class DummyTask(Task):
+    value: int = 0
+
+
+@dataclass
+class UrgentTask(Task):
+    _priority = PRIORITY_HIGH
+
+
+def drain(task_queue, count):
+    tasks = []
+    for _ in range(count):
+        with task_queue.fetch_task(timeout=0) as task:
+            tasks.append(task)
+    return tasks
+
+
+@pytest.fixture(params=["local", "redis", "shm"])
+def task_queue(request, fakeredis_pool):
+    if request.param == "local":
+        yield LocalTaskQueue()
+    elif request.param == "redis":
+        yield RedisTaskQueue(fakeredis_pool)
+    else:
+        task_queue = SharedMemoryTaskQueue()
+        yield task_queue
+        task_queue.unlink()
+
+
+def test_weighted_scheduler_round():
+    scheduler = WeightedScheduler([2, 1])
+    served = []
+    for _ in range(6):
+        lane = scheduler.order()[0]
+        scheduler.charge(lane)
+        served.append(lane)
+
+    assert served == [0, 0, 1, 0, 0, 1]
+
+
+def test_weighted_scheduler_starts_new_round_when_lanes_are_empty():
+    scheduler = WeightedScheduler([2, 1])
+    scheduler.charge(1)
+    # Only lane 1 has items, it gets served without credit
+    scheduler.charge(1)
+    assert scheduler.order() == [0, 1]
+
+
+def test_weighted_scheduler_rejects_invalid_weights():
+    with pytest.raises(ValueError):
+        WeightedScheduler([1, 0])
+
+
+def test_task_priority_from_class_and_instance():
+    assert DummyTask().priority == PRIORITY_NORMAL
+    assert UrgentTask().priority == PRIORITY_HIGH
+
+    task = DummyTask()
+    setattr(task, "_priority", PRIORITY_LOW)
+    assert task.priority == PRIORITY_LOW
+    assert LocalTaskQueue(lane_weights=[1]).lane_of(task) == 0
+
+
+def test_queue_serves_lanes_in_priority_order(task_queue):
+    dispatcher = TaskDispatcher(task_queue, None)
+    dispatcher.post_task(DummyTask(value=1), priority=PRIORITY_LOW)
+    dispatcher.post_task(DummyTask(value=2))
+    dispatcher.post_task(UrgentTask())
+
+    tasks = drain(task_queue, 4)
+
+    assert isinstance(tasks[0], UrgentTask)
+    assert tasks[1].value == 2
+    assert tasks[2].value == 1
+    assert tasks[3] is None
+
+
+def test_queue_does_not_starve_low_priority_lane(task_queue):
+    for value in range(10):
+        task_queue.put(DummyTask(value=value), PRIORITY_HIGH)
+    task_queue.put(DummyTask(value=-1), PRIORITY_LOW)
+
+    tasks = drain(task_queue, 11)
+
+    assert [task.value for task in tasks].index(-1) < 10
+
+
+def test_queue_keeps_fifo_order_within_lane(task_queue):
+    for value in range(5):
+        task_queue.put(DummyTask(value=value))
+
+    assert [task.value for task in drain(task_queue, 5)] == list(range(5))
+
+
+def test_redis_queue_blocking_fetch_times_out(fakeredis_pool):
+    task_queue = RedisTaskQueue(fakeredis_pool)
+    with task_queue.fetch_task(timeout=0.1) as task:
+        assert task is None
+
+    task_queue.put(DummyTask(value=42))
+    with task_queue.fetch_task(timeout=0.1) as task:
+        assert task.value == 42
+
+
+def test_named_redis_queue_is_shared_between_instances(fakeredis_pool):
+    producer = RedisTaskQueue(fakeredis_pool, name="shared")
+    consumer = RedisTaskQueue(fakeredis_pool, name="shared")
+    other = RedisTaskQueue(fakeredis_pool, name="other")
+
+    producer.put(DummyTask(value=7))
+
+    assert drain(other, 1) == [None]
+    assert drain(consumer, 1)[0].value == 7
+
+
+def test_queue_group_routes_by_queue_name():
+    queues = [LocalTaskQueue(name="a"), LocalTaskQueue(name="b")]
+    group = TaskQueueGroup(queues)
+    dispatcher = TaskDispatcher(group, None)
+
+    dispatcher.post_task(DummyTask(value=1), queue_name="b")
+    dispatcher.post_task(DummyTask(value=2))
+
+    assert drain(queues[0], 1)[0].value == 2
+    assert drain(queues[1], 1)[0].value == 1
+
+    with pytest.raises(KeyError):
+        dispatcher.post_task(DummyTask(), queue_name="c")
+
+
+def test_queue_group_weighted_round_robin():
+    queues = [LocalTaskQueue(name="flood"), LocalTaskQueue(name="tenant")]
+    group = TaskQueueGroup(queues, weights=[2, 1])
+
+    for value in range(20):
+        queues[0].put(DummyTask(value=100 + value))
+    for value in range(3):
+        queues[1].put(DummyTask(value=value))
+
+    served = ["flood" if task.value >= 100 else "tenant" for task in drain(group, 6)]
+
+    assert served == ["flood", "flood", "tenant"] * 2
+
+
+def test_queue_group_deficit_round_robin_charges_task_cost():
+    queues = [LocalTaskQueue(name="heavy"), LocalTaskQueue(name="light")]
+    group = TaskQueueGroup(queues, task_cost=lambda task: task.value)
+
+    for _ in range(3):
+        queues[0].put(DummyTask(value=4))
+    for _ in range(8):
+        queues[1].put(DummyTask(value=1))
+
+    served = [task.value for task in drain(group, 8)]
+
+    # One heavy task costs as much as four light ones
+    assert served.count(4) == 2
+    assert served.count(1) == 6
+
+
+def test_queue_group_times_out_when_empty():
+    group = TaskQueueGroup([LocalTaskQueue(), LocalTaskQueue()], poll_timeout=0.1)
+    with group.fetch_task() as task:
+        assert task is None
+
+
+def test_queue_drops_pending_duplicates(task_queue):
+    dispatcher = TaskDispatcher(task_queue, None)
+    first_id = dispatcher.post_task(DummyTask(value=1), dedup_key="same")
+    second_id = dispatcher.post_task(DummyTask(value=2), dedup_key="same")
+    other_id = dispatcher.post_task(DummyTask(value=3), dedup_key="other")
+
+    assert second_id == first_id
+    assert other_id != first_id
+    assert task_queue.dedup_stats == {"hits": 1, "misses": 2}
+
+    with task_queue.fetch_task(timeout=0) as task:
+        assert task.value == 1
+        # Still in flight
+        assert dispatcher.post_task(DummyTask(), dedup_key="same") == first_id
+
+    # Released once acknowledged
+    assert dispatcher.post_task(DummyTask(), dedup_key="same") != first_id
+    assert [task.value for task in drain(task_queue, 2)] == [3, 0]
+
+
+def test_dedup_index_expires_and_evicts():
+    index = DedupIndex(ttl=0, capacity=2)
+    first_id, second_id = uuid4(), uuid4()
+    assert index.claim("a", first_id) is None
+    assert index.claim("a", second_id) is None
+
+    index = DedupIndex(capacity=2)
+    for key in "abc":
+        index.claim(key, first_id)
+    assert len(index) == 2
+    assert index.claim("a", second_id) is None
+    assert index.claim("c", second_id) == first_id
+
+    index.release("c", second_id)
+    assert index.claim("c", second_id) == first_id
+
+
+@pytest.fixture(params=["local", "redis", "shm"])
+def bounded_queue_factory(request, fakeredis_pool):
+    shm_queues = []
+
+    def _create(**kwargs):
+        if request.param == "local":
+            return LocalTaskQueue(capacity=4, **kwargs)
+        if request.param == "redis":
+            return RedisTaskQueue(fakeredis_pool, capacity=4, **kwargs)
+        shm_queues.append(SharedMemoryTaskQueue(capacity=4, **kwargs))
+        return shm_queues[-1]
+
+    yield _create
+    for task_queue in shm_queues:
+        task_queue.unlink()
+
+
+def test_bounded_queue_rejects_when_full(bounded_queue_factory):
+    task_queue = bounded_queue_factory(overflow_policy=OverflowPolicy.REJECT)
+    assert task_queue.high_water_mark == 3
+
+    for value in range(2):
+        task_queue.put(DummyTask(value=value))
+    assert not task_queue.is_under_pressure
+
+    for value in range(2, 4):
+        task_queue.put(DummyTask(value=value))
+    assert task_queue.is_under_pressure
+    assert task_queue.pressure == pytest.approx(4 / 3)
+
+    with pytest.raises(queue.Full):
+        task_queue.put(DummyTask(value=4))
+    assert task_queue.depth() == 4
+
+
+def test_bounded_queue_times_out_when_full(bounded_queue_factory):
+    task_queue = bounded_queue_factory()
+    for value in range(4):
+        task_queue.put(DummyTask(value=value))
+
+    with pytest.raises(queue.Full):
+        task_queue.put(DummyTask(), overflow=OverflowPolicy.TIMEOUT, timeout=0.1)
+
+
+def test_bounded_queue_sheds_oldest_of_least_urgent_lane(bounded_queue_factory):
+    task_queue = bounded_queue_factory(overflow_policy=OverflowPolicy.SHED_OLDEST)
+    task_queue.put(DummyTask(value=0), PRIORITY_HIGH)
+    for value in range(1, 4):
+        task_queue.put(DummyTask(value=value), PRIORITY_LOW)
+
+    task_queue.put(DummyTask(value=4), PRIORITY_LOW)
+
+    assert task_queue.depth() == 4
+    assert [task.value for task in drain(task_queue, 4)] == [0, 2, 3, 4]
+
+
+def test_bounded_queue_blocks_until_room(bounded_queue_factory):
+    task_queue = bounded_queue_factory()
+    for value in range(4):
+        task_queue.put(DummyTask(value=value))
+
+    producer = threading.Thread(target=task_queue.put, args=(DummyTask(value=4),))
+    producer.start()
+    producer.join(0.2)
+    assert producer.is_alive()
+
+    assert drain(task_queue, 1)[0].value == 0
+    producer.join(5)
+    assert not producer.is_alive()
+    assert task_queue.depth() == 4
+
+
+def test_rejected_task_releases_dedup_key():
+    task_queue = LocalTaskQueue(capacity=1, overflow_policy=OverflowPolicy.REJECT)
+    dispatcher = TaskDispatcher(task_queue, None)
+    dispatcher.post_task(DummyTask())
+
+    with pytest.raises(queue.Full):
+        dispatcher.post_task(DummyTask(), dedup_key="key")
+
+    drain(task_queue, 1)
+    dispatcher.post_task(DummyTask(value=1), dedup_key="key")
+    assert drain(task_queue, 1)[0].value == 1
+
+
+@dataclass
+class BlobTask(Task):
+    blob: bytes = b""
+
+
+def test_redis_queue_offloads_large_payloads(fakeredis_pool, tmp_path):
+    payload_store = LocalFsDao(tmp_path)
+    task_queue = RedisTaskQueue(
+        fakeredis_pool, payload_store=payload_store, payload_threshold=1024
+    )
+    dispatcher = TaskDispatcher(task_queue, None)
+
+    blob = bytes(range(256)) * 64
+    dispatcher.post_task(BlobTask(blob=blob))
+    dispatcher.post_task(BlobTask(blob=b"small"))
+
+    assert len(list(payload_store.iterate_filenames())) == 1
+
+    with task_queue.fetch_task(timeout=0) as task:
+        assert task.blob == blob
+        assert len(list(payload_store.iterate_filenames())) == 1
+
+    # Collected once acknowledged
+    assert list(payload_store.iterate_filenames()) == []
+    assert drain(task_queue, 1)[0].blob == b"small"
+
+
+def test_redis_queue_discards_payload_of_duplicates(fakeredis_pool, tmp_path):
+    payload_store = LocalFsDao(tmp_path)
+    task_queue = RedisTaskQueue(
+        fakeredis_pool, payload_store=payload_store, payload_threshold=0
+    )
+    dispatcher = TaskDispatcher(task_queue, None)
+
+    dispatcher.post_task(BlobTask(blob=b"first"), dedup_key="key")
+    dispatcher.post_task(BlobTask(blob=b"second"), dedup_key="key")
+
+    assert len(list(payload_store.iterate_filenames())) == 1
+
+
+def test_redis_queue_needs_payload_store_for_claim_checks(fakeredis_pool, tmp_path):
+    producer = RedisTaskQueue(
+        fakeredis_pool,
+        name="blobs",
+        payload_store=LocalFsDao(tmp_path),
+        payload_threshold=0,
+    )
+    TaskDispatcher(producer, None).post_task(BlobTask(blob=b"blob"))
+
+    with pytest.raises(ValueError, match="blobs"):
+        with RedisTaskQueue(fakeredis_pool, name="blobs").fetch_task(timeout=0):
+            pass
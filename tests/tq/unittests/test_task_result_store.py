@@ -0,0 +1,81 @@
+import threading
+import time
+from dataclasses import dataclass
+from uuid import uuid4
+
+import pytest
+
+from tq.redis_task_queue import RedisTaskResultStore
+from tq.task_dispacher import LocalTaskResultStore, Task, TaskResult
+
+
+@dataclass
+class DummyTask(Task):
+    value: int = 0
+
+
+def create_result(value: int = 0) -> TaskResult:
+    task = DummyTask(value=value)
+    setattr(task, "_task_id", uuid4())
+    return TaskResult(task=task)
+
+
+@pytest.fixture(params=["local", "redis"])
+def result_store(request, fakeredis_pool):
+    if request.param == "local":
+        return LocalTaskResultStore()
+    return RedisTaskResultStore(fakeredis_pool)
+
+
+def test_store_and_get(result_store):
+    result = create_result(42)
+    result_store.store(result)
+
+    stored = result_store.get(result.task_id)
+    assert stored.task_id == result.task_id
+    assert stored.task.value == 42
+    # Reading does not consume the result
+    assert result_store.get(result.task_id) is not None
+
+
+def test_get_missing_result(result_store):
+    assert result_store.get(uuid4()) is None
+
+
+def test_failed_result_is_kept(result_store):
+    result = create_result().failed("reason")
+    result_store.store(result)
+
+    stored = result_store.get(result.task_id)
+    assert stored.is_failed
+    assert stored.failure_reason == "reason"
+
+
+def test_long_poll_waits_for_result(result_store):
+    result = create_result(7)
+    storer = threading.Timer(0.2, result_store.store, args=(result,))
+    storer.start()
+
+    stored = result_store.get(result.task_id, timeout=3)
+    storer.join()
+
+    assert stored is not None
+    assert stored.task.value == 7
+
+
+def test_local_result_expires():
+    result_store = LocalTaskResultStore(ttl=0.1)
+    result = create_result()
+    result_store.store(result)
+    time.sleep(0.2)
+
+    assert result_store.get(result.task_id) is None
+
+
+def test_get_many(result_store):
+    results = [create_result(value) for value in range(3)]
+    for result in results:
+        result_store.store(result)
+
+    stored = result_store.get_many([results[2].task_id, uuid4(), results[0].task_id])
+    assert [result.task.value if result else None for result in stored] == [2, None, 0]
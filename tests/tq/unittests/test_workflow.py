@@ -151,3 +151,24 @@ def test_workflow_fails():
 # TODO: Add timeout
 
 # TODO: Add queries
+
+
+def test_late_results_skip_reposted_steps():
+    workflow_manager: WorkflowManager = WorkflowManager()
+    step = MokcedFlowStep("step1")
+    workflow = workflow_manager.create().then_do(step).workflow
+
+    workflow.poll()
+    late_result = step.dummy_result
+    step.timeout()
+    workflow_manager.reset_steps_with_timeout()
+    workflow.poll()
+    assert step.is_pending and step.task_id != late_result.task_id
+
+    workflow_manager.handle_task_result(late_result)
+    workflow.poll()
+    assert step.is_pending
+
+    workflow_manager.handle_task_result(step.dummy_result)
+    workflow.poll()
+    assert step.is_done